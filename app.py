@@ -6,18 +6,36 @@ import time
 import json
 import os
 import uuid
-from cryptography.fernet import Fernet
+import wire_format
+from frame_batcher import FrameBatcher, max_plaintext
+from transport_crypto import Transport
 
 FERNET_KEY = os.environ.get("FERNET_KEY") or b'HyMs5PCyDY5oWoEKZs98gwwU7ZKxSBrqifkQHVCHn-s='
-cipher = Fernet(FERNET_KEY)
+
+# "fernet" (default, compatible) or an AEAD mode: "aesgcm" / "chacha20" (see transport_crypto.py)
+CRYPTO_MODE = os.environ.get("AIRLOCK_CRYPTO", "fernet")
+DRONE_ID = os.environ.get("AIRLOCK_DRONE_ID", "drone-1")   # selects the per-drone session key
+transport = Transport(CRYPTO_MODE, DRONE_ID, FERNET_KEY)
 
 UDP_TARGET = ('localhost', 9998)
+# "binary": compact v1 records (JSON fallback for payloads the format cannot carry)
+WIRE_FORMAT = os.environ.get("AIRLOCK_WIRE", "binary")
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
+# Aggregation: pack readings into one encrypted frame until the datagram
+# would exceed AIRLOCK_MAX_DATAGRAM or the oldest reading has waited FRAME_MAX_DELAY.
+# FRAME_MAX_DELAY=0 sends every reading in its own datagram (the default).
+SEND_INTERVAL = float(os.environ.get("AIRLOCK_SEND_INTERVAL", "2"))       # seconds between readings
+FRAME_MAX_DELAY = float(os.environ.get("AIRLOCK_FRAME_MAX_DELAY", "0"))   # seconds
+def send_plaintext(plaintext):
+    encrypted = transport.seal(plaintext)
+    sock.sendto(encrypted, UDP_TARGET)
+
 def get_telemetry():
     now = int(time.time())
     data = {
         "msg_id": uuid.uuid4().hex,   # unique per message
+        "drone_id": DRONE_ID,
         "ts": time.time(),            # epoch seconds (float)
         "altitude": 120 + (now % 10),
         "speed": 42 + (now % 5),
@@ -27,10 +45,21 @@ def get_telemetry():
     return data
 
 if __name__ == "__main__":
-    while True:
-        payload = get_telemetry()
-        plaintext = json.dumps(payload)
-        encrypted = cipher.encrypt(plaintext.encode())
-        sock.sendto(encrypted, UDP_TARGET)
-        print("Sent encrypted telemetry:", plaintext)
-        time.sleep(2)
+    batcher = FrameBatcher(send_plaintext, max_plaintext(transport), FRAME_MAX_DELAY)
+    next_reading = time.monotonic()
+    try:
+        while True:
+            now = time.monotonic()
+            if now >= next_reading:
+                payload = get_telemetry()
+                batcher.add(wire_format.encode(payload, WIRE_FORMAT))
+                print("Queued telemetry:" if batcher.records else "Sent encrypted telemetry:", json.dumps(payload))
+                next_reading += SEND_INTERVAL
+            due = batcher.poll()
+            wait = next_reading - time.monotonic()
+            if due is not None:
+                wait = min(wait, due)
+            if wait > 0:
+                time.sleep(wait)
+    finally:
+        batcher.flush()
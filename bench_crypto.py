@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# bench_crypto.py — per-packet cost and size of the transport crypto modes
+#
+# Seals and opens one telemetry reading (binary v1 record and JSON) in every
+# mode of transport_crypto.Transport and prints ops/s and datagram bytes.
+#
+# Usage: python bench_crypto.py [iterations]
+
+import json
+import sys
+import time
+
+import wire_format
+from app import get_telemetry
+from transport_crypto import MODES, Transport
+
+
+def bench(fn, arg, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn(arg)
+    return iterations / (time.perf_counter() - started)
+
+
+def main(iterations=20000):
+    reading = get_telemetry()
+    payloads = {"binary": wire_format.encode(reading), "json": json.dumps(reading).encode()}
+    receiver = Transport()
+    print(f"{'mode':<10} {'payload':<8} {'plain B':>8} {'sealed B':>9} {'seal/s':>10} {'open/s':>10} {'us/pkt':>8}")
+    for mode in MODES:
+        sender = Transport(mode)
+        for name, plain in payloads.items():
+            sealed = sender.seal(plain)
+            assert receiver.open(sealed) == plain
+            seal_rate = bench(sender.seal, plain, iterations)
+            open_rate = bench(receiver.open, sealed, iterations)
+            per_pkt = 1e6 / seal_rate + 1e6 / open_rate
+            print(f"{mode:<10} {name:<8} {len(plain):>8} {len(sealed):>9} "
+                  f"{seal_rate:>10.0f} {open_rate:>10.0f} {per_pkt:>8.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
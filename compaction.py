@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# compaction.py — retention policy + incremental-vacuum compaction for airlock.db
+#
+# Data ages through three tiers:
+#   raw telemetry rows         kept RAW_DAYS
+#   telemetry_rollup_1s        kept ROLLUP_1S_DAYS (downsampled series)
+#   telemetry_path_1s          kept ROLLUP_1S_DAYS (per-drone map paths)
+#   telemetry_rollup_1m        kept ROLLUP_1M_DAYS (/stats), then dropped
+# The rollups are filled by insert triggers (see schema.py), so deleting raw
+# rows leaves their aggregates in place. 0 days keeps a tier forever, and
+# every tier defaults to 0: nothing is deleted unless retention is configured
+# with AIRLOCK_RETAIN_*_DAYS or the command-line options.
+#
+# Deletes run in chunks of CHUNK_ROWS, each its own short write transaction
+# with a pause in between, so the receiver's BatchWriter never waits on more
+# than one chunk. Freed pages are then returned to the filesystem with
+# PRAGMA incremental_vacuum, again a few pages per transaction. That needs
+# auto_vacuum=INCREMENTAL: new databases get it from init_db(); an existing
+# one is converted once with --convert (a full VACUUM that blocks writers).
+#
+# Run one compactor per database, separate from the receivers and the Flask
+# server: once (e.g. from cron), or with --interval N (AIRLOCK_COMPACT_INTERVAL)
+# to repeat every N seconds until interrupted. --dry-run opens the database
+# read-only and leaves its schema as it is.
+#
+# Usage:
+#   python compaction.py [db_file] [--raw-days N] [--rollup-1s-days N] [--rollup-1m-days N]
+#                        [--interval N] [--dry-run] [--convert]
+
+import argparse
+import os
+import pathlib
+import sqlite3
+import sys
+import time
+
+from db_writer import SYNCHRONOUS
+from schema import DB_FILE, init_db
+
+# days each tier is kept; 0 = forever (the default: retention is opt-in)
+RAW_DAYS = float(os.environ.get("AIRLOCK_RETAIN_RAW_DAYS", "0"))
+ROLLUP_1S_DAYS = float(os.environ.get("AIRLOCK_RETAIN_1S_DAYS", "0"))
+ROLLUP_1M_DAYS = float(os.environ.get("AIRLOCK_RETAIN_1M_DAYS", "0"))
+COMPACT_INTERVAL = float(os.environ.get("AIRLOCK_COMPACT_INTERVAL", "0"))   # seconds between CLI runs; 0 = once
+
+CHUNK_ROWS = 1000            # rows deleted per write transaction
+CHUNK_PAUSE = 0.05           # seconds between chunks, so the writer gets the lock
+VACUUM_PAGES = 256           # pages released per incremental_vacuum step
+
+AUTO_VACUUM_INCREMENTAL = 2  # PRAGMA auto_vacuum value
+
+# table, age column, retention attribute; rowid subqueries keep each chunk on an index
+TIERS = (
+    ("telemetry", "ts", "raw_days"),
+    ("telemetry_rollup_1s", "bucket", "rollup_1s_days"),
+    ("telemetry_path_1s", "bucket", "rollup_1s_days"),
+    ("telemetry_rollup_1m", "bucket", "rollup_1m_days"),
+)
+
+
+class RetentionPolicy:
+    """How many days each tier is kept; 0 (or None) keeps it forever."""
+
+    def __init__(self, raw_days=RAW_DAYS, rollup_1s_days=ROLLUP_1S_DAYS, rollup_1m_days=ROLLUP_1M_DAYS):
+        self.raw_days = float(raw_days or 0)
+        self.rollup_1s_days = float(rollup_1s_days or 0)
+        self.rollup_1m_days = float(rollup_1m_days or 0)
+        if min(self.raw_days, self.rollup_1s_days, self.rollup_1m_days) < 0:
+            raise ValueError("retention days must not be negative")
+        # /stats reads raw rows and per-second buckets only at a window's edges
+        # and per-minute buckets for the rest, so a coarser tier may not expire
+        # before a finer one
+        for finer, coarser in (("raw_days", "rollup_1m_days"), ("rollup_1s_days", "rollup_1m_days")):
+            f, c = getattr(self, finer), getattr(self, coarser)
+            if c and (not f or f > c):
+                raise ValueError(f"{coarser} ({c:g}) must be 0 or at least {finer} ({f:g})")
+
+    def cutoff(self, attr, now=None):
+        """Epoch seconds before which the tier's rows expire, or None."""
+        days = getattr(self, attr)
+        if not days:
+            return None
+        return (now or time.time()) - days * 86400
+
+    def expires_anything(self):
+        return bool(self.raw_days or self.rollup_1s_days or self.rollup_1m_days)
+
+    def __repr__(self):
+        return (f"RetentionPolicy(raw_days={self.raw_days:g}, rollup_1s_days={self.rollup_1s_days:g}, "
+                f"rollup_1m_days={self.rollup_1m_days:g})")
+
+
+def _connect(db_file):
+    # autocommit: every chunk is an explicit BEGIN IMMEDIATE .. COMMIT
+    con = sqlite3.connect(db_file, timeout=30, isolation_level=None)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute(f"PRAGMA synchronous={SYNCHRONOUS}")
+    return con
+
+
+def _connect_readonly(db_file):
+    con = sqlite3.connect(pathlib.Path(db_file).absolute().as_uri() + "?mode=ro", uri=True, timeout=30)
+    con.execute("PRAGMA query_only=ON")
+    return con
+
+
+def _tables(con):
+    return {r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def delete_expired(con, table, column, cutoff, chunk=CHUNK_ROWS, pause=CHUNK_PAUSE):
+    """Delete rows of `table` with `column` < cutoff, chunk rows per transaction."""
+    sql = (f"DELETE FROM {table} WHERE rowid IN "
+           f"(SELECT rowid FROM {table} WHERE {column} < ? ORDER BY {column} LIMIT ?)")
+    deleted = 0
+    while True:
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            n = con.execute(sql, (cutoff, chunk)).rowcount
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        deleted += n
+        if n < chunk:
+            break
+        time.sleep(pause)
+    return deleted
+
+
+def count_expired(con, table, column, cutoff):
+    return con.execute(f"SELECT count(*) FROM {table} WHERE {column} < ?", (cutoff,)).fetchone()[0]
+
+
+def incremental_vacuum(con, pages=VACUUM_PAGES, pause=CHUNK_PAUSE):
+    """Release free pages to the filesystem a few at a time; returns pages released."""
+    if con.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+        return 0
+    released = 0
+    while True:
+        free = con.execute("PRAGMA freelist_count").fetchone()[0]
+        if not free:
+            break
+        step = min(free, pages)
+        # execute() steps a pragma only once (one page); a script runs it to completion
+        con.executescript(f"PRAGMA incremental_vacuum({step});")
+        released += step
+        time.sleep(pause)
+    if released:
+        con.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+    return released
+
+
+def convert_to_incremental(db_file=DB_FILE):
+    """Switch an existing database to auto_vacuum=INCREMENTAL (full VACUUM; blocks writers)."""
+    con = _connect(db_file)
+    try:
+        if con.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+            return False
+        con.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        con.execute("VACUUM")
+        return True
+    finally:
+        con.close()
+
+
+def compact(db_file=DB_FILE, policy=None, dry_run=False):
+    """Apply `policy` once; returns {"deleted": {table: n}, "pages_released": n, ...}.
+
+    dry_run only counts, on a read-only connection; tiers the database's
+    schema does not have yet are left out.
+    """
+    policy = policy or RetentionPolicy()
+    if not dry_run:
+        init_db(db_file).close()
+    started = time.monotonic()
+    con = _connect_readonly(db_file) if dry_run else _connect(db_file)
+    try:
+        page_size = con.execute("PRAGMA page_size").fetchone()[0]
+        tables = _tables(con) if dry_run else None
+        deleted = {}
+        for table, column, attr in TIERS:
+            cutoff = policy.cutoff(attr)
+            if cutoff is None:
+                continue
+            if dry_run:
+                if table in tables:
+                    deleted[table] = count_expired(con, table, column, cutoff)
+            else:
+                deleted[table] = delete_expired(con, table, column, cutoff)
+        pages = 0 if dry_run else incremental_vacuum(con)
+        return {
+            "deleted": deleted,
+            "pages_released": pages,
+            "bytes_released": pages * page_size,
+            "incremental_vacuum": con.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL,
+            "seconds": time.monotonic() - started,
+        }
+    finally:
+        con.close()
+
+
+def _summary(result):
+    deleted = ", ".join(f"{t} {n}" for t, n in result["deleted"].items()) or "nothing expired"
+    return (f"deleted {deleted}; released {result['pages_released']} pages "
+            f"({result['bytes_released'] / 1048576:.1f} MiB) in {result['seconds']:.2f}s")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Apply the airlock.db retention policy and reclaim space")
+    ap.add_argument("db", nargs="?", default=DB_FILE)
+    ap.add_argument("--raw-days", type=float, default=RAW_DAYS, help="keep raw rows this long (0 = forever)")
+    ap.add_argument("--rollup-1s-days", type=float, default=ROLLUP_1S_DAYS)
+    ap.add_argument("--rollup-1m-days", type=float, default=ROLLUP_1M_DAYS)
+    ap.add_argument("--interval", type=float, default=COMPACT_INTERVAL,
+                    help="repeat every N seconds until interrupted (0 = run once)")
+    ap.add_argument("--dry-run", action="store_true", help="only count what would be deleted")
+    ap.add_argument("--convert", action="store_true",
+                    help="first switch an existing database to auto_vacuum=INCREMENTAL (full VACUUM)")
+    args = ap.parse_args(argv)
+    try:
+        policy = RetentionPolicy(args.raw_days, args.rollup_1s_days, args.rollup_1m_days)
+    except ValueError as e:
+        ap.error(str(e))
+    if args.interval < 0:
+        ap.error("--interval must not be negative")
+    if args.dry_run and not os.path.exists(args.db):
+        ap.error(f"{args.db} does not exist")
+    if not policy.expires_anything():
+        print("No retention configured (--raw-days / --rollup-1s-days / --rollup-1m-days or "
+              "AIRLOCK_RETAIN_*_DAYS); nothing will be deleted", file=sys.stderr)
+
+    if args.convert and not args.dry_run:
+        init_db(args.db).close()
+        if convert_to_incremental(args.db):
+            print(f"{args.db}: converted to auto_vacuum=INCREMENTAL")
+    first = True
+    while True:
+        result = compact(args.db, policy, dry_run=args.dry_run)
+        if args.dry_run:
+            print(f"{args.db}: {policy} would delete",
+                  ", ".join(f"{t} {n}" for t, n in result["deleted"].items()) or "nothing")
+        else:
+            print(f"{args.db}: {_summary(result)}")
+        if first and not result["incremental_vacuum"]:
+            print("auto_vacuum is not INCREMENTAL; freed pages are reused but the file does not shrink "
+                  "(run once with --convert)", file=sys.stderr)
+        if args.interval <= 0 or args.dry_run:
+            return
+        first = False
+        try:
+            time.sleep(args.interval)
+        except KeyboardInterrupt:
+            return
+
+
+if __name__ == "__main__":
+    main()
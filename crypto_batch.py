@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# crypto_batch.py — bulk Fernet encrypt/decrypt for the /send/batch and /receive/batch APIs
+#
+# Every item gets its own result; a bad item yields an error entry instead of
+# failing the batch. Large batches are split into chunks and run on a process
+# pool (Fernet is CPU-bound and holds the GIL); small ones run inline, where
+# the pool round trip would cost more than it saves.
+
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from cryptography.fernet import Fernet
+
+DEFAULT_FERNET_KEY = b'HyMs5PCyDY5oWoEKZs98gwwU7ZKxSBrqifkQHVCHn-s='
+
+BATCH_MAX_ITEMS = int(os.environ.get("AIRLOCK_BATCH_MAX_ITEMS", "5000"))
+WORKERS = int(os.environ.get("AIRLOCK_CRYPTO_WORKERS", str(os.cpu_count() or 1)))   # 0 = always inline
+PARALLEL_MIN = 256           # items before a batch is worth sending to the pool
+CHUNK = 128                  # items per pool task
+
+_cipher = None
+
+
+def _init(key):
+    global _cipher
+    _cipher = Fernet(key)
+
+
+def _encrypt_one(telemetry):
+    if telemetry is None:
+        return {"error": "missing telemetry value"}
+    plaintext = json.dumps(telemetry) if isinstance(telemetry, (dict, list)) else str(telemetry)
+    return {"encrypted": _cipher.encrypt(plaintext.encode()).decode()}
+
+
+def _decrypt_one(item):
+    token = item.get("encrypted") if isinstance(item, dict) else item
+    if not token or not isinstance(token, str):
+        return {"error": "missing 'encrypted' value"}
+    try:
+        decrypted = _cipher.decrypt(token.encode()).decode()
+    except Exception as e:
+        return {"error": "decryption_failed", "detail": str(e) or type(e).__name__}
+    try:
+        return {"decrypted": json.loads(decrypted)}
+    except Exception:
+        return {"decrypted": decrypted}
+
+
+_OPS = {"encrypt": _encrypt_one, "decrypt": _decrypt_one}
+
+
+def _run_chunk(op, items):
+    fn = _OPS[op]
+    return [fn(item) for item in items]
+
+
+class CryptoBatcher:
+    """Runs encrypt/decrypt over lists of items, inline or on a process pool."""
+
+    def __init__(self, key=None, workers=WORKERS, parallel_min=PARALLEL_MIN, chunk=CHUNK):
+        self.key = key or os.environ.get("FERNET_KEY") or DEFAULT_FERNET_KEY
+        self.workers = max(0, int(workers))
+        self.parallel_min = parallel_min
+        self.chunk = chunk
+        self._pool = None
+        self._lock = threading.Lock()
+        _init(self.key)
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: the Flask server is threaded, and forking it could copy held locks
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=_init, initargs=(self.key,))
+            return self._pool
+
+    def run(self, op, items):
+        """Per-item result dicts for op ('encrypt' or 'decrypt'), in input order."""
+        if op not in _OPS:
+            raise ValueError(f"unknown op {op!r}")
+        if self.workers < 2 or len(items) < self.parallel_min:
+            return _run_chunk(op, items)
+        chunks = [items[i:i + self.chunk] for i in range(0, len(items), self.chunk)]
+        results = []
+        for part in self._executor().map(_run_chunk, [op] * len(chunks), chunks):
+            results.extend(part)
+        return results
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# db_pool.py — pooled, query-only SQLite connections for the read APIs
+#
+# Connections are opened once, tuned once (mmap, page cache, query_only) and
+# then checked out per request. Python's sqlite3 keeps a per-connection cache
+# of prepared statements, so reusing connections also reuses the compiled
+# SQL for the dashboard's fixed set of queries.
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+POOL_SIZE = int(os.environ.get("AIRLOCK_POOL_SIZE", "8"))
+MMAP_SIZE = int(os.environ.get("AIRLOCK_MMAP_SIZE", str(256 * 1024 * 1024)))   # bytes
+CACHE_SIZE_KIB = int(os.environ.get("AIRLOCK_CACHE_KIB", "16384"))             # per connection
+CACHED_STATEMENTS = 256
+
+
+class ReadPool:
+    """Bounded pool of reusable read-only connections.
+
+    Up to `size` idle connections are kept. If every pooled connection is
+    busy, an overflow connection is opened for that request and closed when
+    it is returned, so callers never block on the pool.
+    """
+
+    def __init__(self, db_file, size=POOL_SIZE, mmap_size=MMAP_SIZE,
+                 cache_size_kib=CACHE_SIZE_KIB, cached_statements=CACHED_STATEMENTS):
+        self.db_file = db_file
+        self.size = max(1, int(size))
+        self.mmap_size = int(mmap_size)
+        self.cache_size_kib = int(cache_size_kib)
+        self.cached_statements = int(cached_statements)
+        self._idle = queue.LifoQueue()   # LIFO keeps the warmest connection in use
+        self._lock = threading.Lock()
+        self._open = 0
+        self._stats = {"opened": 0, "closed": 0, "checkouts": 0, "reused": 0,
+                       "overflow": 0, "checkout_ms_total": 0.0}
+
+    def _connect(self):
+        con = sqlite3.connect(self.db_file, timeout=10, check_same_thread=False,
+                              cached_statements=self.cached_statements)
+        con.row_factory = sqlite3.Row
+        con.execute(f"PRAGMA mmap_size={self.mmap_size}")
+        con.execute(f"PRAGMA cache_size=-{self.cache_size_kib}")
+        con.execute("PRAGMA query_only=ON")
+        return con
+
+    def _checkout(self):
+        started = time.perf_counter()
+        try:
+            con = self._idle.get_nowait()
+            reused, pooled = True, True
+        except queue.Empty:
+            with self._lock:
+                pooled = self._open < self.size
+                if pooled:
+                    self._open += 1
+            try:
+                con = self._connect()
+            except Exception:
+                if pooled:
+                    with self._lock:
+                        self._open -= 1
+                raise
+            reused = False
+        with self._lock:
+            self._stats["checkouts"] += 1
+            if reused:
+                self._stats["reused"] += 1
+            else:
+                self._stats["opened"] += 1
+                if not pooled:
+                    self._stats["overflow"] += 1
+            self._stats["checkout_ms_total"] += (time.perf_counter() - started) * 1000.0
+        return con, pooled
+
+    def _release(self, con, pooled):
+        if con.in_transaction:
+            con.rollback()
+        if pooled:
+            self._idle.put(con)
+        else:
+            con.close()
+            with self._lock:
+                self._stats["closed"] += 1
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a with-block."""
+        con, pooled = self._checkout()
+        try:
+            yield con
+        finally:
+            self._release(con, pooled)
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s["size"] = self.size
+            s["open"] = self._open
+        s["idle"] = self._idle.qsize()
+        s["in_use"] = s["open"] - s["idle"]
+        s["avg_checkout_ms"] = (s["checkout_ms_total"] / s["checkouts"]) if s["checkouts"] else 0.0
+        return s
+
+    def close_all(self):
+        while True:
+            try:
+                con = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            con.close()
+            with self._lock:
+                self._open -= 1
+                self._stats["closed"] += 1
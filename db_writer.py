@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# db_writer.py — group-commit SQLite writer for verified telemetry
+#
+# Rows are handed to a dedicated writer thread which gathers them into
+# batches and commits each batch with a single executemany() transaction,
+# so the receiver pays one fsync per batch instead of one per datagram.
+# msg_id is the primary key every writer process shares: after each commit
+# on_commit hears which rows were stored and which the key turned down
+# because another process (or an earlier run) had already stored them.
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import metrics
+import raw_codec
+
+DB_FILE = "airlock.db"
+
+# Flush when either threshold is hit (whichever comes first)
+BATCH_SIZE = int(os.environ.get("AIRLOCK_BATCH_SIZE", "256"))
+BATCH_INTERVAL = float(os.environ.get("AIRLOCK_BATCH_INTERVAL", "0.25"))   # seconds
+# PRAGMA synchronous level used together with WAL (OFF / NORMAL / FULL / EXTRA)
+SYNCHRONOUS = os.environ.get("AIRLOCK_SYNCHRONOUS", "NORMAL")
+
+SYNCHRONOUS_LEVELS = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+RAW_ENC = raw_codec.storage_mode()   # AIRLOCK_RAW_STORAGE: json / zlib / extras
+
+# inserted_at is stamped by the writer at flush time (see BatchWriter._flush)
+INSERT_SQL = """
+    INSERT OR IGNORE INTO telemetry (msg_id, ts, altitude, speed, battery, lat, lon, raw, raw_enc, drone_id,
+                                     inserted_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_STOP = object()
+
+COMMIT_SECONDS = metrics.histogram("airlock_db_commit_seconds", "Seconds per batch INSERT + COMMIT.")
+BATCH_ROWS = metrics.histogram("airlock_db_batch_rows", "Rows per committed batch.",
+                               buckets=(1, 4, 16, 64, 128, 256, 512, 1024, 4096))
+ROWS_WRITTEN = metrics.counter("airlock_db_rows_written", "Rows committed by the batch writer.")
+BATCHES_DROPPED = metrics.counter("airlock_db_batches_dropped", "Batches lost to a database error.")
+QUEUE_DEPTH = metrics.gauge("airlock_db_writer_queue", "Rows waiting for the writer thread.")
+
+
+def _column(v):
+    # a value SQLite cannot bind would fail the whole batch; raw keeps the original
+    if v is None or isinstance(v, (str, float)):
+        return v
+    if isinstance(v, int) and -2 ** 63 <= v < 2 ** 63:
+        return v
+    return None
+
+
+def telemetry_row(msg_id, ts, telemetry, raw, raw_enc=RAW_ENC):
+    """Flatten one verified telemetry dict into the row tuple BatchWriter.put() takes.
+
+    `raw` is the decrypted JSON text; it is stored in encoding `raw_enc`
+    (or the one raw_codec.row_encoding() picks where that cannot hold it).
+    """
+    loc = telemetry.get("location")
+    if not isinstance(loc, dict):
+        loc = {}
+    raw_enc = raw_codec.row_encoding(telemetry, raw_enc)
+    return (
+        msg_id, ts,
+        _column(telemetry.get("altitude")), _column(telemetry.get("speed")), _column(telemetry.get("battery")),
+        _column(loc.get("lat")), _column(loc.get("lon")),
+        raw_codec.encode(telemetry, raw, raw_enc), raw_enc,
+        telemetry.get("drone_id"),
+    )
+
+
+class BatchWriter:
+    """Background writer that batches rows and commits them in one transaction.
+
+    put() never touches the database; it only enqueues. The writer thread owns
+    the SQLite connection and flushes when BATCH_SIZE rows are buffered or the
+    oldest buffered row has waited BATCH_INTERVAL seconds. close() drains the
+    queue and flushes whatever is left, so no buffered rows are lost on shutdown.
+
+    on_commit(stored, duplicates) runs on the writer thread after each batch
+    with the put() tags of the rows inserted and of those whose msg_id was
+    already stored. A batch lost to a database error is handed over as
+    stored, so the log keeps the verified telemetry the database dropped.
+    """
+
+    def __init__(self, db_file=DB_FILE, batch_size=BATCH_SIZE,
+                 interval=BATCH_INTERVAL, synchronous=SYNCHRONOUS, on_commit=None):
+        level = str(synchronous).upper()
+        if level not in SYNCHRONOUS_LEVELS:
+            raise ValueError(f"invalid synchronous level {synchronous!r}; "
+                             f"expected one of {', '.join(SYNCHRONOUS_LEVELS)}")
+        self.db_file = db_file
+        self.batch_size = max(1, int(batch_size))
+        self.interval = max(0.0, float(interval))
+        self.synchronous = level
+        self.on_commit = on_commit
+        self.rows_written = 0
+        self.batches_written = 0
+        self._last_stamp = 0.0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._ready = threading.Event()
+        self._error = None
+        QUEUE_DEPTH.set_function(self._queue.qsize)
+        self._thread = threading.Thread(target=self._run, name="airlock-db-writer", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    def put(self, row, tag=None):
+        """Queue one telemetry_row() tuple for the next batch; `tag` is what on_commit gets back."""
+        if self._closed:
+            raise RuntimeError("BatchWriter is closed")
+        self._queue.put((row, tag))
+
+    def flush(self, timeout=None):
+        """Commit every row queued so far now; returns once on_commit has seen them."""
+        if self._closed:
+            raise RuntimeError("BatchWriter is closed")
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=None):
+        """Flush all buffered rows and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- writer thread ---
+    def _connect(self):
+        con = sqlite3.connect(self.db_file, timeout=10)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute(f"PRAGMA synchronous={self.synchronous}")
+        return con
+
+    def _stamp(self):
+        # sub-second and strictly increasing within this writer: every row of
+        # a batch shares the stamp. It is taken before COMMIT, so across
+        # writers it does not follow commit order; /history pages on rowid
+        self._last_stamp = max(time.time(), self._last_stamp + 1e-6)
+        return self._last_stamp
+
+    def _insert(self, con, rows):
+        """Insert rows inside the open transaction; False for each row whose msg_id was already stored."""
+        con.execute("SAVEPOINT batch")
+        if con.executemany(INSERT_SQL, rows).rowcount == len(rows):
+            con.execute("RELEASE batch")
+            return [True] * len(rows)
+        # rare: some msg_id is stored already (e.g. replayed through another
+        # process), so redo the batch a row at a time to find out which
+        con.execute("ROLLBACK TO batch")
+        con.execute("RELEASE batch")
+        return [con.execute(INSERT_SQL, row).rowcount == 1 for row in rows]
+
+    def _flush(self, con, batch):
+        if not batch:
+            return
+        stamp = self._stamp()
+        started = time.perf_counter()
+        try:
+            with con:
+                con.execute("BEGIN")
+                stored = self._insert(con, [(*row, stamp) for row, _ in batch])
+            written = sum(stored)
+            COMMIT_SECONDS.observe(time.perf_counter() - started)
+            BATCH_ROWS.observe(written)
+            ROWS_WRITTEN.inc(written)
+            self.rows_written += written
+            self.batches_written += 1
+        except sqlite3.Error as e:
+            stored = [True] * len(batch)
+            BATCHES_DROPPED.inc()
+            print(f"DB writer error: dropped batch of {len(batch)} rows:", e)
+        if self.on_commit is not None:
+            try:
+                self.on_commit([tag for (_, tag), ok in zip(batch, stored) if ok],
+                               [tag for (_, tag), ok in zip(batch, stored) if not ok])
+            except Exception as e:
+                print("DB writer: on_commit failed:", e)
+        batch.clear()
+
+    def _run(self):
+        try:
+            con = self._connect()
+        except Exception as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+
+        batch = []
+        deadline = None
+        try:
+            while True:
+                wait = None if not batch else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self._queue.get(timeout=wait)
+                except queue.Empty:
+                    item = None
+
+                if item is _STOP:
+                    break
+                if isinstance(item, threading.Event):   # flush() request
+                    self._flush(con, batch)
+                    item.set()
+                    continue
+                if item is not None:
+                    if not batch:
+                        deadline = time.monotonic() + self.interval
+                    batch.append(item)
+
+                if len(batch) >= self.batch_size or (batch and time.monotonic() >= deadline):
+                    self._flush(con, batch)
+
+            # shutdown: drain anything queued behind the stop marker, then flush
+            waiters = []
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                elif item is not _STOP:
+                    batch.append(item)
+            self._flush(con, batch)
+            for w in waiters:
+                w.set()
+        finally:
+            con.close()
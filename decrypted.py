@@ -1,5 +1,6 @@
 import socket
 from cryptography.fernet import Fernet
+from log_writer import LogWriter
 
 # Same key used in app.py
 key = b'HyMs5PCyDY5oWoEKZs98gwwU7ZKxSBrqifkQHVCHn-s='
@@ -10,11 +11,11 @@ sock.bind(('localhost', 9998))
 
 print("Receiver started... waiting for messages.")
 
-while True:
-    data, address = sock.recvfrom(4096)
-    decrypted_data = cipher.decrypt(data).decode()
-    print("Decrypted:", decrypted_data)
+# ✅ Log to file (buffered + rotated, see log_writer.py)
+with LogWriter("telemetry_log.txt") as log:
+    while True:
+        data, address = sock.recvfrom(4096)
+        decrypted_data = cipher.decrypt(data).decode()
+        print("Decrypted:", decrypted_data)
 
-    # ✅ Log to file
-    with open("telemetry_log.txt", "a") as f:
-        f.write(f"Decrypted: {decrypted_data}\n")
+        log.write(f"Decrypted: {decrypted_data}")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# downsample.py — shape-preserving reduction of map paths and chart series
+#
+#   simplify_path()  Douglas-Peucker, driven by a point budget instead of a
+#                    tolerance: the segment with the largest deviation is split
+#                    first until max_points are kept.
+#   lttb()           Largest-Triangle-Three-Buckets for (x, y) series.
+# Both always keep the first and last point and return input order.
+
+import heapq
+import math
+
+
+def _seg_farthest(pts, i, j, kx):
+    """Index and squared distance of the point in (i, j) farthest from segment i-j."""
+    ax, ay = pts[i][1] * kx, pts[i][0]
+    bx, by = pts[j][1] * kx, pts[j][0]
+    dx, dy = bx - ax, by - ay
+    norm = dx * dx + dy * dy
+    best, best_d = -1, -1.0
+    for k in range(i + 1, j):
+        px, py = pts[k][1] * kx - ax, pts[k][0] - ay
+        if norm == 0.0:
+            d = px * px + py * py
+        else:
+            cross = px * dy - py * dx
+            d = cross * cross / norm
+        if d > best_d:
+            best, best_d = k, d
+    return best, best_d
+
+
+def simplify_path(points, max_points):
+    """Douglas-Peucker simplification of [(lat, lon), ...] down to max_points.
+
+    Longitude is scaled by cos(mean latitude) so distances are roughly
+    isotropic over the small areas a flight covers.
+    """
+    n = len(points)
+    if max_points <= 0 or n <= max_points:
+        return list(points)
+    if max_points < 3:
+        return [points[0], points[-1]][:max_points]
+    kx = math.cos(math.radians(sum(p[0] for p in points) / n))
+    keep = {0, n - 1}
+    heap = []
+    k, d = _seg_farthest(points, 0, n - 1, kx)
+    if k >= 0:
+        heap.append((-d, 0, n - 1, k))
+    while heap and len(keep) < max_points:
+        _, i, j, k = heapq.heappop(heap)
+        keep.add(k)
+        for a, b in ((i, k), (k, j)):
+            if b - a > 1:
+                kk, dd = _seg_farthest(points, a, b, kx)
+                heapq.heappush(heap, (-dd, a, b, kk))
+    return [points[i] for i in sorted(keep)]
+
+
+def lttb(xs, ys, max_points):
+    """Largest-Triangle-Three-Buckets; returns the indices of the kept points."""
+    n = len(xs)
+    if max_points <= 0 or n <= max_points:
+        return list(range(n))
+    if max_points < 3:
+        return [0, n - 1][:max_points]
+    out = [0]
+    every = (n - 2) / (max_points - 2)
+    a = 0
+    for b in range(max_points - 2):
+        # average of the next bucket is the third triangle vertex
+        nxt_start = int((b + 1) * every) + 1
+        nxt_end = min(int((b + 2) * every) + 1, n)
+        cnt = nxt_end - nxt_start
+        avg_x = sum(xs[nxt_start:nxt_end]) / cnt
+        avg_y = sum(ys[nxt_start:nxt_end]) / cnt
+
+        start = int(b * every) + 1
+        end = int((b + 1) * every) + 1
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for i in range(start, end):
+            area = abs((ax - avg_x) * (ys[i] - ay) - (ax - xs[i]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = i, area
+        out.append(best)
+        a = best
+    out.append(n - 1)
+    return out
+
+
+def lttb_series(pairs, max_points):
+    """lttb() over [(x, y), ...] pairs, skipping pairs whose y is None."""
+    pts = [p for p in pairs if p[1] is not None]
+    idx = lttb([p[0] for p in pts], [p[1] for p in pts], max_points)
+    return [pts[i] for i in idx]
@@ -1,12 +1,14 @@
 #!/usr/bin/env python3
-# dronedecrypt.py — simple live viewer for latest_telemetry.json
+# dronedecrypt.py — simple live viewer for the latest telemetry slot
+# (shared memory written by the receiver, see latest_slot.py)
 
 import json
 import time
 import os
 
-TELEMETRY_FILE = "latest_telemetry.json"
-POLL_INTERVAL = 2
+from latest_slot import SLOT_FILE, SlotReader
+
+WAIT_INTERVAL = 2            # seconds between checks while the receiver is not up
 
 def pretty_print(t):
     try:
@@ -20,21 +22,33 @@ def pretty_print(t):
     except Exception as e:
         print("Error printing telemetry:", e)
 
-if __name__ == "__main__":
+def open_slot():
     while True:
-        if not os.path.exists(TELEMETRY_FILE):
-            print("[Drone Simulator] Waiting for telemetry data...")
-            time.sleep(POLL_INTERVAL)
-            continue
-        try:
-            with open(TELEMETRY_FILE, "r") as f:
-                telemetry = json.load(f)
-            if isinstance(telemetry, dict):
-                pretty_print(telemetry)
-            else:
-                print("[Drone Simulator] Unexpected telemetry format:", telemetry)
-        except json.JSONDecodeError:
-            print("[Drone Simulator] Received invalid telemetry format (JSONDecodeError)...")
-        except Exception as e:
-            print("[Drone Simulator] Error reading telemetry file:", e)
-        time.sleep(POLL_INTERVAL)
+        if os.path.exists(SLOT_FILE):
+            try:
+                return SlotReader(SLOT_FILE)
+            except (ValueError, OSError):
+                pass   # receiver is still creating it
+        print("[Drone Simulator] Waiting for telemetry data...")
+        time.sleep(WAIT_INTERVAL)
+
+if __name__ == "__main__":
+    reader = open_slot()
+    seq, payload = reader.read()
+    try:
+        while True:
+            if payload:
+                try:
+                    telemetry = json.loads(payload)
+                    if isinstance(telemetry, dict):
+                        pretty_print(telemetry)
+                    else:
+                        print("[Drone Simulator] Unexpected telemetry format:", telemetry)
+                except json.JSONDecodeError:
+                    print("[Drone Simulator] Received invalid telemetry format (JSONDecodeError)...")
+            # block until the receiver publishes something newer
+            seq, payload = reader.wait(seq)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
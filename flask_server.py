@@ -2,24 +2,40 @@
 # flask_server.py — AirLock: Crypto API + DB-backed telemetry + dashboard
 # Map (left) + Battery Distribution bar chart (left) + NEW Scatter (Speed vs Altitude) under it
 # Line charts (right) + KPIs + Now cards + Alerts + Export
+#
+# Importing this module has no side effects: create_app() opens the database
+# and builds the per-process state below (`python flask_server.py` calls it;
+# a WSGI server loads "flask_server:create_app()"). The crypto pool's spawn
+# workers re-import this file and must not migrate the database or build caches.
 
-from flask import Flask, request, jsonify, Response, redirect, make_response
+from flask import Flask, request, jsonify, Response, redirect, g
 from cryptography.fernet import Fernet
-import json, time, os, sqlite3, csv, io
+import json, time, os, sqlite3, csv, io, math, queue, threading, base64, zlib, atexit, struct
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from schema import init_db, LOW_BATTERY_PCT
+from db_pool import ReadPool
+from crypto_batch import CryptoBatcher, BATCH_MAX_ITEMS
+from ingest import IngestPipeline, MAX_SKEW_SECONDS
+from downsample import simplify_path, lttb_series
+import metrics
+import raw_codec
 
 app = Flask(__name__)
 
 # --- Crypto setup ---
 FERNET_KEY = os.environ.get("FERNET_KEY") or b'HyMs5PCyDY5oWoEKZs98gwwU7ZKxSBrqifkQHVCHn-s='
 cipher = Fernet(FERNET_KEY)
+crypto_batcher = None   # CryptoBatcher, set by create_app(); large batches use a process pool
 
 # --- DB helpers ---
 DB_FILE = "airlock.db"
+db_pool = None          # ReadPool, set by create_app()
 
 def get_db():
-    con = sqlite3.connect(DB_FILE)
-    con.row_factory = sqlite3.Row
-    return con
+    """Context manager yielding a pooled, query-only connection (sqlite3.Row rows)."""
+    return db_pool.connection()
 
 def generate_sample_telemetry():
     ts = int(time.time())
@@ -30,10 +46,27 @@ def generate_sample_telemetry():
         "location": {"lat": 12.9716, "lon": 77.5946}
     }
 
+HTTP_REQUESTS = metrics.counter("airlock_http_requests", "HTTP requests by route, method and status.",
+                                ("route", "method", "status"))
+HTTP_SECONDS = metrics.histogram("airlock_http_request_seconds",
+                                 "Seconds until the response (first byte for streams), by route.",
+                                 ("route", "method"))
+
 @app.before_request
 def log_request():
+    g.started = time.perf_counter()
     print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {request.method} {request.path}")
 
+@app.after_request
+def count_request(response):
+    started = g.get("started")
+    if started is not None:
+        # the rule, not the path, so query strings and bad URLs add no series
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        HTTP_SECONDS.labels(route, request.method).observe(time.perf_counter() - started)
+        HTTP_REQUESTS.labels(route, request.method, response.status_code).inc()
+    return response
+
 # --- Routes ---
 @app.route('/')
 def index():
@@ -47,6 +80,10 @@ def favicon():
 def health():
     return jsonify({"status": "ok"}), 200
 
+@app.route('/pool/stats')
+def pool_stats():
+    return jsonify(db_pool.stats()), 200
+
 # --- Crypto endpoints ---
 @app.route('/send', methods=['POST'])
 def send():
@@ -80,183 +117,1202 @@ def receive():
     except Exception:
         return jsonify({"decrypted": decrypted}), 200
 
+# --- Bulk crypto endpoints: JSON array (or {"items": [...]}) in, per-item results out ---
+def batch_items():
+    """Return (items, None) or (None, error response) for a batch request body."""
+    body = request.get_json(silent=True)
+    items = body.get("items") if isinstance(body, dict) else body
+    if not isinstance(items, list):
+        return None, (jsonify({"error": "expected a JSON array or {\"items\": [...]}"}), 400)
+    if len(items) > BATCH_MAX_ITEMS:
+        return None, (jsonify({"error": "batch_too_large", "max_items": BATCH_MAX_ITEMS}), 413)
+    return items, None
+
+def batch_response(results):
+    errors = 0
+    for i, r in enumerate(results):
+        r["index"] = i
+        errors += "error" in r
+    return jsonify({"count": len(results), "ok": len(results) - errors,
+                    "errors": errors, "results": results}), 200
+
+@app.route('/send/batch', methods=['POST'])
+def send_batch():
+    """Encrypt each telemetry item; same per-item output as /send, null items get an "error"."""
+    items, err = batch_items()
+    if err:
+        return err
+    return batch_response(crypto_batcher.run("encrypt", items))
+
+@app.route('/receive/batch', methods=['POST'])
+def receive_batch():
+    """Decrypt each token (a string or {"encrypted": ...}); bad items get an "error"."""
+    items, err = batch_items()
+    if err:
+        return err
+    return batch_response(crypto_batcher.run("decrypt", items))
+
+# --- HTTP ingest: same decrypt/validate/dedupe/persist pipeline as the UDP receivers ---
+INGEST_REPLAY_SNAPSHOT = "replay_cache_http.json"   # this process's replay cache snapshot
+INGEST_LOG_FILE = "telemetry_log_http.txt"         # this process's log; the receiver rotates its own
+_ingest = None
+_ingest_lock = threading.Lock()
+
+def get_ingest():
+    """Process-wide IngestPipeline, opened on first use and closed at exit."""
+    global _ingest
+    with _ingest_lock:
+        if _ingest is None:
+            # the UDP receiver owns the latest slot (one writer); dashboards see these rows via the DB
+            _ingest = IngestPipeline(DB_FILE, verbose=False, snapshot_file=INGEST_REPLAY_SNAPSHOT,
+                                     log_file=INGEST_LOG_FILE, publish=False).open()
+            atexit.register(_ingest.close)
+        return _ingest
+
+def ingest_datagram(item):
+    """Raw datagram bytes for one /ingest item, or None if it is malformed."""
+    if isinstance(item, dict):
+        if isinstance(item.get("b64"), str):
+            try:
+                return base64.b64decode(item["b64"], validate=True)
+            except ValueError:
+                return None
+        item = item.get("encrypted")
+    return item.encode() if isinstance(item, str) and item else None
+
+@app.route('/ingest', methods=['POST'])
+def ingest_route():
+    """Store encrypted telemetry sent over HTTP, exactly as the UDP receiver would.
+
+    Body: one raw datagram (application/octet-stream), or a JSON array (or
+    {"items": [...]}) of Fernet tokens, {"encrypted": token} or
+    {"b64": base64 datagram} for binary (AEAD) datagrams. Each item gets
+    {"accepted": n, "rejected": [...]} or an "error"; accepted rows are
+    queued for the next batch commit.
+    """
+    if request.mimetype == "application/octet-stream":
+        datagrams = [request.get_data()]
+    else:
+        items, err = batch_items()
+        if err:
+            return err
+        datagrams = [ingest_datagram(item) for item in items]
+    pipeline = get_ingest()
+    valid = [d for d in datagrams if d]
+    outcome = iter(pipeline.ingest(valid))
+    results = [next(outcome) if d else {"error": "expected a token, {\"encrypted\": ...} or {\"b64\": ...}"}
+               for d in datagrams]
+    accepted = rejected = 0
+    for i, r in enumerate(results):
+        r["index"] = i
+        accepted += r.get("accepted", 0)
+        rejected += len(r.get("rejected", ())) + ("error" in r)
+    return jsonify({"count": len(results), "accepted": accepted, "rejected": rejected,
+                    "results": results}), 200
+
 # --- Helpers for time window ---
-def window_clause(minutes):
-    """Return SQL WHERE + params to restrict by ts in last N minutes. None/'' => no filter."""
+def window_cutoff(minutes):
+    """Return the epoch cutoff for the last N minutes. None/''/invalid => None (no filter)."""
     if minutes in (None, "", "null", "None"):
-        return ("", ())
+        return None
     try:
         m = int(minutes)
         if m <= 0:
-            return ("", ())
+            return None
     except:
+        return None
+    return time.time() - (m * 60)
+
+def window_clause(minutes, drone_id=None):
+    """Return SQL WHERE + params to restrict by ts in last N minutes (and one drone). None/'' => no filter."""
+    conds, params = [], []
+    if drone_id:
+        conds.append("drone_id = ?")
+        params.append(drone_id)
+    cutoff = window_cutoff(minutes)
+    if cutoff is not None:
+        conds.append("ts >= ?")
+        params.append(cutoff)
+    if not conds:
         return ("", ())
-    cutoff = time.time() - (m * 60)
-    return ("WHERE ts >= ?", (cutoff,))
+    return ("WHERE " + " AND ".join(conds), tuple(params))
+
+# --- Field projection (?fields=) for /last and /history ---
+ROW_FIELDS = raw_codec.COLUMNS
+FIELDS = ROW_FIELDS + ("raw",)   # raw is only read and decoded when asked for
+
+def parse_fields(value):
+    """Requested fields in FIELDS order; default: every column but raw. Raises ValueError."""
+    if not value:
+        return list(ROW_FIELDS)
+    names = {f.strip() for f in value.split(",") if f.strip()}
+    unknown = names - set(FIELDS)
+    if unknown:
+        raise ValueError(f"unknown field(s) {', '.join(sorted(unknown))}; expected {', '.join(FIELDS)}")
+    return [f for f in FIELDS if f in names]
+
+def select_list(fields, *extra):
+    # raw needs its encoding and the columns raw_codec.decode() rebuilds from
+    cols = [*ROW_FIELDS, "raw", "raw_enc"] if "raw" in fields else list(fields)
+    return ", ".join(dict.fromkeys([*cols, *extra]))
+
+def project(r, fields):
+    item = {}
+    for f in fields:
+        if f != "raw":
+            item[f] = r[f]
+            continue
+        try:
+            item["raw"] = raw_codec.decode(r["raw"], r["raw_enc"], r)
+        except Exception:
+            item["raw"] = None
+    return item
+
+# --- History APIs (support ?limit=, ?minutes= and ?fields=) ---
+LAST_IN_CHUNK = 500          # msg_ids per IN (...) lookup, under SQLite's variable limit
+
+def last_per_drone(minutes, fields):
+    """Each drone's latest reading (as /fleet picks it) within the window, in /fleet order."""
+    cutoff = window_cutoff(minutes)
+    latest = [d["msg_id"] for d in fleet.snapshot()["drones"]
+              if cutoff is None or (isinstance(d["ts"], (int, float)) and d["ts"] >= cutoff)]
+    rows = {}
+    with get_db() as con:
+        for i in range(0, len(latest), LAST_IN_CHUNK):
+            chunk = latest[i:i + LAST_IN_CHUNK]
+            sql = (f"SELECT {select_list(fields, 'msg_id')} FROM telemetry "
+                   f"WHERE msg_id IN ({', '.join('?' * len(chunk))})")
+            rows.update((r["msg_id"], r) for r in con.execute(sql, chunk))
+    return [project(rows[m], fields) for m in latest if m in rows]
 
-# --- History APIs (support ?limit= and ?minutes=) ---
 @app.route('/last', methods=['GET'])
 def last():
+    """Newest reading of ?drone_id=; without it, every drone's latest: {"count", "drones": [...]}."""
+    try:
+        fields = parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": "bad_fields", "detail": str(e)}), 400
     try:
         minutes = request.args.get("minutes")
-        where, params = window_clause(minutes)
-        con = get_db()
-        cur = con.cursor()
-        sql = f"""
-            SELECT msg_id, ts, altitude, speed, battery, lat, lon, raw
-            FROM telemetry
-            {where}
-            ORDER BY inserted_at DESC
-            LIMIT 1
-        """
-        cur.execute(sql, params)
-        row = cur.fetchone()
-        con.close()
+        drone_id = request.args.get("drone_id")
+        if not drone_id:
+            # one row across the fleet would be whichever drone reported last
+            drones = last_per_drone(minutes, fields)
+            if not drones:
+                return jsonify({"status": "empty"}), 200
+            return jsonify({"count": len(drones), "drones": drones}), 200
+        row = hot.last(window_cutoff(minutes), drone_id, fields)
+        if row is MISS:
+            where, params = window_clause(minutes, drone_id)
+            sql = f"""
+                SELECT {select_list(fields)}
+                FROM telemetry
+                {where}
+                ORDER BY rowid DESC
+                LIMIT 1
+            """
+            with get_db() as con:
+                row = con.execute(sql, params).fetchone()
         if not row:
             return jsonify({"status": "empty"}), 200
-        return jsonify({
-            "msg_id": row["msg_id"], "ts": row["ts"],
-            "altitude": row["altitude"], "speed": row["speed"], "battery": row["battery"],
-            "lat": row["lat"], "lon": row["lon"],
-            "raw": json.loads(row["raw"]) if row["raw"] else None
-        }), 200
+        return jsonify(project(row, fields)), 200
     except sqlite3.OperationalError as e:
         return jsonify({"error": "db_not_initialized", "detail": str(e)}), 500
 
+# --- Downsampled paths / series (?max_points=) ---
+MAX_POINTS_CAP = 5000
+DOWNSAMPLE_TTL_SECS = 2.0    # a window is recomputed at most this often
+DOWNSAMPLE_CACHE_SIZE = 64
+
+def parse_max_points(value):
+    """?max_points= as an int in [2, MAX_POINTS_CAP]; missing/invalid => None (off)."""
+    try:
+        n = int(value)
+    except (TypeError, ValueError):
+        return None
+    return max(2, min(n, MAX_POINTS_CAP))
+
+class DownsampleCache:
+    """Small LRU of downsampled results keyed by (kind, window, max_points).
+
+    Entries expire after DOWNSAMPLE_TTL_SECS, so while telemetry is streaming
+    in, every dashboard polling the same window shares one computation.
+    """
+
+    def __init__(self, size=DOWNSAMPLE_CACHE_SIZE, ttl=DOWNSAMPLE_TTL_SECS):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit and hit[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return hit[1]
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return value
+
+downsample_cache = DownsampleCache()
+
+def window_key(minutes):
+    cutoff = window_cutoff(minutes)
+    return None if cutoff is None else int(minutes)
+
+# per-second means from the 1s rollup, oldest first
+SERIES_SQL = """
+    SELECT bucket, alt_sum / alt_n AS altitude, spd_sum / spd_n AS speed, bat_sum / bat_n AS battery
+    FROM telemetry_rollup_1s WHERE bucket >= ?
+    ORDER BY bucket
+"""
+# each drone's latest position per second (see schema.py), drone by drone, oldest first
+PATH_ALL_SQL = """
+    SELECT drone_id, lat, lon FROM telemetry_path_1s
+    WHERE bucket >= ?
+    ORDER BY drone_id, bucket
+"""
+
+def first_bucket(minutes):
+    cutoff = window_cutoff(minutes)
+    return 0 if cutoff is None else math.ceil(cutoff)
+
+def group_paths(rows):
+    """[{"drone_id", "path"}] from (drone_id, lat, lon) rows ordered by drone."""
+    paths = []
+    for r in rows:
+        drone_id = r["drone_id"] or None   # '' holds the rows from before fleets
+        if not paths or paths[-1]["drone_id"] != drone_id:
+            paths.append({"drone_id": drone_id, "path": []})
+        paths[-1]["path"].append((r["lat"], r["lon"]))
+    return paths
+
+def downsampled_path(con, minutes, max_points):
+    """Each drone's whole-window path; together at most max_points, Douglas-Peucker simplified."""
+    def compute():
+        paths = group_paths(con.execute(PATH_ALL_SQL, (first_bucket(minutes),)).fetchall())
+        per_drone = max(2, max_points // max(1, len(paths)))
+        return [{"drone_id": p["drone_id"], "path": simplify_path(p["path"], per_drone)} for p in paths]
+    return downsample_cache.get_or_compute(("path", window_key(minutes), max_points), compute)
+
+def downsampled_series(con, minutes, max_points):
+    """Altitude/speed/battery over the whole window, each reduced with LTTB."""
+    def compute():
+        rows = con.execute(SERIES_SQL, (first_bucket(minutes),)).fetchall()
+        return {col: [list(p) for p in lttb_series([(r["bucket"], r[col]) for r in rows], max_points)]
+                for col in ("altitude", "speed", "battery")}
+    return downsample_cache.get_or_compute(("series", window_key(minutes), max_points), compute)
+
+# --- Keyset cursors over rowid ---
+# SQLite runs one write transaction at a time and hands out rowids inside
+# it, so rowid follows commit order across every writer (UDP receiver,
+# Flask /ingest): a row committed after a poller's cursor always sorts
+# after it. inserted_at is stamped per writer before COMMIT and does not.
+def encode_cursor(rowid):
+    raw = json.dumps([rowid], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    """Return the rowid or raise ValueError."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        (rowid,) = json.loads(raw)
+        if isinstance(rowid, int) and not isinstance(rowid, bool):
+            return rowid
+    except Exception:
+        pass
+    raise ValueError(f"invalid cursor {cursor!r}")
+
 @app.route('/history', methods=['GET'])
 def history():
+    """Newest rows first; supports ?limit=, ?minutes= and keyset paging.
+
+    ?after=<cursor>   only rows newer than the cursor (deltas for pollers)
+    ?before=<cursor>  rows older than the cursor (page backwards)
+    Every response carries next_cursor (newest row returned, or the given
+    ?after= cursor when nothing is new) and prev_cursor (oldest row returned).
+    ?max_points=N adds "series": [ts, value] pairs for altitude, speed and
+    battery covering the whole window, LTTB-reduced to at most N points each.
+    ?drone_id= restricts the rows (not the fleet-wide series) to one drone.
+    ?fields=a,b,.. picks the item keys (default: every column; add raw for
+    the stored payload, which is only read and decoded when asked for).
+    """
     limit_str = request.args.get("limit", "100")
     minutes = request.args.get("minutes")
+    after = request.args.get("after")
+    before = request.args.get("before")
+    max_points = parse_max_points(request.args.get("max_points"))
     try:
         n = max(1, min(int(limit_str), 1000))
     except ValueError:
         n = 100
+    if after and before:
+        return jsonify({"error": "use either 'after' or 'before', not both"}), 400
+    try:
+        key = decode_cursor(after or before) if (after or before) else None   # a rowid
+    except ValueError as e:
+        return jsonify({"error": "bad_cursor", "detail": str(e)}), 400
+    try:
+        fields = parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": "bad_fields", "detail": str(e)}), 400
 
     try:
-        con = get_db()
-        cur = con.cursor()
-        where, params = window_clause(minutes)
+        drone_id = request.args.get("drone_id")
+        where, params = window_clause(minutes, drone_id)
+        conds = [where[len("WHERE "):]] if where else []
+        if after:
+            # oldest-first so a large backlog is paged in order via next_cursor
+            conds.append("rowid > ?")
+            order = "ASC"
+        else:
+            if before:
+                conds.append("rowid < ?")
+            order = "DESC"
+        if key is not None:
+            params = (*params, key)
         sql = f"""
-            SELECT msg_id, ts, altitude, speed, battery, lat, lon, raw
+            SELECT {select_list(fields, "rowid")}
             FROM telemetry
-            {where}
-            ORDER BY inserted_at DESC
+            {("WHERE " + " AND ".join(conds)) if conds else ""}
+            ORDER BY rowid {order}
             LIMIT ?
         """
-        cur.execute(sql, (*params, n))
-        rows = cur.fetchall()
-        con.close()
-        items = []
-        for r in rows:
-            try:
-                raw_obj = json.loads(r["raw"]) if r["raw"] else None
-            except Exception:
-                raw_obj = None
-            items.append({
-                "msg_id": r["msg_id"], "ts": r["ts"],
-                "altitude": r["altitude"], "speed": r["speed"], "battery": r["battery"],
-                "lat": r["lat"], "lon": r["lon"], "raw": raw_obj
-            })
-        return jsonify({"count": len(items), "items": items}), 200
+        rows = hot.history(n, window_cutoff(minutes), drone_id,
+                           key if after else None, key if before else None, fields)
+        series = None
+        if rows is MISS or max_points:
+            with get_db() as con:
+                if rows is MISS:
+                    rows = con.execute(sql, (*params, n + 1)).fetchall()
+                if max_points:
+                    series = downsampled_series(con, minutes, max_points)
+        has_more = len(rows) > n
+        rows = rows[:n]
+        if after:
+            rows.reverse()
+        items = [project(r, fields) for r in rows]
+        newest = encode_cursor(rows[0]["rowid"]) if rows else after
+        oldest = encode_cursor(rows[-1]["rowid"]) if rows else before
+        res = {"count": len(items), "items": items, "has_more": has_more,
+               "next_cursor": newest, "prev_cursor": oldest}
+        if series is not None:
+            res["series"] = series
+        return jsonify(res), 200
     except sqlite3.OperationalError as e:
         return jsonify({"error": "db_not_initialized", "detail": str(e)}), 500
 
+# --- Streaming export ---
+EXPORT_COLUMNS = ["msg_id", "drone_id", "ts", "altitude", "speed", "battery", "lat", "lon"]
+EXPORT_FETCH_ROWS = 2000     # rows pulled from the cursor per chunk
+
+def export_chunks(sql, params, fmt):
+    """Yield encoded text chunks for the rows of `sql`, EXPORT_FETCH_ROWS at a time."""
+    buf = io.StringIO()
+    writer = csv.writer(buf) if fmt == "csv" else None
+    if writer:
+        writer.writerow(EXPORT_COLUMNS)
+    with get_db() as con:
+        cur = con.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(EXPORT_FETCH_ROWS)
+            if not rows:
+                break
+            if writer:
+                writer.writerows(tuple(r) for r in rows)
+            else:
+                for r in rows:
+                    buf.write(json.dumps(dict(zip(EXPORT_COLUMNS, r)), separators=(',', ':')))
+                    buf.write("\n")
+            yield buf.getvalue().encode()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+def gzip_chunks(chunks, level=6):
+    z = zlib.compressobj(level, zlib.DEFLATED, 31)   # wbits 31 => gzip container
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
+
 @app.route('/export', methods=['GET'])
 def export_csv():
-    limit_str = request.args.get("limit", "1000")
-    minutes = request.args.get("minutes")
+    """Stream rows as CSV (default) or NDJSON; memory use is independent of size.
+
+    ?format=csv|ndjson  ?gzip=1  ?from=<epoch> ?to=<epoch>  ?minutes=  ?drone_id=  ?limit= (optional, no cap)
+    """
+    fmt = request.args.get("format", "csv").lower()
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"error": "format must be 'csv' or 'ndjson'"}), 400
+    compress = request.args.get("gzip", "").lower() in ("1", "true", "yes")
+    limit_str = request.args.get("limit")
     try:
-        n = max(1, min(int(limit_str), 10000))
+        n = max(1, int(limit_str)) if limit_str else None
+        ts_from = float(request.args["from"]) if request.args.get("from") else None
+        ts_to = float(request.args["to"]) if request.args.get("to") else None
     except ValueError:
-        n = 1000
+        return jsonify({"error": "limit, from and to must be numbers"}), 400
 
-    con = get_db()
-    cur = con.cursor()
-    where, params = window_clause(minutes)
+    conds, params = [], []
+    cutoff = window_cutoff(request.args.get("minutes"))
+    for cond, value in (("drone_id = ?", request.args.get("drone_id") or None),
+                        ("ts >= ?", cutoff), ("ts >= ?", ts_from), ("ts < ?", ts_to)):
+        if value is not None:
+            conds.append(cond)
+            params.append(value)
     sql = f"""
-        SELECT msg_id, ts, altitude, speed, battery, lat, lon
+        SELECT {", ".join(EXPORT_COLUMNS)}
         FROM telemetry
-        {where}
-        ORDER BY inserted_at DESC
-        LIMIT ?
+        {("WHERE " + " AND ".join(conds)) if conds else ""}
+        ORDER BY inserted_at DESC, msg_id DESC
+        {"LIMIT ?" if n else ""}
     """
-    cur.execute(sql, (*params, n))
-    rows = cur.fetchall()
-    con.close()
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["msg_id", "ts", "altitude", "speed", "battery", "lat", "lon"])
-    for r in rows:
-        writer.writerow([r["msg_id"], r["ts"], r["altitude"], r["speed"], r["battery"], r["lat"], r["lon"]])
-    csv_data = output.getvalue()
-    output.close()
+    if n:
+        params.append(n)
 
-    resp = make_response(csv_data)
-    resp.headers["Content-Type"] = "text/csv"
-    resp.headers["Content-Disposition"] = f"attachment; filename=telemetry.csv"
+    body = export_chunks(sql, params, fmt)
+    filename = "telemetry.csv" if fmt == "csv" else "telemetry.ndjson"
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    if compress:
+        body = gzip_chunks(body)
+        filename += ".gz"
+        mimetype = "application/gzip"
+    resp = Response(body, mimetype=mimetype)
+    resp.headers["Content-Disposition"] = f"attachment; filename={filename}"
     return resp
 
+# --- Stats from the ingest-time rollups (see schema.py) ---
+_ROLLUP_COLS = """n, ts_min, ts_max, alt_n, alt_sum, alt_min, alt_max, spd_n, spd_sum, spd_min, spd_max,
+               bat_n, bat_sum, bat_min, bat_max, low_bat"""
+_ROLLUP_TOTALS = """sum(n) AS n, min(ts_min) AS ts_min, max(ts_max) AS ts_max,
+    sum(alt_n) AS alt_n, sum(alt_sum) AS alt_sum, min(alt_min) AS alt_min, max(alt_max) AS alt_max,
+    sum(spd_n) AS spd_n, sum(spd_sum) AS spd_sum, min(spd_min) AS spd_min, max(spd_max) AS spd_max,
+    sum(bat_n) AS bat_n, sum(bat_sum) AS bat_sum, min(bat_min) AS bat_min, max(bat_max) AS bat_max,
+    sum(low_bat) AS low_bat"""
+
+STATS_ALL_SQL = f"SELECT {_ROLLUP_TOTALS} FROM telemetry_rollup_1m"
+
+# raw rows for the partial first second, per-second buckets up to the next
+# whole minute, then per-minute buckets: at most ~120 rollup rows per query
+STATS_WINDOW_SQL = f"""
+    SELECT {_ROLLUP_TOTALS} FROM (
+        SELECT count(*) AS n, min(ts) AS ts_min, max(ts) AS ts_max,
+               count(alt) AS alt_n, sum(alt) AS alt_sum, min(alt) AS alt_min, max(alt) AS alt_max,
+               count(spd) AS spd_n, sum(spd) AS spd_sum, min(spd) AS spd_min, max(spd) AS spd_max,
+               count(bat) AS bat_n, sum(bat) AS bat_sum, min(bat) AS bat_min, max(bat) AS bat_max,
+               count(CASE WHEN bat < {LOW_BATTERY_PCT} THEN 1 END) AS low_bat
+        FROM (
+            SELECT ts,
+                   CASE WHEN typeof(altitude) IN ('integer','real') THEN altitude END AS alt,
+                   CASE WHEN typeof(speed) IN ('integer','real') THEN speed END AS spd,
+                   CASE WHEN typeof(battery) IN ('integer','real') THEN battery END AS bat
+            FROM telemetry WHERE ts >= :cutoff AND ts < :second
+        )
+        UNION ALL
+        SELECT {_ROLLUP_COLS} FROM telemetry_rollup_1s WHERE bucket >= :second AND bucket < :minute
+        UNION ALL
+        SELECT {_ROLLUP_COLS} FROM telemetry_rollup_1m WHERE bucket >= :minute
+    )
+"""
+
+# the latest limit seconds of each drone's path
+PATH_SQL = """
+    SELECT drone_id, lat, lon FROM (
+        SELECT drone_id, bucket, lat, lon,
+               row_number() OVER (PARTITION BY drone_id ORDER BY bucket DESC) AS rn
+        FROM telemetry_path_1s WHERE bucket >= ?
+    )
+    WHERE rn <= ?
+    ORDER BY drone_id, bucket
+"""
+
+def compute_stats(con, minutes, limit_cap=2000, include_path=True, max_points=None):
+    """KPI dict for the last N minutes (None => all), from the hot window or the rollup tables.
+
+    "paths" holds one path per drone. With max_points each covers the whole
+    window and together they have at most max_points positions; otherwise
+    each is the drone's latest limit_cap seconds.
+    """
+    cutoff = window_cutoff(minutes)
+    res = hot.stats(cutoff, limit_cap if include_path and not max_points else None)
+    if res is not MISS:
+        if include_path and max_points and res["count"]:
+            res["paths"] = downsampled_path(con, minutes, max_points)
+        return res
+    if cutoff is None:
+        row = con.execute(STATS_ALL_SQL).fetchone()
+        first_bucket = 0
+    else:
+        second = math.ceil(cutoff)
+        minute = math.ceil(second / 60) * 60
+        row = con.execute(STATS_WINDOW_SQL,
+                          {"cutoff": cutoff, "second": second, "minute": minute}).fetchone()
+        first_bucket = second
+    count = row["n"] or 0
+    if not count:
+        return {"count": 0, "message": "no data"}
+
+    now = time.time()
+
+    def agg(prefix):
+        n = row[f"{prefix}_n"]
+        if not n: return {"avg": None, "min": None, "max": None}
+        return {"avg": row[f"{prefix}_sum"]/n, "min": row[f"{prefix}_min"], "max": row[f"{prefix}_max"]}
+
+    latest_ts = row["ts_max"]
+    res = {
+        "count": count,
+        "time": {
+            "latest_ts": latest_ts,
+            "earliest_ts": row["ts_min"],
+            "last_seen_secs_ago": (now - latest_ts) if latest_ts is not None else None
+        },
+        "altitude": agg("alt"),
+        "speed": agg("spd"),
+        "battery": agg("bat"),
+        "low_battery_rate": (row["low_bat"]/count)*100.0,
+    }
+    if include_path and max_points:
+        res["paths"] = downsampled_path(con, minutes, max_points)
+    elif include_path:
+        res["paths"] = group_paths(con.execute(PATH_SQL, (first_bucket, limit_cap)).fetchall())
+    return res
+
 @app.route('/stats', methods=['GET'])
 def stats():
-    """KPIs over recent history; supports ?minutes= (optional) and ?limit= cap."""
+    """KPIs over recent history; supports ?minutes= (optional) and ?limit= cap.
+
+    Aggregates come from the per-second/per-minute rollup tables, so the cost
+    does not grow with the number of raw rows in the window. "paths" holds
+    one {"drone_id", "path"} per drone, each the drone's latest position of
+    each second; ?limit= caps the seconds per drone. Use ?max_points=
+    instead to get the whole window's paths, Douglas-Peucker simplified to
+    that many points in total.
+    """
     minutes = request.args.get("minutes")
     limit_str = request.args.get("limit", "2000")
     try:
         limit_cap = max(1, min(int(limit_str), 5000))
     except ValueError:
         limit_cap = 2000
+    max_points = parse_max_points(request.args.get("max_points"))
 
-    con = get_db()
-    cur = con.cursor()
-    where, params = window_clause(minutes)
-    sql = f"""
-        SELECT ts, altitude, speed, battery, lat, lon
-        FROM telemetry
-        {where}
-        ORDER BY inserted_at DESC
-        LIMIT ?
-    """
-    cur.execute(sql, (*params, limit_cap))
-    rows = cur.fetchall()
-    con.close()
+    with get_db() as con:
+        res = compute_stats(con, minutes, limit_cap, max_points=max_points)
+    return jsonify(res), 200
 
-    if not rows:
-        return jsonify({"count": 0, "message": "no data"}), 200
+# --- Live push: Server-Sent Events ---
+# One feed thread tails the telemetry table for every open dashboard. It
+# checks PRAGMA data_version (which only changes when another connection
+# commits), so when nothing is ingested it costs one pragma per poll for the
+# whole server, not a query per client. Each event is serialised once and
+# shared by all subscribers. The thread exits when the last subscriber leaves.
+FEED_POLL_SECS = 0.5
+FEED_HEARTBEAT_SECS = 15
+FEED_MAX_ROWS = 1000        # per event; also caps the Last-Event-ID backlog
+FEED_SUB_QUEUE = 256        # pending events per subscriber before it is dropped
 
-    now = time.time()
-    ts_vals, alts, spds, bats, coords = [], [], [], [], []
-    low_bat = 0
-    for r in rows:
-        ts = r["ts"]; alt = r["altitude"]; spd = r["speed"]; bat = r["battery"]
-        lat = r["lat"]; lon = r["lon"]
-        if ts is not None: ts_vals.append(ts)
-        if isinstance(alt, (int, float)): alts.append(alt)
-        if isinstance(spd, (int, float)): spds.append(spd)
-        if isinstance(bat, (int, float)):
-            bats.append(bat)
-            if bat < 20: low_bat += 1
-        if lat is not None and lon is not None:
-            coords.append((lat, lon))
-
-    def agg(arr):
-        if not arr: return {"avg": None, "min": None, "max": None}
-        return {"avg": sum(arr)/len(arr), "min": min(arr), "max": max(arr)}
+FEED_ROWS_SQL = """
+    SELECT rowid, msg_id, drone_id, ts, altitude, speed, battery, lat, lon, inserted_at
+    FROM telemetry
+    WHERE rowid > ?
+    ORDER BY rowid
+    LIMIT ?
+"""
 
-    res = {
-        "count": len(rows),
-        "time": {
-            "latest_ts": max(ts_vals) if ts_vals else None,
-            "earliest_ts": min(ts_vals) if ts_vals else None,
-            "last_seen_secs_ago": (now - max(ts_vals)) if ts_vals else None
-        },
-        "altitude": agg(alts),
-        "speed": agg(spds),
-        "battery": agg(bats),
-        "low_battery_rate": (low_bat/len(rows))*100.0 if rows else 0.0,
-        "path_sample": coords[::-1]
-    }
-    return jsonify(res), 200
+def sse_event(event, data, event_id=None):
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+def feed_row(r):
+    return {"msg_id": r["msg_id"], "drone_id": r["drone_id"], "ts": r["ts"],
+            "altitude": r["altitude"], "speed": r["speed"], "battery": r["battery"],
+            "lat": r["lat"], "lon": r["lon"]}
+
+class Subscriber:
+    def __init__(self, minutes):
+        self.minutes = minutes
+        self.queue = queue.Queue(maxsize=FEED_SUB_QUEUE)
+        self.closed = False
+
+    def push(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.closed = True   # too slow; EventSource reconnects with Last-Event-ID
+
+class TelemetryFeed:
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self._subs = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _connect(self):
+        con = sqlite3.connect(self.db_file, timeout=10)
+        con.row_factory = sqlite3.Row
+        con.execute("PRAGMA query_only=ON")
+        return con
+
+    def subscribe(self, minutes, last_event_id=None):
+        sub = Subscriber(minutes)
+        if last_event_id is not None:
+            # resume after a reconnect: replay what the client missed
+            con = self._connect()
+            try:
+                rows = con.execute(FEED_ROWS_SQL, (last_event_id, FEED_MAX_ROWS)).fetchall()
+            finally:
+                con.close()
+            if rows:
+                sub.push(sse_event("telemetry", {"rows": [feed_row(r) for r in rows]}, rows[-1]["rowid"]))
+        with self._lock:
+            self._subs.add(sub)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="airlock-feed", daemon=True)
+                self._thread.start()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subs.discard(sub)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subs)
+
+    def _run(self):
+        con = self._connect()
+        try:
+            last_rowid = con.execute("SELECT coalesce(max(rowid), 0) FROM telemetry").fetchone()[0]
+            version = None
+            while True:
+                with self._lock:
+                    if not self._subs:
+                        self._thread = None
+                        return
+                    subs = list(self._subs)
+                v = con.execute("PRAGMA data_version").fetchone()[0]
+                if v != version:
+                    version = v
+                    rows = con.execute(FEED_ROWS_SQL, (last_rowid, FEED_MAX_ROWS)).fetchall()
+                    if rows:
+                        last_rowid = rows[-1]["rowid"]
+                        event = sse_event("telemetry", {"rows": [feed_row(r) for r in rows]}, last_rowid)
+                        stats_events = {}
+                        for sub in subs:
+                            if sub.minutes not in stats_events:
+                                stats_events[sub.minutes] = sse_event(
+                                    "stats", compute_stats(con, sub.minutes, include_path=False))
+                            sub.push(event)
+                            sub.push(stats_events[sub.minutes])
+                        if len(rows) == FEED_MAX_ROWS:
+                            version = None   # more pending; don't wait for the next commit
+                            continue
+                time.sleep(FEED_POLL_SECS)
+        except Exception as e:
+            print("Telemetry feed error:", e)
+            with self._lock:
+                self._thread = None
+                for sub in self._subs:
+                    sub.closed = True
+        finally:
+            con.close()
+
+feed = None             # TelemetryFeed, set by create_app()
+
+@app.route('/events', methods=['GET'])
+def events():
+    """SSE stream: 'telemetry' events carry new rows, 'stats' events the KPIs for ?minutes=."""
+    minutes = request.args.get("minutes")
+    last_id = request.headers.get("Last-Event-ID")
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        last_id = None
+    sub = feed.subscribe(minutes, last_id)
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not sub.closed:
+                try:
+                    yield sub.queue.get(timeout=FEED_HEARTBEAT_SECS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            feed.unsubscribe(sub)
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- Fleet: latest state per drone, kept in memory ---
+# Bootstrapped with one indexed probe per drone on idx_telemetry_drone_ts,
+# then brought up to date by tailing new rowids whenever PRAGMA data_version
+# says another connection committed, so /fleet costs O(drones) per request.
+FLEET_STALE_SECS = float(os.environ.get("AIRLOCK_FLEET_STALE_SECS", "30"))   # online if seen within
+
+FLEET_LATEST_SQL = """
+    SELECT rowid, msg_id, drone_id, ts, altitude, speed, battery, lat, lon
+    FROM telemetry
+    WHERE drone_id {} ?
+    ORDER BY ts DESC
+    LIMIT 1
+"""
+
+class FleetState:
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self._con = None
+        self._version = None
+        self._last_rowid = 0
+        self._drones = {}   # drone_id (None for rows from before fleets) -> feed_row() dict
+
+    def _bootstrap(self, con):
+        self._last_rowid = con.execute("SELECT coalesce(max(rowid), 0) FROM telemetry").fetchone()[0]
+        # skip-scan the distinct drone ids instead of grouping every row
+        drone_id = con.execute("SELECT min(drone_id) FROM telemetry").fetchone()[0]
+        while drone_id is not None:
+            self._update(con.execute(FLEET_LATEST_SQL.format("="), (drone_id,)).fetchone())
+            drone_id = con.execute("SELECT min(drone_id) FROM telemetry WHERE drone_id > ?",
+                                   (drone_id,)).fetchone()[0]
+        self._update(con.execute(FLEET_LATEST_SQL.format("IS"), (None,)).fetchone())
+
+    def _update(self, r):
+        if r is None:
+            return
+        cur = self._drones.get(r["drone_id"])
+        if cur is None or r["ts"] >= cur["ts"]:   # late arrivals never replace a newer reading
+            self._drones[r["drone_id"]] = feed_row(r)
+
+    def refresh(self):
+        with self._lock:
+            if self._con is None:
+                con = sqlite3.connect(self.db_file, timeout=10, check_same_thread=False)
+                con.row_factory = sqlite3.Row
+                con.execute("PRAGMA query_only=ON")
+                self._bootstrap(con)
+                self._con = con
+                self._version = con.execute("PRAGMA data_version").fetchone()[0]
+                return
+            v = self._con.execute("PRAGMA data_version").fetchone()[0]
+            if v == self._version:
+                return
+            self._version = v
+            while True:
+                rows = self._con.execute(FEED_ROWS_SQL, (self._last_rowid, FEED_MAX_ROWS)).fetchall()
+                for r in rows:
+                    self._update(r)
+                if rows:
+                    self._last_rowid = rows[-1]["rowid"]
+                if len(rows) < FEED_MAX_ROWS:
+                    return
+
+    def snapshot(self, stale_secs=FLEET_STALE_SECS):
+        self.refresh()
+        now = time.time()
+        with self._lock:
+            drones = [dict(d) for d in self._drones.values()]
+        for d in drones:
+            d["last_seen_secs_ago"] = now - d["ts"] if isinstance(d["ts"], (int, float)) else None
+            d["online"] = d["last_seen_secs_ago"] is not None and d["last_seen_secs_ago"] <= stale_secs
+        drones.sort(key=lambda d: (d["drone_id"] is None, d["drone_id"] or ""))
+        return {"count": len(drones), "online": sum(d["online"] for d in drones),
+                "stale_secs": stale_secs, "drones": drones}
+
+fleet = None            # FleetState, set by create_app()
+
+@app.route('/fleet', methods=['GET'])
+def fleet_route():
+    """Latest reading of every drone, with last_seen_secs_ago and online (?stale_secs= overrides)."""
+    try:
+        stale = float(request.args.get("stale_secs", FLEET_STALE_SECS))
+    except ValueError:
+        return jsonify({"error": "stale_secs must be a number"}), 400
+    try:
+        return jsonify(fleet.snapshot(stale)), 200
+    except sqlite3.OperationalError as e:
+        return jsonify({"error": "db_not_initialized", "detail": str(e)}), 500
+
+# --- Hot window: the most recent telemetry, in memory ---
+# Nearly every dashboard query covers the last few minutes. HotWindow holds
+# the newest rows (in rowid, i.e. commit, order) as array-backed columns,
+# tailed from SQLite the same way as the SSE feed, and /last, /history and
+# /stats are answered from it whenever the window is fully inside; anything
+# else goes to SQLite. A row is stored at most MAX_SKEW_SECONDS after its
+# ts, so a ts window starting at `cutoff` is complete once every row
+# inserted since cutoff - MAX_SKEW_SECONDS is held. Writers stamp
+# inserted_at independently, so it is only nearly sorted by rowid; the
+# window keeps a running maximum of it to bisect and evict on. For /stats the rows are
+# also folded into per-second aggregates (an in-memory telemetry_rollup_1s),
+# so a window costs one step per second rather than per row.
+HOT_WINDOW_SECS = float(os.environ.get("AIRLOCK_HOT_WINDOW_SECS", "3600"))   # 0 = off
+HOT_MAX_ROWS = int(os.environ.get("AIRLOCK_HOT_MAX_ROWS", "200000"))
+HOT_COMPACT_ROWS = 4096      # dead rows at the front before the columns are shifted
+
+HOT_BOOT_SQL = """
+    SELECT rowid, msg_id, drone_id, ts, altitude, speed, battery, lat, lon, inserted_at
+    FROM telemetry
+    WHERE rowid >= ?
+    ORDER BY rowid DESC
+    LIMIT ?
+"""
+_HOT_NUM_COLS = ("ts", "altitude", "speed", "battery", "lat", "lon")
+_HOT_INT_COLS = ("altitude", "speed", "battery")   # INTEGER affinity: integral values read back as int
+MISS = object()
+
+def _hot_num(v):
+    return float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else math.nan
+
+def _hot_exact(v, num):
+    # False for values the float column cannot give back: text, blobs, ints beyond 2**53
+    return v is None or num == v
+
+def _next_up(x):
+    """Smallest float above x, i.e. math.nextafter(x, math.inf), which needs Python 3.9."""
+    if x != x or x == math.inf:
+        return x
+    if x == 0.0:
+        return 5e-324
+    bits = struct.unpack("<q", struct.pack("<d", x))[0]
+    return struct.unpack("<d", struct.pack("<q", bits + (1 if x > 0 else -1)))[0]
+
+def _hot_value(v, as_int=False):
+    if v != v:
+        return None   # NaN marks NULL / non-numeric
+    return int(v) if as_int and v.is_integer() else v
+
+class _HotSecond:
+    """One second of ts: rollup-style aggregates plus the values, for a window's partial first second."""
+    __slots__ = ("n", "ts_min", "ts_max", "metrics", "low_bat", "pos", "rows")
+
+    def __init__(self):
+        self.n = 0
+        self.ts_min = math.inf
+        self.ts_max = -math.inf
+        self.metrics = {m: [0, 0.0, math.inf, -math.inf] for m in _HOT_INT_COLS}   # n, sum, min, max
+        self.low_bat = 0
+        self.pos = {}     # drone_id -> (ts, lat, lon) of its latest sample with a position
+        self.rows = {c: array("d") for c in ("ts", *_HOT_INT_COLS)}
+
+    def add(self, ts, values, drone_id, lat, lon):
+        self.n += 1
+        self.ts_min = min(self.ts_min, ts)
+        self.ts_max = max(self.ts_max, ts)
+        self.rows["ts"].append(ts)
+        for m, v in zip(_HOT_INT_COLS, values):
+            self.rows[m].append(v)
+            if v == v:
+                _hot_fold(self.metrics[m], 1, v, v, v)
+        if values[2] < LOW_BATTERY_PCT:   # False for NaN
+            self.low_bat += 1
+        if lat == lat and lon == lon:
+            pos = self.pos.get(drone_id)
+            if pos is None or ts >= pos[0]:
+                self.pos[drone_id] = (ts, lat, lon)
+
+def _hot_fold(agg, n, total, lo, hi):
+    agg[0] += n
+    agg[1] += total
+    agg[2] = min(agg[2], lo)
+    agg[3] = max(agg[3], hi)
+
+class HotWindow:
+    def __init__(self, db_file, window_secs=HOT_WINDOW_SECS, max_rows=HOT_MAX_ROWS, skew=MAX_SKEW_SECONDS):
+        self.db_file = db_file
+        self.window_secs = window_secs
+        self.max_rows = max(1, int(max_rows))
+        self.skew = skew
+        self.complete_from = math.inf   # every row with inserted_at >= this is held
+        self.rowid_floor = None         # every row with rowid > this is held
+        self.counters = {name: {"hit": 0, "miss": 0} for name in ("last", "history", "stats")}
+        self._lock = threading.Lock()
+        self._con = None
+        self._version = None
+        self._last_rowid = 0
+        self._start = 0                 # rows before this index have been evicted
+        self._cols = {c: array("d") for c in _HOT_NUM_COLS}
+        self._rowid = array("q")
+        self._ins_max = array("d")      # running max of inserted_at: >= that of every earlier held row
+        self._ins_seed = -math.inf      # inserted_at bound for the rows not loaded at bootstrap
+        self._msg_id = []
+        self._drone_id = []
+        self._odd = {}                  # rowid -> {column: stored value} the float columns cannot hold
+        self._seconds = {}              # int(ts) -> _HotSecond
+        self._seconds_from = None       # seconds below this have been dropped
+
+    # --- maintenance (lock held) ---
+    def _append(self, r):
+        odd = None
+        for c in _HOT_NUM_COLS:
+            num = _hot_num(r[c])
+            self._cols[c].append(num)   # NaN (or the nearest float) for aggregates, as SQLite counts it
+            if not _hot_exact(r[c], num):
+                odd = odd or {}
+                odd[c] = r[c]
+        if odd:
+            self._odd[r["rowid"]] = odd
+        self._rowid.append(r["rowid"])
+        ins = _hot_num(r["inserted_at"])
+        prev = self._ins_max[-1] if self._ins_max else self._ins_seed
+        self._ins_max.append(ins if ins > prev else prev)
+        self._msg_id.append(r["msg_id"])
+        self._drone_id.append(r["drone_id"])
+        ts = self._cols["ts"][-1]
+        if ts == ts:
+            sec = self._seconds.get(int(ts))
+            if sec is None:
+                sec = self._seconds[int(ts)] = _HotSecond()
+            sec.add(ts, [self._cols[m][-1] for m in _HOT_INT_COLS], r["drone_id"] or None,
+                    self._cols["lat"][-1], self._cols["lon"][-1])
+
+    def _columns(self):
+        return (*self._cols.values(), self._rowid, self._ins_max, self._msg_id, self._drone_id)
+
+    def _evict(self, now):
+        ins_max = self._ins_max
+        end = len(ins_max)
+        start = max(self._start, end - self.max_rows,
+                    bisect_left(ins_max, now - self.window_secs - self.skew, self._start, end))
+        if start > self._start:
+            self.complete_from = max(self.complete_from, _next_up(ins_max[start - 1]))
+            self.rowid_floor = max(self.rowid_floor, self._rowid[start - 1])
+            self._start = start
+            for rowid in [k for k in self._odd if k <= self.rowid_floor]:
+                del self._odd[rowid]
+        if self.complete_from != math.inf:
+            # the earliest window that still fits starts in this second
+            first = math.floor(self.complete_from + self.skew)
+            if self._seconds_from is None or first > self._seconds_from:
+                for k in [k for k in self._seconds if k < first]:
+                    del self._seconds[k]
+                self._seconds_from = first
+        if self._start >= HOT_COMPACT_ROWS and self._start * 2 >= end:
+            for col in self._columns():
+                del col[:self._start]
+            self._start = 0
+
+    def _refresh(self):
+        now = time.time()
+        if self._con is None:
+            con = sqlite3.connect(self.db_file, timeout=10, check_same_thread=False)
+            con.row_factory = sqlite3.Row
+            con.execute("PRAGMA query_only=ON")
+            boot_from = now - self.window_secs - self.skew
+            con.execute("BEGIN")   # one snapshot for the rows and the rowid to tail from
+            try:
+                self._last_rowid = con.execute("SELECT coalesce(max(rowid), 0) FROM telemetry").fetchone()[0]
+                # every row below the first one inserted since boot_from is older than boot_from
+                first = con.execute("SELECT min(rowid) FROM telemetry WHERE inserted_at >= ?",
+                                    (boot_from,)).fetchone()[0]
+                rows = [] if first is None else con.execute(HOT_BOOT_SQL, (first, self.max_rows)).fetchall()
+                skipped = None
+                if len(rows) == self.max_rows:
+                    skipped = con.execute("SELECT max(inserted_at) FROM telemetry WHERE rowid >= ? AND rowid < ?",
+                                          (first, rows[-1]["rowid"])).fetchone()[0]
+                self._version = con.execute("PRAGMA data_version").fetchone()[0]
+            finally:
+                con.execute("COMMIT")
+            if first is None:
+                self.rowid_floor = self._last_rowid
+            else:
+                self.rowid_floor = (rows[-1]["rowid"] if len(rows) == self.max_rows else first) - 1
+            self.complete_from = (boot_from if skipped is None
+                                  else max(boot_from, _next_up(skipped)))
+            self._ins_seed = self.complete_from
+            for r in reversed(rows):
+                self._append(r)
+            self._con = con
+        else:
+            v = self._con.execute("PRAGMA data_version").fetchone()[0]
+            while v != self._version:
+                rows = self._con.execute(FEED_ROWS_SQL, (self._last_rowid, FEED_MAX_ROWS)).fetchall()
+                if rows:
+                    self._last_rowid = rows[-1]["rowid"]
+                for r in rows:
+                    self._append(r)
+                if len(rows) < FEED_MAX_ROWS:
+                    self._version = v
+        self._evict(now)
+
+    def _fits(self, cutoff):
+        return cutoff is not None and cutoff - self.skew >= self.complete_from
+
+    def _count(self, name, result):
+        self.counters[name]["miss" if result is MISS else "hit"] += 1
+        return result
+
+    def _row(self, i):
+        c = self._cols
+        row = {"msg_id": self._msg_id[i], "drone_id": self._drone_id[i],
+               "ts": _hot_value(c["ts"][i]),
+               "altitude": _hot_value(c["altitude"][i], True),
+               "speed": _hot_value(c["speed"][i], True),
+               "battery": _hot_value(c["battery"][i], True),
+               "lat": _hot_value(c["lat"][i]), "lon": _hot_value(c["lon"][i]),
+               "rowid": self._rowid[i]}
+        odd = self._odd.get(row["rowid"])
+        if odd:
+            row.update(odd)   # exactly what SQLite returns for this row
+        return row
+
+    def _bisect(self, rowid, right=False):
+        """Index of the first row with rowid >= the given one (> if right)."""
+        return (bisect_right if right else bisect_left)(self._rowid, rowid, self._start, len(self._rowid))
+
+    def _newest(self, cutoff, drone_id, limit, before=None):
+        """Up to `limit` matching row indexes, newest first, or MISS if SQLite may hold more."""
+        ts, ins_max, drones = self._cols["ts"], self._ins_max, self._drone_id
+        floor = cutoff - self.skew if cutoff is not None else None
+        out = []
+        i = (self._bisect(before) if before is not None else len(self._msg_id)) - 1
+        while i >= self._start and len(out) < limit:
+            if floor is not None and ins_max[i] < floor:
+                return out   # no row from here back can be in the window, held or not
+            if (cutoff is None or ts[i] >= cutoff) and (not drone_id or drones[i] == drone_id):
+                out.append(i)
+            i -= 1
+        return out if len(out) == limit or self._fits(cutoff) else MISS
+
+    # --- queries ---
+    def last(self, cutoff=None, drone_id=None, fields=()):
+        """Newest row dict in the window (None if it is empty), or MISS."""
+        with self._lock:
+            if self.window_secs <= 0 or "raw" in fields:
+                return self._count("last", MISS)
+            self._refresh()
+            found = self._newest(cutoff, drone_id, 1)
+            if found is not MISS:
+                found = self._row(found[0]) if found else None
+            return self._count("last", found)
+
+    def history(self, n, cutoff=None, drone_id=None, after=None, before=None, fields=()):
+        """Up to n + 1 row dicts in /history order, or MISS."""
+        with self._lock:
+            if self.window_secs <= 0 or "raw" in fields:
+                return self._count("history", MISS)
+            self._refresh()
+            if after is None:
+                found = self._newest(cutoff, drone_id, n + 1, before)
+                return self._count("history", found if found is MISS else [self._row(i) for i in found])
+            if after < self.rowid_floor:
+                return self._count("history", MISS)
+            ts, drones, out = self._cols["ts"], self._drone_id, []
+            for i in range(self._bisect(after, right=True), len(self._msg_id)):
+                if (cutoff is None or ts[i] >= cutoff) and (not drone_id or drones[i] == drone_id):
+                    out.append(self._row(i))
+                    if len(out) > n:
+                        break
+            return self._count("history", out)
+
+    def stats(self, cutoff, path_limit=None):
+        """compute_stats() result for the window starting at cutoff, or MISS."""
+        with self._lock:
+            if self.window_secs <= 0:
+                return self._count("stats", MISS)
+            self._refresh()
+            if not self._fits(cutoff):
+                return self._count("stats", MISS)
+            # like STATS_WINDOW_SQL: the rows of the partial first second, then whole seconds
+            second = math.ceil(cutoff)
+            totals = {m: [0, 0.0, math.inf, -math.inf] for m in _HOT_INT_COLS}
+            n, ts_min, ts_max, low_bat = 0, math.inf, -math.inf, 0
+            partial = self._seconds.get(math.floor(cutoff)) if second != cutoff else None
+            if partial is not None:
+                rows = partial.rows
+                for i, t in enumerate(rows["ts"]):
+                    if t < cutoff:
+                        continue
+                    n += 1
+                    ts_min, ts_max = min(ts_min, t), max(ts_max, t)
+                    for m in _HOT_INT_COLS:
+                        v = rows[m][i]
+                        if v == v:
+                            _hot_fold(totals[m], 1, v, v, v)
+                    if rows["battery"][i] < LOW_BATTERY_PCT:
+                        low_bat += 1
+            seconds = [self._seconds[k] for k in sorted(k for k in self._seconds if k >= second)]
+            for sec in seconds:
+                n += sec.n
+                ts_min, ts_max = min(ts_min, sec.ts_min), max(ts_max, sec.ts_max)
+                low_bat += sec.low_bat
+                for m, agg in sec.metrics.items():
+                    _hot_fold(totals[m], *agg)
+            if not n:
+                return self._count("stats", {"count": 0, "message": "no data"})
+
+            def agg(m):
+                cnt, total, lo, hi = totals[m]
+                if not cnt:
+                    return {"avg": None, "min": None, "max": None}
+                return {"avg": total / cnt, "min": _hot_value(lo, True), "max": _hot_value(hi, True)}
+
+            res = {
+                "count": n,
+                "time": {
+                    "latest_ts": ts_max,
+                    "earliest_ts": ts_min,
+                    "last_seen_secs_ago": time.time() - ts_max,
+                },
+                "altitude": agg("altitude"),
+                "speed": agg("speed"),
+                "battery": agg("battery"),
+                "low_battery_rate": (low_bat / n) * 100.0,
+            }
+            if path_limit:
+                # each drone's latest position of each whole second, as PATH_SQL reads it
+                paths = {}
+                for sec in seconds:
+                    for drone_id, (_, lat, lon) in sec.pos.items():
+                        paths.setdefault(drone_id, []).append((lat, lon))
+                res["paths"] = [{"drone_id": d, "path": paths[d][-path_limit:]}
+                                for d in sorted(paths, key=lambda d: d or "")]
+            return self._count("stats", res)
+
+    def info(self):
+        with self._lock:
+            held = len(self._msg_id) - self._start
+            counters = {k: dict(v) for k, v in self.counters.items()}
+            for v in counters.values():
+                total = v["hit"] + v["miss"]
+                v["hit_rate"] = v["hit"] / total if total else None
+            return {"enabled": self.window_secs > 0, "window_secs": self.window_secs,
+                    "max_rows": self.max_rows, "rows": held,
+                    "complete_secs": (time.time() - self.complete_from
+                                      if self.complete_from != math.inf else None),
+                    "counters": counters}
+
+hot = None              # HotWindow, set by create_app()
+
+@app.route('/hot/stats')
+def hot_stats():
+    """Hot-window size, how far back it is complete, and hit/miss counters per API."""
+    return jsonify(hot.info()), 200
+
+# --- Metrics: ingest stages, DB writer and per-route latency (Prometheus text) ---
+POOL_CONNECTIONS = metrics.gauge("airlock_db_pool_connections", "Pooled read connections.", ("state",))
+POOL_CONNECTIONS.labels("open").set_function(lambda: db_pool.stats()["open"])
+POOL_CONNECTIONS.labels("in_use").set_function(lambda: db_pool.stats()["in_use"])
+metrics.gauge("airlock_sse_subscribers", "Open /events streams.").set_function(lambda: feed.subscriber_count())
+metrics.gauge("airlock_hot_window_rows", "Rows held by the in-memory hot window.").set_function(
+    lambda: hot.info()["rows"])
+
+@app.route('/metrics')
+def metrics_route():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 # --- Dashboard (map left; bar chart under map; NEW scatter under bar; line charts right) ---
 DASH_HTML = """<!doctype html>
@@ -296,7 +1352,7 @@ DASH_HTML = """<!doctype html>
 </head>
 <body>
   <h1>AirLock Dashboard</h1>
-  <p class="muted">Live telemetry from <code>airlock.db</code> — charts, KPIs, map & table. Auto-refresh every 3s.</p>
+  <p class="muted">Live telemetry from <code>airlock.db</code> — charts, KPIs, map & table. Live updates pushed by the server.</p>
 
   <div class="row">
     <label>Minutes:
@@ -307,6 +1363,11 @@ DASH_HTML = """<!doctype html>
         <option value="60">60m</option>
       </select>
     </label>
+    <label>Drone:
+      <select id="drone" onchange="loadAll(true)">
+        <option value="" selected>All drones</option>
+      </select>
+    </label>
     <label>Limit: <input id="limit" type="number" min="20" max="1000" value="200" /></label>
     <label>Battery alert (%): <input id="batThresh" type="number" min="1" max="100" value="20" style="width:80px;" /></label>
     <button onclick="loadAll(true)">Refresh</button>
@@ -360,8 +1421,14 @@ DASH_HTML = """<!doctype html>
   </table>
 
 <script>
-let altChart, spdChart, batChart, batDistChart, spdAltChart, map, pathLine, droneMarker, droneCircle;
-let t=3;
+let altChart, spdChart, batChart, batDistChart, spdAltChart, map, droneMarker, droneCircle;
+// client-side window: rows oldest -> newest, one map path per drone, the drone the marker follows
+const state = { items: [], paths: {}, focus: null, cursor: null };
+const MAX_PATH = 5000;     // positions kept per drone
+const PATH_COLORS = ['#2563eb', '#dc2626', '#16a34a', '#d97706', '#7c3aed', '#0891b2', '#db2777', '#4b5563'];
+let pathLines = {}, headMarkers = {};
+const MAP_POINTS = 1500;   // whole-window path, simplified server-side
+let es = null, pollTimer = null;
 
 function fmt(x, d=2){ return (typeof x==='number' && !isNaN(x)) ? x.toFixed(d) : (x ?? '-') }
 function fmtInt(x){ return (typeof x==='number' && !isNaN(x)) ? Math.round(x) : (x ?? '-') }
@@ -445,16 +1512,45 @@ function ensureMap(){
   if (map) return map;
   map = L.map('map').setView([12.9716, 77.5946], 12);
   L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', { maxZoom: 19 }).addTo(map);
-  pathLine = L.polyline([], { color: '#3388ff' }).addTo(map);
   return map;
 }
 
-function updateMap(coords){
+// paths are keyed by drone_id ('' for rows from before fleets)
+function pathKey(droneId){ return droneId ?? ''; }
+
+function pathColor(key){
+  let h = 0;
+  for (const c of key) h = (h * 31 + c.charCodeAt(0)) >>> 0;
+  return PATH_COLORS[h % PATH_COLORS.length];
+}
+
+// one polyline and head dot per drone; the big marker sits on state.focus
+function updateMap(paths){
   ensureMap();
-  const clean = coords.filter(p => Array.isArray(p) && p.length===2 && isFinite(p[0]) && isFinite(p[1]));
-  pathLine.setLatLngs(clean);
-  if (clean.length) {
-    const latest = clean[clean.length - 1];
+  Object.keys(pathLines).forEach(k => {
+    if (k in paths) return;
+    map.removeLayer(pathLines[k]);
+    map.removeLayer(headMarkers[k]);
+    delete pathLines[k];
+    delete headMarkers[k];
+  });
+  const bounds = L.latLngBounds([]);
+  let focus = [];
+  Object.entries(paths).forEach(([k, coords]) => {
+    const clean = coords.filter(p => Array.isArray(p) && p.length===2 && isFinite(p[0]) && isFinite(p[1]));
+    if (!pathLines[k]) {
+      const color = pathColor(k);
+      pathLines[k] = L.polyline([], { color }).addTo(map);
+      headMarkers[k] = L.circleMarker([0, 0], { radius: 5, color, fillOpacity: 0.9 }).bindTooltip(k || 'Drone');
+    }
+    pathLines[k].setLatLngs(clean);
+    if (!clean.length) return;
+    headMarkers[k].setLatLng(clean[clean.length - 1]).addTo(map);
+    bounds.extend(pathLines[k].getBounds());
+    if (k === state.focus) focus = clean;
+  });
+  if (focus.length) {
+    const latest = focus[focus.length - 1];
     const latlng = [latest[0], latest[1]];
     if (!droneMarker) {
       const droneIcon = L.divIcon({
@@ -475,7 +1571,7 @@ function updateMap(coords){
     if (follow) map.panTo(latlng, { animate: true });
   }
   const follow = document.getElementById('followToggle')?.checked;
-  if (clean.length && !follow) map.fitBounds(pathLine.getBounds(), { padding:[20,20] });
+  if (bounds.isValid() && !follow) map.fitBounds(bounds, { padding:[20,20] });
 }
 
 function locateDrone(){
@@ -488,11 +1584,12 @@ function locateDrone(){
   }
 }
 
-async function updateNowCards(minutes){
-  const last = await fetchJSON('/last' + (minutes ? ('?minutes=' + minutes) : ''));
-  if (!last || last.status === 'empty') {
+function renderLatest(last, thresh){
+  const alertBar = document.getElementById('alertBar');
+  if (!last) {
     document.getElementById('now_main').textContent = 'Latest: —';
     document.getElementById('now_meta').textContent = 'Meta: —';
+    alertBar.style.display = 'none';
     return;
   }
   const lat = last.lat, lon = last.lon;
@@ -502,11 +1599,11 @@ async function updateNowCards(minutes){
     `Alt: ${alt ?? '-'}  |  Spd: ${spd ?? '-'}  |  Bat: ${bat ?? '-'}`;
   const age = (last.ts!=null) ? (Date.now()/1000 - Number(last.ts)) : null;
   document.getElementById('now_meta').textContent =
-    `ID: ${last.msg_id || '-'}  |  @(${lat ?? '-'}, ${lon ?? '-'})  |  Age: ${age ? age.toFixed(1) : '-'}s`;
+    `Drone: ${last.drone_id ?? '-'}  |  ID: ${last.msg_id || '-'}  |  @(${lat ?? '-'}, ${lon ?? '-'})  |  Age: ${age ? age.toFixed(1) : '-'}s`;
   if (droneMarker) {
     const html = `
       <div style="min-width:200px">
-        <div><strong>Drone (latest)</strong></div>
+        <div><strong>${last.drone_id ?? 'Drone'} (latest)</strong></div>
         <div>ts: ${ts}</div>
         <div>alt: ${alt ?? '-'} | spd: ${spd ?? '-'}</div>
         <div>bat: ${bat ?? '-'}</div>
@@ -514,6 +1611,9 @@ async function updateNowCards(minutes){
       </div>`;
     droneMarker.bindPopup(html);
   }
+  // Alert bar
+  const low = (typeof last.battery==='number' && last.battery < thresh);
+  alertBar.style.display = low ? 'block' : 'none';
 }
 
 function buildBatteryDistribution(items){
@@ -530,23 +1630,17 @@ function buildBatteryDistribution(items){
   return buckets;
 }
 
-async function loadAll(force=false){
-  const minutesSel = document.getElementById('minutes').value; // "" by default (All)
-  const limit = Math.max(20, Math.min(parseInt(document.getElementById('limit').value||'200'), 1000));
-  const thresh = Math.max(1, Math.min(parseInt(document.getElementById('batThresh').value||'20'), 100));
-
-  // build query strings
-  const qs = '?limit='+limit + (minutesSel?('&minutes='+minutesSel):'');
-  document.getElementById('exportLink').href = '/export'+qs;
-
-  // fetch data
-  const [hist, stat] = await Promise.all([
-    fetchJSON('/history'+qs),
-    fetchJSON('/stats'+(minutesSel?('?minutes='+minutesSel):''))
-  ]);
+function readControls(){
+  return {
+    minutesSel: document.getElementById('minutes').value, // "" by default (All)
+    droneSel: document.getElementById('drone').value,      // "" = whole fleet
+    limit: Math.max(20, Math.min(parseInt(document.getElementById('limit').value||'200'), 1000)),
+    thresh: Math.max(1, Math.min(parseInt(document.getElementById('batThresh').value||'20'), 100))
+  };
+}
 
-  // charts (line series)
-  const items = (hist.items||[]).slice().reverse(); // oldest -> newest for lines
+function renderSeries(force, thresh){
+  const items = state.items; // oldest -> newest for lines
   const labels = items.map(it => fmt(it.ts, 3));
   const alts = items.map(it => it.altitude ?? null);
   const spds = items.map(it => it.speed ?? null);
@@ -586,8 +1680,9 @@ async function loadAll(force=false){
 
   // table (newest -> oldest)
   updateTable(items.slice().reverse(), thresh);
+}
 
-  // KPIs
+function renderKpis(stat){
   document.getElementById('k_count').textContent = fmtInt(stat.count);
   document.getElementById('k_last').textContent = fmt(stat.time?.last_seen_secs_ago, 1);
   document.getElementById('k_lowb').textContent = fmt(stat.low_battery_rate, 1);
@@ -595,23 +1690,120 @@ async function loadAll(force=false){
   document.getElementById('k_alt_avg').textContent = `${fmt(a.avg,1)} / ${fmt(a.min,1)} / ${fmt(a.max,1)}`;
   document.getElementById('k_spd_avg').textContent = `${fmt(s.avg,1)} / ${fmt(s.min,1)} / ${fmt(s.max,1)}`;
   document.getElementById('k_bat_avg').textContent = `${fmt(b.avg,1)} / ${fmt(b.min,1)} / ${fmt(b.max,1)}`;
+}
 
-  // Map & Now
-  updateMap(stat.path_sample || []);
-  await updateNowCards(minutesSel);
+// apply a 'telemetry' delta pushed by /events
+function applyRows(rows){
+  if (!rows.length) return;
+  const { minutesSel, droneSel, limit, thresh } = readControls();
+  if (droneSel) rows = rows.filter(r => r.drone_id === droneSel);
+  if (!rows.length) return;
+  rows.forEach(r => {
+    state.items.push(r);
+    if (r.lat == null || r.lon == null) return;
+    const path = state.paths[pathKey(r.drone_id)] ??= [];
+    path.push([r.lat, r.lon]);
+    if (path.length > MAX_PATH) path.splice(0, path.length - MAX_PATH);
+  });
+  if (minutesSel) {
+    const cutoff = Date.now()/1000 - parseInt(minutesSel)*60;
+    state.items = state.items.filter(it => it.ts >= cutoff);
+  }
+  if (state.items.length > limit) state.items = state.items.slice(-limit);
+  const newest = rows[rows.length - 1];
+  state.focus = pathKey(newest.drone_id);
+  renderSeries(false, thresh);
+  updateMap(state.paths);
+  renderLatest(newest, thresh);
+}
 
-  // Alert bar
-  const last = await fetchJSON('/last' + (minutesSel?('?minutes='+minutesSel):''));
-  const alertBar = document.getElementById('alertBar');
-  const low = (last && typeof last.battery==='number' && last.battery < thresh);
-  alertBar.style.display = low ? 'block' : 'none';
+function subscribe(minutesSel){
+  if (es) { es.close(); es = null; }
+  if (!window.EventSource) {
+    // no SSE support: poll for deltas only
+    if (!pollTimer) pollTimer = setInterval(pollDelta, 3000);
+    return;
+  }
+  es = new EventSource('/events' + (minutesSel ? ('?minutes=' + minutesSel) : ''));
+  es.addEventListener('telemetry', e => applyRows(JSON.parse(e.data).rows || []));
+  es.addEventListener('stats', e => renderKpis(JSON.parse(e.data)));
+}
+
+async function pollDelta(){
+  const { minutesSel, droneSel, limit } = readControls();
+  const win = (minutesSel ? ('&minutes=' + minutesSel) : '') + droneParam(droneSel);
+  const [delta, stat] = await Promise.all([
+    fetchJSON('/history?limit=' + limit + win + (state.cursor ? ('&after=' + state.cursor) : '')),
+    fetchJSON('/stats' + (minutesSel ? ('?minutes=' + minutesSel) : ''))
+  ]);
+  if (delta.next_cursor) state.cursor = delta.next_cursor;
+  applyRows((delta.items || []).slice().reverse());
+  renderKpis(stat);
 }
 
-// auto-refresh every second (cycles 3..1 then refresh)
-setInterval(()=>{
-  t = (t<=1?3:t-1);
-  if (t===3) loadAll();
-}, 1000);
+function droneParam(droneSel){ return droneSel ? ('&drone_id=' + encodeURIComponent(droneSel)) : ''; }
+
+// keep the drone selector in step with /fleet (rows from before fleets have no drone_id)
+function updateDrones(fl){
+  const sel = document.getElementById('drone');
+  const known = new Set(Array.from(sel.options).map(o => o.value));
+  (fl.drones || []).forEach(d => {
+    if (d.drone_id == null || known.has(d.drone_id)) return;
+    const opt = document.createElement('option');
+    opt.value = d.drone_id;
+    opt.textContent = d.drone_id;
+    sel.appendChild(opt);
+  });
+  Array.from(sel.options).forEach(o => {
+    const d = (fl.drones || []).find(x => x.drone_id === o.value);
+    if (d) o.textContent = d.drone_id + (d.online ? '' : ' (offline)');
+  });
+}
+
+// full snapshot (initial load / Refresh); live deltas then arrive over /events
+async function loadAll(force=false){
+  const { minutesSel, droneSel, limit, thresh } = readControls();
+
+  // build query strings
+  const qs = '?limit='+limit + (minutesSel?('&minutes='+minutesSel):'') + droneParam(droneSel);
+  document.getElementById('exportLink').href = '/export'+qs;
+
+  // fetch data (KPIs are fleet-wide; /stats has one map path per drone)
+  const [hist, stat, last, fl] = await Promise.all([
+    fetchJSON('/history'+qs),
+    fetchJSON('/stats?max_points='+MAP_POINTS+(minutesSel?('&minutes='+minutesSel):'')),
+    fetchJSON('/last?'+(minutesSel?('minutes='+minutesSel):'')+droneParam(droneSel)),
+    fetchJSON('/fleet')
+  ]);
+  updateDrones(fl);
+
+  state.items = (hist.items||[]).slice().reverse();
+  state.paths = {};
+  (stat.paths || []).forEach(p => {
+    if (!droneSel || p.drone_id === droneSel) state.paths[pathKey(p.drone_id)] = p.path.slice();
+  });
+  if (droneSel && !state.paths[droneSel]) {
+    state.paths[droneSel] = state.items.filter(it => it.lat != null && it.lon != null).map(it => [it.lat, it.lon]);
+  }
+  state.cursor = hist.next_cursor || null;
+
+  // Now: the selected drone's latest reading, or the newest of every drone's latest
+  let latest = null;
+  if (last && last.status !== 'empty') {
+    latest = droneSel ? last : (last.drones || []).reduce(
+      (a, r) => (a === null || (r.ts ?? -Infinity) > (a.ts ?? -Infinity)) ? r : a, null);
+  }
+  state.focus = latest ? pathKey(latest.drone_id) : null;
+
+  renderSeries(force, thresh);
+  renderKpis(stat);
+
+  // Map & Now
+  updateMap(state.paths);
+  renderLatest(latest, thresh);
+
+  if (force || !es) subscribe(minutesSel);
+}
 
 // initial load (force chart build)
 loadAll(true);
@@ -624,6 +1816,25 @@ loadAll(true);
 def dashboard():
     return Response(DASH_HTML, mimetype="text/html")
 
+# --- Process setup ---
+_setup_lock = threading.Lock()
+
+def create_app():
+    """Create / upgrade the schema and build this process's state; returns the app.
+
+    Only the first call does anything.
+    """
+    global crypto_batcher, db_pool, feed, fleet, hot
+    with _setup_lock:
+        if db_pool is None:
+            init_db(DB_FILE).close()   # create / upgrade schema once at startup
+            crypto_batcher = CryptoBatcher(FERNET_KEY)
+            feed = TelemetryFeed(DB_FILE)
+            fleet = FleetState(DB_FILE)
+            hot = HotWindow(DB_FILE)
+            db_pool = ReadPool(DB_FILE)   # last: it marks the setup as done
+    return app
+
 if __name__ == '__main__':
     # Change port if 5000 is busy: app.run(..., port=5050)
-    app.run(debug=True, host='127.0.0.1', port=5000)
+    create_app().run(debug=True, host='127.0.0.1', port=5000)
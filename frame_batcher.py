@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# frame_batcher.py — pack encoded readings into datagram-sized wire_format frames
+#
+# Readings are collected until one more would push the frame past the
+# plaintext budget of a datagram, or the oldest has waited max_delay; a
+# lone reading goes out unframed. The budget depends on the transport's
+# sealing overhead, so callers size it with max_plaintext(transport).
+# Used by the drone sender (app.py) and the load generator (loadgen.py).
+
+import os
+import time
+
+import wire_format
+
+MAX_DATAGRAM = int(os.environ.get("AIRLOCK_MAX_DATAGRAM", "1472"))   # 1500 MTU - IPv4/UDP headers
+
+
+def max_plaintext(transport, datagram_bytes=MAX_DATAGRAM):
+    """Largest plaintext `transport` seals into at most datagram_bytes."""
+    n = datagram_bytes
+    while n > 0 and transport.sealed_size(n) > datagram_bytes:
+        n -= 1
+    return n
+
+
+class FrameBatcher:
+    """Collects encoded readings and sends them as wire_format frames."""
+
+    def __init__(self, send, max_bytes, max_delay=0.0):
+        self.send = send
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.records = []
+        self.deadline = None
+        self.frames_sent = 0
+
+    def add(self, record):
+        sizes = [len(r) for r in self.records] + [len(record)]
+        if self.records and wire_format.frame_size(sizes) > self.max_bytes:
+            self.flush()
+        if not self.records:
+            self.deadline = time.monotonic() + self.max_delay
+        self.records.append(record)
+        if self.max_delay <= 0 or len(self.records) >= wire_format.MAX_FRAME_RECORDS:
+            self.flush()
+
+    def poll(self):
+        """Flush if the oldest reading is due; returns seconds until the next deadline."""
+        if not self.records:
+            return None
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            self.flush()
+            return None
+        return remaining
+
+    def flush(self):
+        if not self.records:
+            return
+        if len(self.records) == 1:
+            plaintext = self.records[0]   # a lone reading goes out unframed
+        else:
+            plaintext = wire_format.pack_frame(self.records)
+        self.send(plaintext)
+        self.frames_sent += 1
+        self.records = []
+        self.deadline = None
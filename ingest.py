@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+# ingest.py — the telemetry ingest pipeline shared by every transport
+#
+#   decrypt -> decode + skew check -> dedupe (replay cache) -> persist -> fan-out
+#
+# The stateless half (check_records / decode_packet) is safe to run in worker processes. The
+# stateful half lives in IngestPipeline: one replay cache, one batched
+# BatchWriter, and the fan-out to the rotating log and the latest-telemetry
+# slot (dashboards follow the database through /events). receiver_client.py
+# (asyncio UDP), receiver_workers.py (multi-process UDP) and the Flask
+# /ingest endpoint all drive the same functions.
+#
+# A process's replay cache only knows the msg_ids that process has seen.
+# What every process shares is the msg_id primary key: a record the
+# database already holds (e.g. a UDP datagram replayed through /ingest) is
+# turned down at commit and rejected as a replay there. That is why records
+# are logged and published after their batch commits (fan_out), not when
+# they are queued.
+#
+# The log and the slot each have one writer process: a log file is rotated
+# by the process that writes it, and the slot's sequence counter lives in
+# the writer. A second pipeline running alongside the receiver (the Flask
+# /ingest one) gets its own log file and does not publish to the slot.
+
+import json
+import os
+import threading
+import time
+
+import log_writer
+import metrics
+import profiling
+import wire_format
+from db_writer import BatchWriter, telemetry_row
+from latest_slot import SLOT_FILE, SlotWriter
+from replay_cache import ReplayCache
+from schema import init_db
+from transport_crypto import Transport
+
+FERNET_KEY = os.environ.get("FERNET_KEY") or b'HyMs5PCyDY5oWoEKZs98gwwU7ZKxSBrqifkQHVCHn-s='
+transport = Transport(fernet_key=FERNET_KEY)   # opens Fernet tokens and AEAD datagrams
+
+LATEST_SLOT_FILE = SLOT_FILE    # shared-memory latest telemetry (see latest_slot.py)
+LOG_FILE = "telemetry_log.txt"
+DB_FILE = "airlock.db"
+
+# Anti-replay config
+MAX_SKEW_SECONDS = 60        # reject packets older/newer than this window
+MAX_DRONE_ID_CHARS = 64
+REPLAY_MAX_ENTRIES = int(os.environ.get("AIRLOCK_REPLAY_MAX", "1000000"))  # hard memory cap
+REPLAY_SNAPSHOT_FILE = "replay_cache.json"   # survives restarts so the window stays closed
+REPLAY_SNAPSHOT_INTERVAL = 5                  # seconds between snapshots
+replay_cache = ReplayCache(MAX_SKEW_SECONDS, max_entries=REPLAY_MAX_ENTRIES)
+
+
+class Rejected(Exception):
+    """A datagram or record failed a check; str() is the reason.
+
+    `kind` is a short fixed label for the metrics (decrypt, frame, decode,
+    missing_fields, skew, drone_id).
+    """
+
+    def __init__(self, reason, kind="decode"):
+        super().__init__(reason)
+        self.kind = kind
+
+
+# --- metrics (see metrics.py); one set per process ---
+DATAGRAMS = metrics.counter("airlock_ingest_datagrams", "Datagrams entering the ingest pipeline.")
+RECORDS = metrics.counter("airlock_ingest_records", "Records that passed every check and were queued for storage.")
+REJECTED = metrics.counter("airlock_ingest_rejected", "Datagrams or records rejected, by reason.", ("reason",))
+STAGE_SECONDS = metrics.histogram("airlock_ingest_stage_seconds",
+                                  "Seconds per sampled datagram (decrypt, parse, validate) or per chunk (persist).",
+                                  ("stage",))
+_timed = metrics.sampler()             # check_records(), per datagram
+_timed_validate = metrics.sampler()    # replay checks: accept_records() per call, ingest() per datagram
+_decrypt_seconds = STAGE_SECONDS.labels("decrypt")
+_parse_seconds = STAGE_SECONDS.labels("parse")
+_validate_seconds = STAGE_SECONDS.labels("validate")
+_persist_seconds = STAGE_SECONDS.labels("persist")
+_replay_rejected = {"replayed msg_id": REJECTED.labels("replay"),
+                    "replay cache full": REJECTED.labels("replay_cache_full")}
+metrics.gauge("airlock_replay_cache_entries", "msg_ids held by the anti-replay cache.").set_function(
+    lambda: len(replay_cache))
+
+
+def within_time_window(ts):
+    try:
+        now = time.time()
+        return abs(now - float(ts)) <= MAX_SKEW_SECONDS
+    except Exception:
+        return False
+
+def pretty_print(t):
+    print("\n--- Telemetry Received ---")
+    print(f"ID: {t.get('msg_id')}")
+    print(f"Drone: {t.get('drone_id')}")
+    print(f"TS: {t.get('ts')}")
+    print(f"Altitude: {t.get('altitude')}")
+    print(f"Speed: {t.get('speed')}")
+    print(f"Battery: {t.get('battery')}")
+    loc = t.get('location', {})
+    print(f"Location: {loc.get('lat')}, {loc.get('lon')}")
+
+# --- stateless: decrypt + decode + skew check ---
+def open_records(data):
+    """Decrypt a datagram into its record plaintexts (one, or several for a frame)."""
+    DATAGRAMS.inc()
+    try:
+        plain = transport.open(data)
+    except Exception as e:
+        raise Rejected(f"decryption failed: {str(e) or type(e).__name__}", "decrypt")
+    if wire_format.wire_version(plain) == wire_format.WIRE_FRAME:
+        try:
+            return wire_format.unpack_frame(plain)
+        except ValueError as e:
+            raise Rejected(f"bad frame: {e}", "frame")
+    return [plain]
+
+def check_record(plain, sender=None):
+    """(telemetry, decrypted) for a valid record, (None, decrypted) for non-JSON text.
+
+    Binary records (see wire_format.py) are unpacked without a JSON parse;
+    their `decrypted` text is the equivalent JSON, so the log and the raw
+    column look the same for both formats. `sender` is the drone_id an AEAD
+    header authenticated (Transport.sender_id); a record claiming another
+    drone is rejected, and one without a drone_id takes the sender's.
+    Raises Rejected otherwise.
+    """
+    t, decrypted = parse_record(plain)
+    if t is not None:
+        check_fields(t, sender)
+    return (t, decrypted)
+
+def parse_record(plain):
+    """First half of check_record(): unpack or JSON-parse, no field checks."""
+    if wire_format.wire_version(plain) is not None:
+        try:
+            t = wire_format.unpack(plain)
+        except ValueError as e:
+            raise Rejected(str(e))
+        decrypted = json.dumps(t)
+    else:
+        try:
+            decrypted = plain.decode()
+        except UnicodeDecodeError as e:
+            raise Rejected(str(e))
+        # parse JSON
+        try:
+            t = json.loads(decrypted)
+        except json.JSONDecodeError:
+            return (None, decrypted)
+    return (t, decrypted)
+
+def check_fields(t, sender=None):
+    """Second half of check_record(): required fields, skew and drone_id."""
+    msg_id = t.get("msg_id")
+    ts = t.get("ts")
+
+    if not msg_id or not ts:
+        raise Rejected("missing msg_id/ts", "missing_fields")
+
+    if not within_time_window(ts):
+        raise Rejected(f"stale/future packet (ts={ts})", "skew")
+
+    drone_id = t.get("drone_id")
+    if drone_id is not None and (not isinstance(drone_id, str) or len(drone_id) > MAX_DRONE_ID_CHARS):
+        raise Rejected("bad drone_id", "drone_id")
+    if sender is not None:
+        if drone_id is None:
+            t["drone_id"] = sender
+        elif drone_id != sender:
+            raise Rejected(f"drone_id {drone_id!r} does not match sender {sender!r}", "drone_id")
+
+def check_records(data, trace=None):
+    """Decrypt one datagram and check every record it carries (stateless).
+
+    Returns one entry per record: (telemetry, decrypted) if it passed,
+    (None, decrypted) for text that is not JSON (only logged), or the
+    Rejected it failed with. Raises Rejected if the datagram itself cannot
+    be opened. Every rejection is counted here, once. Stage times go to
+    `trace` (a sampled profiling.StageTrace) when given, else to the
+    sampled stage histograms.
+    """
+    timed = trace is None and _timed()
+    if timed:
+        started = time.perf_counter()
+    try:
+        records = open_records(data)
+    except Rejected as e:
+        REJECTED.labels(e.kind).inc()
+        raise
+    finally:
+        if trace is not None:
+            trace.mark("decrypt")
+    if timed:
+        opened = time.perf_counter()
+        _decrypt_seconds.observe(opened - started)
+    sender = Transport.sender_id(data)
+    results = []
+    for plain in records:
+        try:
+            t, decrypted = parse_record(plain)
+            if trace is not None:
+                trace.mark("parse")
+            if t is not None:
+                check_fields(t, sender)
+                if trace is not None:
+                    trace.mark("validate")
+            results.append((t, decrypted))
+        except Rejected as e:
+            REJECTED.labels(e.kind).inc()
+            if trace is not None:
+                trace.mark("parse" if e.kind == "decode" else "validate")
+            results.append(e)
+    if timed:
+        _parse_seconds.observe(time.perf_counter() - opened)
+    return results
+
+def decode_packet(data, addr, trace=None):
+    """check_records() for the receivers: rejections are printed and dropped.
+
+    Returns the list of records that passed as (telemetry, decrypted), or
+    (None, decrypted) for records that are not JSON. Safe to run in worker
+    processes.
+    """
+    try:
+        checked = check_records(data, trace)
+    except Rejected as e:
+        print("Rejecting packet from", addr, ":", e)
+        return []
+    results = []
+    for r in checked:
+        if isinstance(r, Rejected):
+            print("Rejecting packet from", addr, ":", r)
+        else:
+            results.append(r)
+    return results
+
+# --- stateful: dedupe ---
+def replay_reason(msg_id):
+    return "replayed msg_id" if msg_id in replay_cache else "replay cache full"
+
+def replay_rejection(msg_id, ts):
+    """None (and remember msg_id) if it has not been seen before, else the counted reason."""
+    if replay_cache.check_and_add(msg_id, ts):
+        return None
+    reason = replay_reason(msg_id)
+    _replay_rejected[reason].inc()
+    return reason
+
+def check_replay(msg_id, ts):
+    """Return True (and remember msg_id) if it has not been seen before."""
+    reason = replay_rejection(msg_id, ts)
+    if reason is None:
+        return True
+    print(f"Rejecting msg_id {msg_id}: {reason}")
+    return False
+
+def accept_records(results, trace=None):
+    """Filter decode_packet() results through the anti-replay check, per record."""
+    timed = _timed_validate()
+    if timed:
+        started = time.perf_counter()
+    accepted = [r for r in results
+                if r[0] is None or check_replay(r[0].get("msg_id"), r[0].get("ts"))]
+    if timed:
+        _validate_seconds.observe(time.perf_counter() - started)
+    if trace is not None:
+        trace.mark("replay")
+    RECORDS.inc(len(accepted))
+    return accepted
+
+def load_replay_cache(path=REPLAY_SNAPSHOT_FILE):
+    try:
+        restored = replay_cache.load(path)
+    except (OSError, ValueError) as e:
+        print("Could not load replay cache snapshot:", e)
+        return
+    if restored:
+        print(f"Restored {restored} msg_ids from {path}")
+
+def save_replay_cache(snap=None, path=REPLAY_SNAPSHOT_FILE):
+    try:
+        replay_cache.save(path, snap)
+    except OSError as e:
+        print("Could not save replay cache snapshot:", e)
+
+# --- stateful: persist + fan-out ---
+class Pending:
+    """A record queued for storage: its log line, and whether the database turned it down."""
+
+    __slots__ = ("telemetry", "line", "duplicate")
+
+    def __init__(self, telemetry, line):
+        self.telemetry = telemetry
+        self.line = line
+        self.duplicate = False
+
+def store_row(writer, msg_id, ts, telemetry, raw, tag=None):
+    # buffered; the writer thread commits rows in batches (see db_writer.py)
+    writer.put(telemetry_row(msg_id, ts, telemetry, raw), tag)
+
+def persist_chunk(writer, chunk, verbose=True, log_file=LOG_FILE):
+    """Queue a list of accepted records for storage; returns their Pending entries.
+
+    Non-JSON records are only logged, straight away. The rest are logged by
+    fan_out() once their batch commits.
+    """
+    started = time.perf_counter()
+    trace = profiling.begin("chunk")
+    ts_log = time.strftime('%Y-%m-%d %H:%M:%S')
+    pending, raw_lines = [], []
+    for t, decrypted in chunk:
+        if t is None:
+            print("Telemetry (raw/non-JSON):", decrypted)
+            raw_lines.append(f"{ts_log} - {decrypted}")
+            continue
+        if verbose:
+            pretty_print(t)
+            if trace is not None:
+                trace.mark("print")
+        p = Pending(t, f"{ts_log} - {decrypted}")
+        store_row(writer, t.get("msg_id"), t.get("ts"), t, decrypted, p)
+        pending.append(p)
+        if trace is not None:
+            trace.mark("store_row")
+    if raw_lines:
+        log_writer.shared(log_file).write_lines(raw_lines)
+    _persist_seconds.observe(time.perf_counter() - started)
+    if trace is not None:
+        trace.rows = len(chunk)
+        profiling.finish(trace)
+    return pending
+
+def fan_out(stored, duplicates, log_file=LOG_FILE, publish=True):
+    """BatchWriter on_commit: log the stored records (latest slot unless not `publish`), reject the rest.
+
+    `duplicates` were already in the database, stored by another process
+    (or an earlier run) that this process's replay cache never saw.
+    """
+    trace = profiling.begin("commit")
+    for p in duplicates:
+        p.duplicate = True
+        _replay_rejected["replayed msg_id"].inc()
+        print(f"Rejecting msg_id {p.telemetry.get('msg_id')}: replayed msg_id (already stored)")
+    # append to logfile with timestamp; buffered and rotated by the shared log writer thread
+    if stored:
+        log_writer.shared(log_file).write_lines([p.line for p in stored])
+    if trace is not None:
+        trace.mark("log")
+    if publish and stored:
+        publish_latest(stored[-1].telemetry)
+    if trace is not None:
+        trace.mark("publish")
+        trace.rows = len(stored)
+        profiling.finish(trace)
+
+_latest_slot = None
+
+def publish_latest(t):
+    """Publish the newest telemetry to the shared-memory slot viewers read."""
+    global _latest_slot
+    if _latest_slot is None:
+        try:
+            _latest_slot = SlotWriter(LATEST_SLOT_FILE)
+        except RuntimeError as e:
+            print("Not publishing latest telemetry:", e)
+            _latest_slot = False
+    if not _latest_slot:
+        return
+    if not _latest_slot.publish(json.dumps(t, separators=(',', ':')).encode()):
+        print("Latest telemetry too large for the shared slot; not published")
+
+
+class IngestPipeline:
+    """Stateful half of the pipeline for one process.
+
+    open() upgrades the schema, restores the replay cache and starts the
+    BatchWriter, which calls fan_out() after every commit; close() flushes
+    rows and the log and snapshots the cache.
+    persist() is serialised, so request threads can share one pipeline.
+    Retention is not applied here; see compaction.py. A pipeline that runs
+    next to a receiver needs its own `log_file` and publish=False.
+    """
+
+    def __init__(self, db_file=DB_FILE, verbose=True, snapshot_file=REPLAY_SNAPSHOT_FILE,
+                 snapshot_interval=REPLAY_SNAPSHOT_INTERVAL, log_file=LOG_FILE, publish=True):
+        self.db_file = db_file
+        self.verbose = verbose
+        self.log_file = log_file
+        self.publish = publish
+        self.snapshot_file = snapshot_file
+        self.snapshot_interval = snapshot_interval
+        self.writer = None
+        self._lock = threading.Lock()
+        self._next_snapshot = 0.0
+
+    def open(self):
+        init_db(self.db_file).close()
+        load_replay_cache(self.snapshot_file)
+        self.writer = BatchWriter(self.db_file, on_commit=self._committed)
+        self._next_snapshot = time.monotonic() + self.snapshot_interval
+        return self
+
+    def validate(self, data, addr, queued_at=None):
+        """decode_packet() plus the anti-replay check.
+
+        `queued_at` is the perf_counter() stamp of the datagram's arrival, if
+        the receiver took one; a sampled stage trace starts from it.
+        """
+        trace = profiling.begin("packet", queued_at)
+        if trace is None:
+            return accept_records(decode_packet(data, addr))
+        accepted = accept_records(decode_packet(data, addr, trace), trace)
+        profiling.finish(trace)
+        return accepted
+
+    def persist(self, chunk):
+        with self._lock:
+            return persist_chunk(self.writer, chunk, self.verbose, self.log_file)
+
+    def _committed(self, stored, duplicates):
+        fan_out(stored, duplicates, self.log_file, self.publish)
+
+    def snapshot(self, snap=None):
+        save_replay_cache(snap, self.snapshot_file)
+
+    def maybe_snapshot(self):
+        with self._lock:
+            if time.monotonic() < self._next_snapshot:
+                return
+            self._next_snapshot = time.monotonic() + self.snapshot_interval
+            self.snapshot()
+
+    def ingest(self, datagrams):
+        """Run a list of datagrams through every stage; returns one result per datagram.
+
+        Each result is {"accepted": n, "rejected": [{"msg_id", "reason"}, ...]}
+        or {"error": reason} when the datagram itself is rejected. Accepted
+        rows are committed before this returns, so a msg_id another process
+        already stored comes back as a "replayed msg_id" rejection.
+        """
+        results, accepted, owners = [], [], []
+        for data in datagrams:
+            try:
+                checked = check_records(data)
+            except Rejected as e:
+                results.append({"error": str(e)})
+                continue
+            timed = _timed_validate()
+            if timed:
+                started = time.perf_counter()
+            item = {"accepted": 0, "rejected": []}
+            for r in checked:
+                if isinstance(r, Rejected):
+                    item["rejected"].append({"msg_id": None, "reason": str(r)})
+                    continue
+                t = r[0]
+                reason = None if t is None else replay_rejection(t.get("msg_id"), t.get("ts"))
+                if reason is not None:
+                    item["rejected"].append({"msg_id": t.get("msg_id"), "reason": reason})
+                    continue
+                accepted.append(r)
+                if t is not None:
+                    owners.append(item)
+                item["accepted"] += 1
+            if timed:
+                _validate_seconds.observe(time.perf_counter() - started)
+            RECORDS.inc(item["accepted"])
+            results.append(item)
+        if accepted:
+            pending = self.persist(accepted)
+            self.writer.flush()
+            for p, item in zip(pending, owners):
+                if p.duplicate:
+                    item["accepted"] -= 1
+                    item["rejected"].append({"msg_id": p.telemetry.get("msg_id"), "reason": "replayed msg_id"})
+        self.maybe_snapshot()
+        return results
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()   # flushes any rows still buffered
+            self.writer = None
+        log_writer.close_shared()
+        self.snapshot()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
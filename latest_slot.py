@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# latest_slot.py — shared-memory "latest telemetry" slot (seqlock over mmap)
+#
+# One writer (the receiver's persist stage) publishes the newest verified
+# telemetry into a fixed-layout memory-mapped file; any number of viewers
+# read it. The writer holds an exclusive flock on the file (where fcntl
+# exists), so a second writer process fails instead of racing the counter. A sequence counter makes reads torn-free: the writer makes it
+# odd, copies the payload, then makes it even again, and a reader keeps a
+# copy only if it saw the same even value before and after copying.
+#
+# Readers that want to block instead of poll register a localhost UDP port
+# in the header; after each publish the writer sends one empty datagram to
+# every registered port. With no viewers registered, publish() is just the
+# memcpy and two counter stores. The port table is changed only under a
+# POSIX record lock on its bytes (separate from the writer's flock): readers
+# take a free entry and clear their own on close, and the writer clears the
+# ports of viewers that went away without closing (ECONNREFUSED).
+#
+# Layout (little-endian):
+#   0  magic "ALS1" | 4 capacity u32 | 8 seq u64 | 16 length u32 | 20 reserved
+#   24 NOTIFY_SLOTS x u16 notify ports | HEADER_SIZE payload (capacity bytes)
+
+import contextlib
+import mmap
+import os
+import select
+import socket
+import struct
+import time
+
+try:
+    import fcntl
+except ImportError:   # Windows: one writer by convention only
+    fcntl = None
+
+SLOT_FILE = "latest_telemetry.slot"
+SLOT_CAPACITY = 4096         # max payload bytes (one JSON telemetry object)
+NOTIFY_SLOTS = 8             # viewers that can block on change notifications
+HEADER_SIZE = 64
+
+MAGIC = b"ALS1"
+_HEAD = struct.Struct("<4sI")
+_SEQ = struct.Struct("<Q")
+_LEN = struct.Struct("<I")
+_PORTS = struct.Struct(f"<{NOTIFY_SLOTS}H")
+_SEQ_OFF, _LEN_OFF, _PORTS_OFF = 8, 16, 24
+READ_RETRIES = 1000
+
+
+def _map(path, capacity, create):
+    size = HEADER_SIZE + capacity
+    if create:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+            mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        if _HEAD.unpack_from(mm, 0) != (MAGIC, capacity):
+            mm[:HEADER_SIZE] = bytes(HEADER_SIZE)
+            _HEAD.pack_into(mm, 0, MAGIC, capacity)
+        return mm
+    with open(path, "r+b") as f:
+        mm = mmap.mmap(f.fileno(), 0)
+    magic, cap = _HEAD.unpack_from(mm, 0)
+    if magic != MAGIC or len(mm) != HEADER_SIZE + cap:
+        mm.close()
+        raise ValueError(f"{path} is not a latest-telemetry slot")
+    return mm
+
+
+@contextlib.contextmanager
+def _ports_locked(fd):
+    """Hold the lock on the notify-port table (no-op without fcntl)."""
+    if fd is None:
+        yield
+        return
+    fcntl.lockf(fd, fcntl.LOCK_EX, _PORTS.size, _PORTS_OFF)
+    try:
+        yield
+    finally:
+        fcntl.lockf(fd, fcntl.LOCK_UN, _PORTS.size, _PORTS_OFF)
+
+
+def _lock_writer(path):
+    """fd holding an exclusive lock on the slot file; RuntimeError if another writer has it."""
+    if fcntl is None:
+        return None
+    fd = os.open(path, os.O_RDWR)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        raise RuntimeError(f"{path} already has a writer in another process")
+    return fd
+
+
+class SlotWriter:
+    """Single-writer side: publish(bytes) replaces the slot contents."""
+
+    def __init__(self, path=SLOT_FILE, capacity=SLOT_CAPACITY):
+        self.path = path
+        self.capacity = int(capacity)
+        self._mm = _map(path, self.capacity, create=True)
+        try:
+            self._lock_fd = _lock_writer(path)
+        except RuntimeError:
+            self._mm.close()
+            raise
+        self._seq = _SEQ.unpack_from(self._mm, _SEQ_OFF)[0] & ~1   # continue after a restart
+        self._socks = {}   # port -> socket connected to it, so a closed port reports ECONNREFUSED
+        self.published = 0
+        self.oversize = 0
+
+    def publish(self, payload):
+        """Copy payload into the slot; returns False if it does not fit."""
+        n = len(payload)
+        if n > self.capacity:
+            self.oversize += 1
+            return False
+        mm = self._mm
+        _SEQ.pack_into(mm, _SEQ_OFF, self._seq + 1)        # odd: write in progress
+        _LEN.pack_into(mm, _LEN_OFF, n)
+        mm[HEADER_SIZE:HEADER_SIZE + n] = payload
+        self._seq += 2
+        _SEQ.pack_into(mm, _SEQ_OFF, self._seq)            # even: stable
+        self.published += 1
+        ports = _PORTS.unpack_from(mm, _PORTS_OFF)
+        if any(ports):
+            self._notify(ports)
+        return True
+
+    def _notify(self, ports):
+        for port in set(self._socks).difference(ports):
+            self._socks.pop(port).close()   # unregistered
+        dead = []
+        for port in ports:
+            if not port:
+                continue
+            sock = self._socks.get(port)
+            try:
+                if sock is None:
+                    sock = self._socks[port] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                    sock.setblocking(False)
+                    sock.connect(("127.0.0.1", port))
+                sock.send(b"")
+            except ConnectionRefusedError:
+                dead.append(port)   # reported for an earlier send: nobody listens there
+            except OSError:
+                pass   # its buffer is full; it re-reads on wake anyway
+        if dead:
+            self._drop_ports(dead)
+
+    def _drop_ports(self, dead):
+        mm = self._mm
+        with _ports_locked(self._lock_fd):
+            for i in range(NOTIFY_SLOTS):
+                off = _PORTS_OFF + 2 * i
+                if struct.unpack_from("<H", mm, off)[0] in dead:
+                    struct.pack_into("<H", mm, off, 0)
+        for port in dead:
+            self._socks.pop(port).close()
+
+    def close(self):
+        for sock in self._socks.values():
+            sock.close()
+        self._mm.close()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)   # releases the writer lock
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SlotReader:
+    """Viewer side: read() returns (seq, payload) snapshots; wait() blocks for a newer one."""
+
+    def __init__(self, path=SLOT_FILE):
+        self.path = path
+        self._mm = _map(path, 0, create=False)
+        self._fd = None      # for the port-table lock
+        self._sock = None
+        self._slot = None
+        self._port = None
+
+    def seq(self):
+        return _SEQ.unpack_from(self._mm, _SEQ_OFF)[0]
+
+    def read(self):
+        """Consistent (seq, bytes) copy; (0, b"") before the first publish."""
+        mm = self._mm
+        cap = len(mm) - HEADER_SIZE
+        for attempt in range(READ_RETRIES):
+            s1 = _SEQ.unpack_from(mm, _SEQ_OFF)[0]
+            if not s1 & 1:
+                n = min(_LEN.unpack_from(mm, _LEN_OFF)[0], cap)
+                data = mm[HEADER_SIZE:HEADER_SIZE + n]
+                if _SEQ.unpack_from(mm, _SEQ_OFF)[0] == s1:
+                    return s1, data
+            if attempt > 10:
+                time.sleep(0)   # writer was preempted mid-copy; let it finish
+        raise RuntimeError("latest slot: could not get a stable read")
+
+    def _registered(self):
+        return self._slot is not None and struct.unpack_from("<H", self._mm, self._slot)[0] == self._port
+
+    def _register(self):
+        if fcntl is not None and self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.setblocking(False)
+        self._port = self._sock.getsockname()[1]
+        with _ports_locked(self._fd):
+            for i in range(NOTIFY_SLOTS):
+                off = _PORTS_OFF + 2 * i
+                if struct.unpack_from("<H", self._mm, off)[0] == 0:
+                    struct.pack_into("<H", self._mm, off, self._port)
+                    self._slot = off
+                    return
+        # every slot taken: wait() degrades to short sleeps on the counter
+        self._sock.close()
+        self._sock = False
+
+    def _unregister(self):
+        with _ports_locked(self._fd):
+            if self._registered():
+                struct.pack_into("<H", self._mm, self._slot, 0)
+        self._slot = None
+
+    def wait(self, after_seq, timeout=None):
+        """Block until seq != after_seq (or timeout); returns read()."""
+        if self._sock is None:
+            self._register()
+        elif self._sock and not self._registered():
+            # the writer took our port for a dead viewer's; get a fresh one
+            self._sock.close()
+            self._slot = None
+            self._register()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.seq() == after_seq:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            if self._sock:
+                select.select([self._sock], [], [], 1.0 if remaining is None else min(remaining, 1.0))
+                self._drain()
+            else:
+                time.sleep(0.05 if remaining is None else min(remaining, 0.05))
+        return self.read()
+
+    def _drain(self):
+        try:
+            while True:
+                self._sock.recv(64)
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            pass
+
+    def close(self):
+        if self._slot is not None:
+            self._unregister()
+        if self._sock:
+            self._sock.close()
+        if self._fd is not None:
+            os.close(self._fd)
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
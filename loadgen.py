@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# loadgen.py — multi-drone load generator + end-to-end latency report
+#
+# Simulates N drones sending at a fixed per-drone rate over UDP (to a running
+# receiver_client.py / receiver_workers.py) or HTTP (Flask /ingest). Every
+# reading's ts is its send time and its msg_id starts with a per-run prefix,
+# so after the run the committed rows are found in the database and
+# end-to-end latency is inserted_at - ts. inserted_at is stamped by the DB
+# writer just before COMMIT, so the figure leaves out the commit and fsync.
+# UDP gives no per-packet feedback; rejected replays are read from the
+# receiver's /metrics before and after the run. The report is JSON.
+#
+# Usage:
+#   python loadgen.py --drones 50 --rate 20 --duration 10 --transport udp
+#   python loadgen.py --transport http --url http://127.0.0.1:5000/ingest --report run.json
+#   python loadgen.py --metrics 127.0.0.1:9108 --replay-fraction 0.01
+
+import argparse
+import base64
+import heapq
+import json
+import multiprocessing as mp
+import os
+import socket
+import sqlite3
+import sys
+import time
+from urllib.request import urlopen
+
+import metrics
+import wire_format
+from frame_batcher import FrameBatcher, MAX_DATAGRAM, max_plaintext
+from transport_crypto import MODES, Transport
+
+DB_FILE = "airlock.db"
+UDP_TARGET = ("localhost", 9998)   # receiver_client.UDP_BIND
+HTTP_URL = "http://127.0.0.1:5000/ingest"
+HTTP_BATCH = 200             # datagrams per /ingest request
+HTTP_MAX_DELAY = 0.05        # seconds a partial HTTP batch may wait
+SETTLE_SECONDS = 2.0         # wait for the receiver to commit before reading the DB
+
+
+def reading(run_id, drone, seq, now):
+    return {
+        "msg_id": f"{run_id}{drone:08x}{seq:016x}",
+        "drone_id": f"drone-{drone}",
+        "ts": now,
+        "altitude": 100 + (drone * 7 + seq) % 50,
+        "speed": 20 + (seq % 15),
+        "battery": max(0, 100 - seq // 100),
+        "location": {"lat": 12.9 + drone * 1e-3 + seq * 1e-6, "lon": 77.5 + drone * 1e-3},
+    }
+
+
+class _HttpSender:
+    def __init__(self, url):
+        import requests   # only needed for --transport http
+        self.session = requests.Session()
+        self.url = url
+        self.items = []
+        self.first_at = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.replays_rejected = 0
+
+    def add(self, datagram):
+        if not self.items:
+            self.first_at = time.monotonic()
+        if datagram[:1] == b"g":   # Fernet tokens are text already
+            self.items.append(datagram.decode())
+        else:
+            self.items.append({"b64": base64.b64encode(datagram).decode()})
+        if len(self.items) >= HTTP_BATCH:
+            self.flush()
+
+    def poll(self):
+        if self.items and time.monotonic() - self.first_at >= HTTP_MAX_DELAY:
+            self.flush()
+
+    def flush(self):
+        if not self.items:
+            return
+        items, self.items = self.items, []
+        try:
+            r = self.session.post(self.url, json=items, timeout=30)
+            r.raise_for_status()
+            for res in r.json().get("results", []):
+                if "error" in res:
+                    self.errors += 1
+                self.replays_rejected += sum(1 for rej in res.get("rejected", ())
+                                             if rej.get("reason") == "replayed msg_id")
+        except Exception as e:
+            self.errors += len(items)
+            print("loadgen: HTTP batch failed:", e, file=sys.stderr)
+        self.requests += 1
+
+
+def _drive(cfg, drones, start_at):
+    """Send from `drones` until cfg['duration'] has passed; returns counters."""
+    stats = {"packets": 0, "datagrams": 0, "bytes": 0, "replays": 0, "errors": 0,
+             "replays_rejected": 0}
+    period = 1.0 / cfg["rate"]
+    transports = {d: Transport(cfg["crypto"], f"drone-{d}") for d in drones}
+    seqs = dict.fromkeys(drones, 0)
+    recent = []     # datagrams kept for --replay-fraction duplicates
+    http = _HttpSender(cfg["url"]) if cfg["transport"] == "http" else None
+    sock = None if http else socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    target = (cfg["host"], cfg["port"])
+
+    def emit(datagram):
+        stats["datagrams"] += 1
+        stats["bytes"] += len(datagram)
+        if http:
+            http.add(datagram)
+            return
+        try:
+            sock.sendto(datagram, target)
+        except OSError:
+            stats["errors"] += 1
+
+    def sender(d):
+        def send(plaintext):
+            datagram = transports[d].seal(plaintext)
+            emit(datagram)
+            if len(recent) < 1024:
+                recent.append(datagram)
+        return send
+
+    batchers = {d: FrameBatcher(sender(d), max_plaintext(transports[d]), cfg["frame_delay"]) for d in drones}
+    # stagger the drones across one period so packets are evenly spaced
+    due = [(start_at + period * i / len(drones), d) for i, d in enumerate(drones)]
+    heapq.heapify(due)
+    end_at = start_at + cfg["duration"]
+    replay_every = int(1 / cfg["replay_fraction"]) if cfg["replay_fraction"] > 0 else 0
+
+    while due and due[0][0] < end_at:
+        at, d = heapq.heappop(due)
+        wait = at - time.time()
+        if wait > 0.001:
+            time.sleep(wait)
+        seqs[d] += 1
+        batchers[d].add(wire_format.encode(reading(cfg["run_id"], d, seqs[d], time.time()), cfg["wire"]))
+        stats["packets"] += 1
+        if replay_every and stats["packets"] % replay_every == 0 and recent:
+            emit(recent[stats["packets"] % len(recent)])
+            stats["replays"] += 1
+        if cfg["frame_delay"] > 0:
+            for b in batchers.values():
+                b.poll()
+        if http:
+            http.poll()
+        heapq.heappush(due, (at + period, d))
+
+    for b in batchers.values():
+        b.flush()
+    if http:
+        http.flush()
+        stats["errors"] += http.errors
+        stats["replays_rejected"] = http.replays_rejected
+    else:
+        sock.close()
+    return stats
+
+
+def replays_rejected(addr):
+    """The receiver's count of rejected replays from its /metrics, or None if unreachable."""
+    if not addr:
+        return None
+    host, port = metrics.parse_addr(addr)
+    try:
+        with urlopen(f"http://{host}:{port}/metrics", timeout=5) as r:
+            text = r.read().decode()
+    except (OSError, ValueError):
+        return None
+    for line in text.splitlines():
+        name, _, value = line.rpartition(" ")
+        if name == 'airlock_ingest_rejected_total{reason="replay"}':
+            return float(value)
+    return 0.0   # nothing rejected yet, so the series is not exported
+
+
+def collect(db_file, run_id, t0, t1):
+    """(ts, inserted_at) of this run's committed rows."""
+    con = sqlite3.connect(db_file, timeout=10)
+    try:
+        rows = con.execute(
+            "SELECT ts, inserted_at FROM telemetry WHERE ts >= ? AND ts <= ? AND substr(msg_id, 1, 8) = ?",
+            (t0, t1, run_id)).fetchall()
+    finally:
+        con.close()
+    return rows
+
+
+def run(cfg):
+    cfg["run_id"] = os.urandom(4).hex()
+    procs = max(1, min(cfg["procs"], cfg["drones"]))
+    groups = [list(range(i, cfg["drones"], procs)) for i in range(procs)]
+    udp = cfg["transport"] == "udp"
+    rejected_before = replays_rejected(cfg["metrics"]) if udp else None
+    start_at = time.time() + 0.5   # let every process get ready
+    if procs == 1:
+        parts = [_drive(cfg, groups[0], start_at)]
+    else:
+        with mp.Pool(procs) as pool:
+            parts = pool.starmap(_drive, [(cfg, g, start_at) for g in groups])
+    sent_done = time.time()
+    sent = {k: sum(p[k] for p in parts) for k in parts[0]}
+
+    time.sleep(cfg["settle"])
+    rows = collect(cfg["db"], cfg["run_id"], start_at - 1, sent_done + 1)
+    latencies = sorted((ins - ts) * 1000.0 for ts, ins in rows if ins is not None)
+    if udp:
+        rejected_after = replays_rejected(cfg["metrics"])
+        rejected = (int(rejected_after - rejected_before)
+                    if rejected_before is not None and rejected_after is not None else None)
+    else:
+        rejected = sent["replays_rejected"]
+    stored = len(rows)
+    last_commit = max((ins for _, ins in rows), default=start_at)
+    elapsed = max(1e-9, last_commit - start_at)
+
+    return {
+        "run_id": cfg["run_id"],
+        "config": {k: cfg[k] for k in ("transport", "drones", "rate", "duration", "wire", "crypto",
+                                       "frame_delay", "replay_fraction", "procs")},
+        "target": cfg["url"] if cfg["transport"] == "http" else f"udp://{cfg['host']}:{cfg['port']}",
+        "started_at": start_at,
+        "sent": {
+            "packets": sent["packets"],
+            "datagrams": sent["datagrams"],
+            "bytes": sent["bytes"],
+            "send_errors": sent["errors"],
+            "offered_pps": sent["packets"] / max(1e-9, sent_done - start_at),
+        },
+        "stored": {
+            "rows": stored,
+            "accepted_pps": stored / elapsed,
+            "drop_rate": (1.0 - stored / sent["packets"]) if sent["packets"] else 0.0,
+        },
+        "replays": {
+            "sent": sent["replays"],
+            # rejected counts records, so a replayed frame adds one per reading in it.
+            # UDP: the receiver's counter delta, which includes other senders' replays
+            # (None when --metrics is unreachable)
+            "rejected": rejected,
+        },
+        "latency_ms": {
+            "measures": "inserted_at - ts (excludes the commit/fsync)",
+            "samples": len(latencies),
+            "p50": metrics.percentile(latencies, 50),
+            "p95": metrics.percentile(latencies, 95),
+            "p99": metrics.percentile(latencies, 99),
+            "max": latencies[-1] if latencies else None,
+            "mean": (sum(latencies) / len(latencies)) if latencies else None,
+        },
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Multi-drone load generator with an end-to-end latency report")
+    ap.add_argument("--drones", type=int, default=10)
+    ap.add_argument("--rate", type=float, default=10.0, help="readings per second per drone")
+    ap.add_argument("--duration", type=float, default=10.0, help="seconds")
+    ap.add_argument("--transport", choices=("udp", "http"), default="udp")
+    ap.add_argument("--host", default=UDP_TARGET[0])
+    ap.add_argument("--port", type=int, default=UDP_TARGET[1])
+    ap.add_argument("--url", default=HTTP_URL)
+    ap.add_argument("--wire", choices=wire_format.FORMATS, default="binary")
+    ap.add_argument("--crypto", choices=tuple(MODES), default="fernet")
+    ap.add_argument("--frame-delay", type=float, default=0.0,
+                    help="pack readings into frames of up to %d bytes for this long (0 = off)" % MAX_DATAGRAM)
+    ap.add_argument("--replay-fraction", type=float, default=0.0, help="share of extra duplicate datagrams")
+    ap.add_argument("--procs", type=int, default=1, help="sender processes")
+    ap.add_argument("--db", default=DB_FILE)
+    ap.add_argument("--metrics", default=metrics.METRICS_ADDR,
+                    help="UDP receiver's metrics address, scraped for rejected replays ('' = skip)")
+    ap.add_argument("--settle", type=float, default=SETTLE_SECONDS)
+    ap.add_argument("--report", help="write the JSON report here (default: stdout)")
+    args = ap.parse_args(argv)
+    if args.drones < 1 or args.rate <= 0 or args.duration <= 0:
+        ap.error("--drones, --rate and --duration must be positive")
+
+    report = run(vars(args))
+    text = json.dumps(report, indent=2)
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# log_writer.py — buffered, rotating, gzip-compressing telemetry log
+#
+# Lines are handed to a writer thread that keeps the log file open and
+# writes in blocks, so callers never open/close the file per packet. The
+# file is rotated by size and/or age; rotated segments are renamed to
+# <log>.<YYYYmmdd-HHMMSS> and gzip-compressed by a second thread, keeping
+# the newest LOG_BACKUPS segments.
+#
+# Within one process every receiver shares the same LogWriter per path
+# via shared(); close_shared() (also registered with atexit) flushes them.
+
+import atexit
+import glob
+import gzip
+import os
+import queue
+import shutil
+import threading
+import time
+
+LOG_FILE = "telemetry_log.txt"
+
+LOG_MAX_BYTES = int(os.environ.get("AIRLOCK_LOG_MAX_BYTES", str(10 * 1024 * 1024)))   # 0 = no size rotation
+LOG_ROTATE_SECS = float(os.environ.get("AIRLOCK_LOG_ROTATE_SECS", "0"))               # 0 = no time rotation
+LOG_BACKUPS = int(os.environ.get("AIRLOCK_LOG_BACKUPS", "10"))                        # compressed segments kept
+LOG_FLUSH_BYTES = 64 * 1024
+LOG_FLUSH_INTERVAL = 0.5     # seconds
+
+_STOP = object()
+
+
+class LogWriter:
+    """Append-only text log with buffered writes and background rotation.
+
+    write()/write_lines() only enqueue. The writer thread flushes when
+    LOG_FLUSH_BYTES are buffered or the oldest buffered line has waited
+    LOG_FLUSH_INTERVAL seconds, and rotates before a write that would take
+    the file past max_bytes or once it is older than rotate_secs.
+    """
+
+    def __init__(self, path=LOG_FILE, max_bytes=LOG_MAX_BYTES, rotate_secs=LOG_ROTATE_SECS,
+                 backups=LOG_BACKUPS, flush_bytes=LOG_FLUSH_BYTES, flush_interval=LOG_FLUSH_INTERVAL):
+        self.path = path
+        self.max_bytes = max(0, int(max_bytes))
+        self.rotate_secs = max(0.0, float(rotate_secs))
+        self.backups = max(0, int(backups))
+        self.flush_bytes = max(1, int(flush_bytes))
+        self.flush_interval = max(0.0, float(flush_interval))
+        self.lines_written = 0
+        self.rotations = 0
+        self._queue = queue.Queue()
+        self._gzip_queue = queue.Queue()
+        self._closed = False
+        self._file = None
+        self._size = 0
+        self._opened_at = 0.0
+        self._thread = threading.Thread(target=self._run, name="airlock-log-writer", daemon=True)
+        self._gzipper = threading.Thread(target=self._gzip_run, name="airlock-log-gzip", daemon=True)
+        self._gzipper.start()
+        for leftover in self._segments(compressed=False):
+            self._gzip_queue.put(leftover)   # rotated but not compressed by a previous run
+        self._thread.start()
+
+    def write(self, line):
+        """Queue one line (a newline is appended if missing)."""
+        self.write_lines((line,))
+
+    def write_lines(self, lines):
+        """Queue several lines as one item; cheaper than write() per line."""
+        if self._closed:
+            raise RuntimeError("LogWriter is closed")
+        self._queue.put([l if l.endswith("\n") else l + "\n" for l in lines])
+
+    def close(self, timeout=None):
+        """Flush buffered lines, close the file and finish pending compression."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._gzip_queue.put(_STOP)
+        self._gzipper.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- writer thread ---
+    def _open(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+        self._opened_at = time.time()
+
+    def _rotate(self):
+        self._file.close()
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        target, n = f"{self.path}.{stamp}", 1
+        while os.path.exists(target) or os.path.exists(target + ".gz"):
+            target, n = f"{self.path}.{stamp}.{n}", n + 1
+        os.replace(self.path, target)
+        self.rotations += 1
+        self._gzip_queue.put(target)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._size = 0
+        self._opened_at = time.time()
+
+    def _due(self, incoming):
+        if not self._size:
+            return False
+        if self.max_bytes and self._size + incoming > self.max_bytes:
+            return True
+        return bool(self.rotate_secs) and time.time() - self._opened_at >= self.rotate_secs
+
+    def _flush(self, buf, nbytes):
+        if not buf:
+            return
+        try:
+            if self._due(nbytes):
+                self._rotate()
+            self._file.write("".join(buf))
+            self._file.flush()
+            self._size += nbytes
+            self.lines_written += len(buf)
+        except OSError as e:
+            print(f"Log writer error: dropped {len(buf)} lines:", e)
+        buf.clear()
+
+    def _run(self):
+        self._open()
+        buf, nbytes = [], 0
+        deadline = None
+        try:
+            while True:
+                wait = None if not buf else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self._queue.get(timeout=wait)
+                except queue.Empty:
+                    item = None
+
+                if item is _STOP:
+                    break
+                if item:
+                    if not buf:
+                        deadline = time.monotonic() + self.flush_interval
+                    buf.extend(item)
+                    nbytes += sum(len(l) for l in item)
+
+                if nbytes >= self.flush_bytes or (buf and time.monotonic() >= deadline):
+                    self._flush(buf, nbytes)
+                    nbytes = 0
+
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    buf.extend(item)
+                    nbytes += sum(len(l) for l in item)
+            self._flush(buf, nbytes)
+        finally:
+            self._file.close()
+
+    # --- compression thread ---
+    def _segments(self, compressed):
+        found = []
+        for p in glob.glob(glob.escape(self.path) + ".*"):
+            if p.endswith(".tmp"):
+                continue
+            if p.endswith(".gz") == compressed:
+                found.append(p)
+        return sorted(found, key=os.path.getmtime)
+
+    def _gzip_run(self):
+        while True:
+            src = self._gzip_queue.get()
+            if src is _STOP:
+                return
+            try:
+                tmp = src + ".gz.tmp"
+                with open(src, "rb") as fin, gzip.open(tmp, "wb") as fout:
+                    shutil.copyfileobj(fin, fout, 1024 * 1024)
+                os.replace(tmp, src + ".gz")
+                os.remove(src)
+                kept = self._segments(compressed=True)
+                for old in kept[:max(0, len(kept) - self.backups)]:
+                    os.remove(old)
+            except OSError as e:
+                print(f"Log writer error: could not compress {src}:", e)
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared(path=LOG_FILE):
+    """Process-wide LogWriter for `path`, created on first use."""
+    key = os.path.abspath(path)
+    with _shared_lock:
+        w = _shared.get(key)
+        if w is None or w._closed:
+            w = _shared[key] = LogWriter(path)
+        return w
+
+
+def close_shared():
+    with _shared_lock:
+        writers = list(_shared.values())
+        _shared.clear()
+    for w in writers:
+        w.close()
+
+
+atexit.register(close_shared)
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# metrics.py — in-process counters, gauges and latency histograms (Prometheus text format)
+#
+# Every process keeps one registry (REGISTRY). Metrics are created at import
+# time by the modules that update them, so the hot path only does a dict
+# lookup for labelled children and a short locked update:
+#   Counter    monotonically increasing total (inc)
+#   Gauge      value that goes up and down (set/inc/dec), or a callback read
+#              at scrape time (set_function) for queue depths and pool sizes
+#   Histogram  fixed cumulative buckets + sum + count (observe / time)
+# A lock round trip and two clock reads cost about as much as decrypting a
+# small AEAD datagram, so counters are exact but per-datagram latencies are
+# timed for one datagram in AIRLOCK_METRICS_SAMPLE (see sampler()).
+# render() produces the text exposition format; the Flask app serves it at
+# /metrics and the UDP receivers through serve() on AIRLOCK_METRICS_ADDR.
+#
+# Usage: python metrics.py [host:port]   (prints one scrape)
+
+import itertools
+import json
+import math
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+METRICS_ADDR = os.environ.get("AIRLOCK_METRICS_ADDR", "127.0.0.1:9108")   # receivers; "" = off
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+SAMPLE_EVERY = max(1, int(os.environ.get("AIRLOCK_METRICS_SAMPLE", "8")))   # 1 = time every datagram
+
+# seconds; spans a sub-millisecond decrypt up to a slow fsync or a big export
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    k = max(0, math.ceil(p / 100.0 * len(sorted_values)) - 1)
+    return sorted_values[k]
+
+
+def sampler(every=SAMPLE_EVERY):
+    """Callable that returns True on one call in `every` (next() on a count is atomic)."""
+    if every <= 1:
+        return lambda: True
+    tick = itertools.count()
+    return lambda: next(tick) % every == 0
+
+
+class _Metric:
+    """Base for one metric family; children are keyed by label values."""
+
+    kind = None
+
+    def __init__(self, name, doc, labelnames=()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._child()
+
+    def labels(self, *values):
+        """Child for these label values (positional, in labelnames order)."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values!r}")
+            with self._lock:
+                child = self._children.setdefault(tuple(str(v) for v in values), self._child())
+                self._children[values] = child
+        return child
+
+    def _unlabelled(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name} needs labels {self.labelnames}")
+        return self._children[()]
+
+    def _samples(self):
+        seen = set()
+        with self._lock:
+            items = list(self._children.items())
+        for values, child in items:
+            if id(child) in seen:   # the same child under str and non-str label keys
+                continue
+            seen.add(id(child))
+            yield from child.samples(self.name, self.labelnames, tuple(str(v) for v in values))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{labels} {_num(value)}" for name, labels, value in self._samples())
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    __slots__ = ("value", "_acquire", "_release")
+
+    def __init__(self):
+        self.value = 0
+        lock = threading.Lock()
+        self._acquire, self._release = lock.acquire, lock.release   # cheaper than `with`
+
+    def inc(self, n=1):
+        self._acquire()
+        self.value += n
+        self._release()
+
+    def samples(self, name, names, values):
+        yield f"{name}_total", _labels(names, values), self.value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, doc, labelnames=()):
+        if name.endswith("_total"):
+            name = name[:-len("_total")]
+        super().__init__(name, doc, labelnames)
+        if not self.labelnames:
+            self.inc = self._children[()].inc
+
+    def _child(self):
+        return _CounterChild()
+
+    def inc(self, n=1):
+        self._unlabelled().inc(n)
+
+
+class _GaugeChild:
+    __slots__ = ("value", "fn", "_acquire", "_release")
+
+    def __init__(self):
+        self.value = 0
+        self.fn = None
+        lock = threading.Lock()
+        self._acquire, self._release = lock.acquire, lock.release
+
+    def set(self, v):
+        self.value = v
+
+    def inc(self, n=1):
+        self._acquire()
+        self.value += n
+        self._release()
+
+    def dec(self, n=1):
+        self.inc(-n)
+
+    def set_function(self, fn):
+        """Read the value from fn() at scrape time instead."""
+        self.fn = fn
+
+    def samples(self, name, names, values):
+        value = self.value
+        if self.fn is not None:
+            try:
+                value = self.fn()
+            except Exception:
+                return   # the source went away (closed queue, stopped pipeline)
+        yield name, _labels(names, values), value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _child(self):
+        return _GaugeChild()
+
+    def set(self, v):
+        self._unlabelled().set(v)
+
+    def inc(self, n=1):
+        self._unlabelled().inc(n)
+
+    def dec(self, n=1):
+        self._unlabelled().dec(n)
+
+    def set_function(self, fn):
+        self._unlabelled().set_function(fn)
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "_lock", "_acquire", "_release")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # last slot is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+        self._acquire, self._release = self._lock.acquire, self._lock.release
+
+    def observe(self, v):
+        i = bisect_left(self.bounds, v)   # le buckets: v == bound counts in that bucket
+        self._acquire()
+        self.counts[i] += 1
+        self.sum += v
+        self._release()
+
+    def time(self):
+        return _Timer(self)
+
+    def samples(self, name, names, values):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        running = 0
+        for bound, n in zip(self.bounds + (float("inf"),), counts):
+            running += n
+            yield f"{name}_bucket", _labels(names, values, f'le="{_num(float(bound))}"'), running
+        yield f"{name}_sum", _labels(names, values), total
+        yield f"{name}_count", _labels(names, values), running
+
+
+class _Timer:
+    __slots__ = ("child", "started")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.started)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, doc, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(float(b) for b in buckets if b != float("inf")))
+        super().__init__(name, doc, labelnames)
+        if not self.labelnames:
+            self.observe = self._children[()].observe
+
+    def _child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, v):
+        self._unlabelled().observe(v)
+
+    def time(self):
+        """Context manager observing the seconds its block took."""
+        return self._unlabelled().time()
+
+
+class Registry:
+    """Named metric families of one process, rendered in registration order."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, doc, labelnames, **kw):
+        # get-or-create, so modules imported in any combination share a metric
+        with self._lock:
+            m = self._metrics.get(name)
+            if m is None:
+                m = self._metrics[name] = cls(name, doc, labelnames, **kw)
+            elif type(m) is not cls or m.labelnames != tuple(labelnames):
+                raise ValueError(f"metric {name!r} is already registered differently")
+            return m
+
+    def counter(self, name, doc, labelnames=()):
+        return self._get(Counter, name, doc, labelnames)
+
+    def gauge(self, name, doc, labelnames=()):
+        return self._get(Gauge, name, doc, labelnames)
+
+    def histogram(self, name, doc, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, doc, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+render = REGISTRY.render
+
+_started = time.time()
+gauge("airlock_process_start_time_seconds", "Unix time the process started.").set(_started)
+
+
+# --- standalone listener for processes without Flask (the UDP receivers) ---
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+    actions = {}
+
+    def _reply(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        self._reply(200, self.registry.render().encode(), CONTENT_TYPE)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        action = self.actions.get(url.path)
+        if action is None:
+            self.send_error(404)
+            return
+        status, result = action(parse_qs(url.query))
+        self._reply(status, json.dumps(result).encode(), "application/json")
+
+    def log_message(self, *args):
+        pass   # scrapes every few seconds would drown the receiver's output
+
+
+def parse_addr(addr):
+    host, _, port = addr.rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+
+def serve(addr=METRICS_ADDR, registry=REGISTRY, actions=None):
+    """Serve /metrics on a daemon thread; returns the server, or None if off or the port is taken.
+
+    `actions` maps extra POST paths to fn(query) -> (status, JSON-able result),
+    e.g. the receivers' /profile trigger (see profiling.py).
+    """
+    if not addr:
+        return None
+    handler = type("MetricsHandler", (_Handler,), {"registry": registry, "actions": dict(actions or {})})
+    try:
+        server = ThreadingHTTPServer(parse_addr(addr), handler)
+    except (OSError, ValueError) as e:
+        print(f"Metrics listener on {addr} not started:", e)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="airlock-metrics", daemon=True).start()
+    host, port = server.server_address[:2]
+    print(f"Metrics at http://{host}:{port}/metrics")
+    return server
+
+
+if __name__ == "__main__":
+    from urllib.request import urlopen
+    host, port = parse_addr(sys.argv[1] if len(sys.argv) > 1 else METRICS_ADDR)
+    with urlopen(f"http://{host}:{port}/metrics", timeout=5) as r:
+        sys.stdout.write(r.read().decode())
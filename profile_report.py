@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# profile_report.py — summarise a receiver trace file (see profiling.py)
+#
+# Prints where a record's time goes, stage by stage:
+#   packet stages  per sampled datagram (receive queue wait, decrypt, parse,
+#                  validate, replay check)
+#   chunk stages   per sampled persist chunk, also divided by its rows
+#                  (pretty-print, store_row)
+#   commit stages  per sampled committed batch, also divided by its rows
+#                  (log write, latest-slot publish)
+# then, for each cProfile window, the functions with the most own time and
+# the hottest sampled stacks. --folded writes the windows' stacks in the
+# folded format flamegraph.pl, speedscope and inferno read.
+#
+# Usage:
+#   python profile_report.py [airlock_trace.ndjson] [--top 20] [--window -1]
+#                            [--folded stacks.folded] [--json]
+
+import argparse
+import json
+import sys
+
+from metrics import percentile
+from profiling import TRACE_FILE
+
+PACKET_STAGES = ("receive", "decrypt", "parse", "validate", "replay")
+CHUNK_STAGES = ("print", "store_row")
+COMMIT_STAGES = ("log", "publish")
+
+
+def load(path):
+    """(packets, chunks, commits, windows) records of a trace file; bad lines are skipped."""
+    packets, chunks, commits, windows = [], [], [], []
+    kinds = {"packet": packets, "chunk": chunks, "commit": commits, "window": windows}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                r = json.loads(line)
+            except ValueError:
+                continue   # a line cut short by a crash
+            if isinstance(r, dict) and r.get("type") in kinds:
+                kinds[r["type"]].append(r)
+    return packets, chunks, commits, windows
+
+
+def _ordered(stages, records):
+    seen = {s for r in records for s in r.get("ns", {})}
+    return [s for s in stages if s in seen] + sorted(seen - set(stages))
+
+
+def stage_table(records, stages, per_row=False):
+    """Per-stage latency summary in microseconds; every record counts 0 for stages it skipped."""
+    out = []
+    for stage in _ordered(stages, records):
+        values = sorted(r["ns"].get(stage, 0) / 1000.0 for r in records)
+        row = {"stage": stage, "samples": len(values),
+               "mean_us": sum(values) / len(values),
+               "p50_us": percentile(values, 50), "p95_us": percentile(values, 95),
+               "p99_us": percentile(values, 99), "max_us": values[-1]}
+        if per_row:
+            rows = sum(r.get("rows") or 0 for r in records)
+            row["per_row_us"] = sum(values) / rows if rows else None
+        out.append(row)
+    return out
+
+
+def per_record(packet_rows, *per_row_tables):
+    """Mean cost a stored record pays per stage: packet stages + chunk and commit stages / row."""
+    cost = [(r["stage"], r["mean_us"]) for r in packet_rows]
+    cost += [(r["stage"], r["per_row_us"]) for rows in per_row_tables for r in rows
+             if r.get("per_row_us") is not None]
+    total = sum(c for _, c in cost) or 1.0
+    return [{"stage": s, "us": c, "share": c / total} for s, c in sorted(cost, key=lambda x: -x[1])]
+
+
+def leaf_samples(stacks, top):
+    """Innermost frames by stack samples; idle threads show up as their wait call."""
+    leaves = {}
+    for stack, n in stacks.items():
+        frames = stack.split(";")
+        leaf = frames[-1] if len(frames) > 1 else frames[0]
+        leaves[leaf] = leaves.get(leaf, 0) + n
+    return sorted(leaves.items(), key=lambda x: -x[1])[:top]
+
+
+def folded(windows):
+    merged = {}
+    for w in windows:
+        for stack, n in w.get("stacks", {}).items():
+            merged[stack] = merged.get(stack, 0) + n
+    return "".join(f"{stack} {n}\n" for stack, n in sorted(merged.items()))
+
+
+def _fmt(v):
+    return "-" if v is None else f"{v:.1f}"
+
+
+def _print_per_row(title, records, table):
+    rows = sum(c.get("rows") or 0 for c in records)
+    print(f"\n{title} ({len(records)} sampled, {rows / len(records):.1f} rows each), microseconds")
+    print(f"  {'stage':<12}{'mean':>10}{'p95':>10}{'max':>11}{'per row':>10}")
+    for r in table:
+        print(f"  {r['stage']:<12}{_fmt(r['mean_us']):>10}{_fmt(r['p95_us']):>10}"
+              f"{_fmt(r['max_us']):>11}{_fmt(r['per_row_us']):>10}")
+
+
+def print_report(packets, chunks, commits, windows, report, top):
+    if packets:
+        print(f"Packet stages ({len(packets)} sampled datagrams), microseconds")
+        print(f"  {'stage':<12}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>11}")
+        for r in report["packet_stages"]:
+            print(f"  {r['stage']:<12}{_fmt(r['mean_us']):>10}{_fmt(r['p50_us']):>10}"
+                  f"{_fmt(r['p95_us']):>10}{_fmt(r['p99_us']):>10}{_fmt(r['max_us']):>11}")
+    if chunks:
+        _print_per_row("Chunk stages", chunks, report["chunk_stages"])
+    if commits:
+        _print_per_row("Commit stages", commits, report["commit_stages"])
+    if report["per_record"]:
+        print("\nPer stored record")
+        for r in report["per_record"]:
+            bar = "#" * round(r["share"] * 40)
+            print(f"  {r['stage']:<12}{r['us']:>9.1f} us {r['share'] * 100:5.1f}%  {bar}")
+    if not packets and not chunks and not commits:
+        print("No stage traces (set AIRLOCK_PROFILE_SAMPLE on the receiver).")
+
+    for i, w in zip(report["window_indexes"], windows):
+        samples = sum(w.get("stacks", {}).values())
+        print(f"\nWindow {i}: {w['seconds']:g}s at {w['at']:.0f}, {w.get('threads_profiled', 0)} threads profiled, "
+              f"{samples} stack samples")
+        if w.get("functions"):
+            print(f"  {'own s':>9}{'cum s':>9}{'calls':>10}  function")
+            for name, calls, own, cum in w["functions"][:top]:
+                print(f"  {own:>9.3f}{cum:>9.3f}{calls:>10}  {name}")
+        if samples:
+            print("  hottest frames (stack samples)")
+            for leaf, n in leaf_samples(w["stacks"], min(top, 10)):
+                print(f"  {n:>9} {n / samples * 100:5.1f}%  {leaf}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Per-stage breakdown and profile windows from a receiver trace")
+    ap.add_argument("trace", nargs="?", default=TRACE_FILE)
+    ap.add_argument("--top", type=int, default=20, help="functions listed per window")
+    ap.add_argument("--window", type=int, help="only this window (0 = first, -1 = last)")
+    ap.add_argument("--folded", help="write the windows' stacks in folded format here ('-' = stdout)")
+    ap.add_argument("--json", action="store_true", help="print the breakdown as JSON")
+    args = ap.parse_args(argv)
+
+    try:
+        packets, chunks, commits, windows = load(args.trace)
+    except OSError as e:
+        ap.error(f"cannot read {args.trace}: {e}")
+    indexes = list(range(len(windows)))
+    if args.window is not None:
+        try:
+            indexes = [indexes[args.window]]
+        except IndexError:
+            ap.error(f"--window {args.window}: the trace has {len(windows)} windows")
+        windows = [windows[args.window]]
+
+    report = {
+        "packet_stages": stage_table(packets, PACKET_STAGES),
+        "chunk_stages": stage_table(chunks, CHUNK_STAGES, per_row=True),
+        "commit_stages": stage_table(commits, COMMIT_STAGES, per_row=True),
+        "window_indexes": indexes,
+    }
+    report["per_record"] = per_record(report["packet_stages"], report["chunk_stages"], report["commit_stages"])
+
+    if args.folded:
+        text = folded(windows)
+        if args.folded == "-":
+            sys.stdout.write(text)
+            return
+        with open(args.folded, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"Wrote {text.count(chr(10))} folded stacks to {args.folded} "
+              f"(flamegraph.pl {args.folded} > flame.svg)", file=sys.stderr)
+
+    if args.json:
+        report["windows"] = [{"index": i, "at": w["at"], "seconds": w["seconds"],
+                              "functions": w.get("functions", [])[:args.top]}
+                             for i, w in zip(indexes, windows)]
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(packets, chunks, commits, windows, report, args.top)
+
+
+if __name__ == "__main__":
+    main()
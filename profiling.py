@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# profiling.py — opt-in per-stage tracing and on-demand cProfile windows for the receivers
+#
+# Two tools, both writing to one NDJSON trace file (AIRLOCK_TRACE_FILE):
+#
+#   Stage traces   With AIRLOCK_PROFILE_SAMPLE=f (0 < f <= 1) one datagram in
+#                  round(1/f) is followed through the pipeline and the
+#                  nanoseconds spent in each stage are recorded:
+#                    {"type": "packet", "at": epoch, "ns": {"receive": .., "decrypt": ..,
+#                     "parse": .., "validate": .., "replay": ..}}
+#                  Persisting is done per chunk, and the fan-out per committed
+#                  batch, so both are sampled the same way:
+#                    {"type": "chunk", "at": epoch, "rows": n, "ns": {"print": .., "store_row": ..}}
+#                    {"type": "commit", "at": epoch, "rows": n, "ns": {"log": .., "publish": ..}}
+#   Windows        cProfile on the pipeline threads plus a stack sampler over
+#                  every thread, for a fixed number of seconds, started by
+#                  SIGUSR1 or POST /profile?seconds=N on the receiver's metrics
+#                  listener. Works whether or not stage tracing is on:
+#                    {"type": "window", "at": epoch, "seconds": s, "requested_seconds": s,
+#                     "functions": [[name, calls, own s, cumulative s], ...],
+#                     "stacks": {"thread;outer;..;inner": samples}}
+#
+# profile_report.py turns the file into per-stage breakdowns, top functions
+# and folded stacks for flamegraph.pl / speedscope.
+
+import cProfile
+import itertools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+
+PROFILE_SAMPLE = float(os.environ.get("AIRLOCK_PROFILE_SAMPLE", "0"))   # fraction of datagrams; 0 = off
+TRACE_FILE = os.environ.get("AIRLOCK_TRACE_FILE", "airlock_trace.ndjson")
+WINDOW_SECS = float(os.environ.get("AIRLOCK_PROFILE_SECS", "10"))       # default on-demand window
+MAX_WINDOW_SECS = 300
+STACK_INTERVAL = 0.005       # seconds between stack samples during a window
+MAX_FUNCTIONS = 500          # per window, by own time
+FLUSH_LINES = 256            # buffered trace lines before a write
+FLUSH_SECS = 1.0
+
+
+class TraceWriter:
+    """Appends NDJSON lines to the trace file from any thread, in batches."""
+
+    def __init__(self, path=TRACE_FILE):
+        self.path = path
+        self._lines = []
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+    def write(self, record):
+        line = json.dumps(record, separators=(",", ":"))
+        with self._lock:
+            self._lines.append(line)
+            if len(self._lines) < FLUSH_LINES and time.monotonic() - self._flushed_at < FLUSH_SECS:
+                return
+            lines, self._lines = self._lines, []
+            self._flushed_at = time.monotonic()
+        self._append(lines)
+
+    def flush(self):
+        with self._lock:
+            lines, self._lines = self._lines, []
+            self._flushed_at = time.monotonic()
+        self._append(lines)
+
+    def _append(self, lines):
+        if not lines:
+            return
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            print("Could not write profile trace:", e)
+
+
+class StageTrace:
+    """Nanoseconds per stage for one sampled datagram or chunk.
+
+    mark(stage) charges the time since the previous mark (or the start) to
+    `stage`; repeated marks add up, so a loop over a frame's records or a
+    chunk's rows can mark the same stage every iteration.
+    """
+
+    __slots__ = ("kind", "ns", "rows", "_last")
+
+    def __init__(self, kind, queued_at=None):
+        self.kind = kind
+        self.ns = {}
+        self.rows = None
+        self._last = time.perf_counter_ns()
+        if queued_at is not None:   # a perf_counter() stamp taken when the datagram arrived
+            self.ns["receive"] = max(0, self._last - int(queued_at * 1e9))
+
+    def mark(self, stage):
+        now = time.perf_counter_ns()
+        self.ns[stage] = self.ns.get(stage, 0) + now - self._last
+        self._last = now
+
+    def record(self):
+        r = {"type": self.kind, "at": time.time(), "ns": self.ns}
+        if self.rows is not None:
+            r["rows"] = self.rows
+        return r
+
+
+class StageSampler:
+    """Hands out a StageTrace for one call in `every`, per kind."""
+
+    def __init__(self, fraction=PROFILE_SAMPLE, path=TRACE_FILE):
+        if not 0 < fraction <= 1:
+            raise ValueError("profile sample fraction must be in (0, 1]")
+        self.every = max(1, round(1 / fraction))
+        self.writer = TraceWriter(path)
+        self._ticks = {"packet": itertools.count(), "chunk": itertools.count(),
+                       "commit": itertools.count()}
+
+    def begin(self, kind, queued_at=None):
+        if next(self._ticks[kind]) % self.every:
+            return None
+        return StageTrace(kind, queued_at)
+
+    def finish(self, trace):
+        self.writer.write(trace.record())
+
+
+sampler = StageSampler() if PROFILE_SAMPLE > 0 else None
+
+
+def enable(fraction=PROFILE_SAMPLE, path=TRACE_FILE):
+    """Turn stage tracing on (or off with fraction 0) for this process."""
+    global sampler
+    if sampler is not None:
+        sampler.writer.flush()
+    sampler = StageSampler(fraction, path) if fraction > 0 else None
+    return sampler
+
+
+def begin(kind="packet", queued_at=None):
+    """A StageTrace if tracing is on and this call is sampled, else None."""
+    s = sampler
+    return None if s is None else s.begin(kind, queued_at)
+
+
+def finish(trace):
+    s = sampler
+    if trace is not None and s is not None:
+        s.finish(trace)
+
+
+def flush():
+    if sampler is not None:
+        sampler.writer.flush()
+
+
+# --- on-demand windows: cProfile + stack samples ---
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Capture:
+    """One profiling window.
+
+    cProfile only sees the thread that enabled it, so every thread that
+    should be profiled calls enable() and disable() itself (the receivers do
+    this for the event loop and the I/O executor). The stack sampler covers
+    all threads, including the DB writer and log writer, without their help.
+    """
+
+    def __init__(self, seconds=WINDOW_SECS, interval=STACK_INTERVAL):
+        self.seconds = min(max(0.1, float(seconds)), MAX_WINDOW_SECS)
+        self.interval = interval
+        self.started_at = None
+        self.deadline = None
+        self._profiles = {}
+        self._stacks = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.time()
+        self.deadline = time.monotonic() + self.seconds
+        self._thread = threading.Thread(target=self._sample_stacks, name="airlock-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def enable(self):
+        """Profile the calling thread until it calls disable()."""
+        prof = cProfile.Profile()
+        with self._lock:
+            self._profiles[threading.get_ident()] = prof
+        prof.enable()
+
+    def disable(self):
+        with self._lock:
+            prof = self._profiles.get(threading.get_ident())
+        if prof is not None:
+            prof.disable()
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def _sample_stacks(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                key = ";".join(reversed(stack))
+                self._stacks[key] = self._stacks.get(key, 0) + 1
+
+    def stop(self):
+        """Stop sampling; returns the window record (profiles not disabled yet are skipped)."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        stats = None
+        with self._lock:
+            profiles = list(self._profiles.values())
+        for prof in profiles:
+            try:
+                if stats is None:
+                    stats = pstats.Stats(prof)
+                else:
+                    stats.add(prof)
+            except TypeError:   # never enabled long enough to collect anything
+                continue
+        functions = []
+        if stats is not None:
+            for (path, line, name), (cc, nc, tt, ct, _) in stats.stats.items():
+                functions.append([f"{name} ({os.path.basename(path)}:{line})", nc, tt, ct])
+            functions.sort(key=lambda f: f[2], reverse=True)
+        return {"type": "window", "at": self.started_at, "seconds": round(time.time() - self.started_at, 3),
+                "requested_seconds": self.seconds,
+                "threads_profiled": len(profiles), "stack_interval": self.interval,
+                "functions": functions[:MAX_FUNCTIONS], "stacks": self._stacks}
+
+
+class WindowTrigger:
+    """Pending window requests from a signal handler or the HTTP listener.
+
+    request() only stores a number, so it is safe inside a signal handler;
+    the receiver's own loop picks it up with take() and runs the Capture.
+    """
+
+    def __init__(self):
+        self.pending = None
+        self.running = False
+
+    def request(self, seconds=WINDOW_SECS):
+        if self.running or self.pending is not None:
+            return False
+        self.pending = float(seconds)
+        return True
+
+    def take(self):
+        seconds, self.pending = self.pending, None
+        return seconds
+
+    def install_signal(self, sig_name="SIGUSR1"):
+        """Start a WINDOW_SECS window on `sig_name` (main thread, where the platform has it)."""
+        import signal
+        sig = getattr(signal, sig_name, None)
+        if sig is None:
+            return False
+        signal.signal(sig, lambda *_: self.request())
+        return True
+
+    def http_action(self, query):
+        """metrics.serve() action for POST /profile?seconds=N."""
+        try:
+            seconds = float(query.get("seconds", [WINDOW_SECS])[0])
+        except ValueError:
+            return 400, {"error": "seconds must be a number"}
+        if not 0 < seconds <= MAX_WINDOW_SECS:
+            return 400, {"error": f"seconds must be in (0, {MAX_WINDOW_SECS}]"}
+        if not self.request(seconds):
+            return 409, {"error": "a profiling window is already pending or running"}
+        return 202, {"started": True, "seconds": seconds, "trace": current_trace_file()}
+
+
+trigger = WindowTrigger()
+
+
+def current_trace_file():
+    return sampler.writer.path if sampler is not None else TRACE_FILE
+
+
+def write_window(record, path=None):
+    """Append a finished window to the trace file and flush stage traces with it."""
+    flush()
+    TraceWriter(path or current_trace_file())._append([json.dumps(record, separators=(",", ":"))])
+    top = ", ".join(f[0] for f in record["functions"][:3]) or "no profiled calls"
+    print(f"Profile window ({record['seconds']:g}s) written to {path or current_trace_file()}; top: {top}")
@@ -1,40 +1,26 @@
 #!/usr/bin/env python3
 # query_last.py — print last N telemetry rows; auto-initialize table if missing
 
-import sqlite3
 import sys
+import json
 from textwrap import shorten
 import os
+from schema import init_db
+import raw_codec
 
 DB_FILE = "airlock.db"
 N = int(sys.argv[1]) if len(sys.argv) > 1 else 10
 
-SCHEMA = """
-CREATE TABLE IF NOT EXISTS telemetry (
-    msg_id TEXT PRIMARY KEY,
-    ts REAL,
-    altitude INTEGER,
-    speed INTEGER,
-    battery INTEGER,
-    lat REAL,
-    lon REAL,
-    raw TEXT NOT NULL,
-    inserted_at REAL DEFAULT (strftime('%s','now'))
-)
-"""
-
 if not os.path.exists(DB_FILE):
     print("[info] database file not found; creating", DB_FILE)
 
-con = sqlite3.connect(DB_FILE)
+# Ensure table exists (and is migrated to the current schema)
+con = init_db(DB_FILE)
 cur = con.cursor()
-# Ensure table exists
-cur.execute(SCHEMA)
-con.commit()
 
 # Query last N rows (may be empty if no data received yet)
 cur.execute("""
-    SELECT msg_id, ts, altitude, speed, battery, lat, lon, raw
+    SELECT msg_id, drone_id, ts, altitude, speed, battery, lat, lon, raw, raw_enc
     FROM telemetry
     ORDER BY inserted_at DESC
     LIMIT ?
@@ -46,7 +32,8 @@ if not rows:
     print("[info] No rows found. Start receiver_client.py (and app.py to send) first.")
 else:
     for i, r in enumerate(rows, 1):
-        msg_id, ts, alt, spd, bat, lat, lon, raw = r
+        msg_id, drone_id, ts, alt, spd, bat, lat, lon, raw, raw_enc = r
+        raw = json.dumps(raw_codec.decode(raw, raw_enc, dict(zip(raw_codec.COLUMNS, r))))
         ts_str = f"{ts:.3f}" if ts is not None else "None"
-        print(f"{i:02d}. id={msg_id} ts={ts_str} alt={alt} spd={spd} bat={bat} lat={lat} lon={lon}")
+        print(f"{i:02d}. id={msg_id} drone={drone_id} ts={ts_str} alt={alt} spd={spd} bat={bat} lat={lat} lon={lon}")
         print("    raw:", shorten(raw or "", width=120, placeholder="…"))
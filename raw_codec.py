@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# raw_codec.py — how the telemetry.raw column is stored
+#
+# Every field the dashboard uses already has its own column, so keeping the
+# whole decrypted JSON again in `raw` mostly duplicates them. The encoding
+# of each row is recorded in telemetry.raw_enc:
+#   0  json    the decrypted JSON text (rows from before raw_enc)
+#   1  zlib    that text, raw-deflated against a preset dictionary of the
+#              common keys (small records barely compress without one)
+#   2  extras  JSON of only what the columns cannot hold exactly ("" if
+#              none): keys without a column, and core values whose type
+#              the column's affinity would change ("120" in altitude, an
+#              int ts, a null drone_id); the full object is rebuilt from
+#              the columns on read
+# AIRLOCK_RAW_STORAGE picks the encoding for new rows; row_encoding() turns
+# extras into zlib for a record missing a core key, which the columns would
+# bring back as null. Every encoding decodes to the original record.
+# Readers go through decode(), which handles all three, so a database may
+# mix them.
+
+import json
+import os
+import zlib
+
+RAW_JSON = 0
+RAW_ZLIB = 1
+RAW_EXTRAS = 2
+STORAGE_MODES = {"json": RAW_JSON, "zlib": RAW_ZLIB, "extras": RAW_EXTRAS}
+
+RAW_STORAGE = os.environ.get("AIRLOCK_RAW_STORAGE", "extras")
+ZLIB_LEVEL = 6
+
+# Frozen: rows compressed against it can only be read back with it. A new
+# dictionary needs a new raw_enc value.
+ZDICT = (b'{"msg_id": "", "drone_id": "drone-", "ts": 1.0, "altitude": , "speed": , '
+         b'"battery": , "location": {"lat": , "lon": }}')
+
+# columns a row needs for decode(); keys of the rebuilt object, in order
+COLUMNS = ("msg_id", "drone_id", "ts", "altitude", "speed", "battery", "lat", "lon")
+_CORE_KEYS = {"msg_id", "drone_id", "ts", "altitude", "speed", "battery", "location"}
+_REBUILT_KEYS = _CORE_KEYS - {"drone_id"}   # always present after decode(); drone_id only if not NULL
+_INT64 = (-2 ** 63, 2 ** 63)
+
+
+def storage_mode(name=RAW_STORAGE):
+    try:
+        return STORAGE_MODES[name]
+    except KeyError:
+        raise ValueError(f"unknown raw storage {name!r}; expected one of {', '.join(STORAGE_MODES)}")
+
+
+def _real_exact(v):
+    # REAL affinity: ints come back as floats, numeric text as numbers, NaN as NULL
+    return v is None or (type(v) is float and v == v)
+
+
+def _integer_exact(v):
+    # INTEGER affinity: integral floats come back as ints, numeric text as numbers
+    if v is None:
+        return True
+    if type(v) is int:
+        return _INT64[0] <= v < _INT64[1]
+    return type(v) is float and v == v and not v.is_integer()
+
+
+def _column_exact(key, v):
+    """True if value v of core key `key` reads back unchanged from its column(s)."""
+    if key in ("msg_id", "drone_id"):
+        return isinstance(v, str)
+    if key == "ts":
+        return _real_exact(v)
+    if key == "location":
+        return (isinstance(v, dict) and v.keys() == {"lat", "lon"}
+                and _real_exact(v["lat"]) and _real_exact(v["lon"]))
+    return _integer_exact(v)
+
+
+def row_encoding(telemetry, enc):
+    """Encoding to store this record in: `enc`, or RAW_ZLIB where RAW_EXTRAS cannot rebuild it."""
+    if enc == RAW_EXTRAS and not _REBUILT_KEYS <= telemetry.keys():
+        return RAW_ZLIB
+    return enc
+
+
+def encode(telemetry, decrypted, enc=RAW_JSON):
+    """Value for the raw column of a verified record, in encoding `enc`."""
+    if enc == RAW_JSON:
+        return decrypted
+    if enc == RAW_ZLIB:
+        z = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, -15, zdict=ZDICT)
+        return z.compress(decrypted.encode()) + z.flush()
+    if enc == RAW_EXTRAS:
+        extras = {k: v for k, v in telemetry.items() if k not in _CORE_KEYS or not _column_exact(k, v)}
+        return json.dumps(extras) if extras else ""
+    raise ValueError(f"unknown raw encoding {enc!r}")
+
+
+def decode(raw, enc, row=None):
+    """Telemetry dict from a stored raw value (None if it is not a JSON object).
+
+    `row` maps COLUMNS to the row's values; only RAW_EXTRAS needs it.
+    """
+    if enc == RAW_ZLIB:
+        z = zlib.decompressobj(-15, zdict=ZDICT)
+        raw = (z.decompress(raw) + z.flush()).decode()
+    elif enc == RAW_EXTRAS:
+        t = {"msg_id": row["msg_id"]}
+        if row["drone_id"] is not None:
+            t["drone_id"] = row["drone_id"]
+        t.update(ts=row["ts"], altitude=row["altitude"], speed=row["speed"], battery=row["battery"],
+                 location={"lat": row["lat"], "lon": row["lon"]})
+        if raw:
+            t.update(json.loads(raw))
+        return t
+    if not raw:
+        return None
+    try:
+        t = json.loads(raw)
+    except ValueError:
+        return None
+    return t if isinstance(t, dict) else None
@@ -1,149 +1,213 @@
 #!/usr/bin/env python3
-# receiver_client.py — UDP receiver with anti-replay + SQLite storage
-
+# receiver_client.py — asyncio UDP receiver with anti-replay + SQLite storage
+#
+# Stages (decoupled by bounded asyncio queues), all from ingest.py:
+#   socket -> [raw queue] -> decrypt/validate/dedupe -> [verified queue] -> persist
+# The DatagramProtocol only enqueues, so the socket keeps draining while the
+# persist stage hands blocking file/SQLite work to a single-thread executor.
+# Metrics (see metrics.py) are served on AIRLOCK_METRICS_ADDR. Profiling (see
+# profiling.py): AIRLOCK_PROFILE_SAMPLE traces a share of datagrams stage by
+# stage, and SIGUSR1 or POST /profile?seconds=N on the metrics listener runs
+# cProfile on the loop and I/O threads for a window.
+
+import asyncio
+import os
+import signal
 import socket
-from cryptography.fernet import Fernet
-import json
 import time
-import os
-import sqlite3
-from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-FERNET_KEY = os.environ.get("FERNET_KEY") or b'HyMs5PCyDY5oWoEKZs98gwwU7ZKxSBrqifkQHVCHn-s='
-cipher = Fernet(FERNET_KEY)
+import metrics
+import profiling
+from ingest import DB_FILE, REPLAY_SNAPSHOT_INTERVAL, STAGE_SECONDS, IngestPipeline, replay_cache
 
 UDP_BIND = ('localhost', 9998)
-TELEMETRY_FILE = "latest_telemetry.json"
-LOG_FILE = "telemetry_log.txt"
-DB_FILE = "airlock.db"
-
-# Anti-replay config
-MAX_SKEW_SECONDS = 60        # reject packets older/newer than this window
-SEEN_WINDOW = 2000           # remember last N msg_ids
-seen_ids = deque(maxlen=SEEN_WINDOW)
-
-# DB init
-def init_db():
-    con = sqlite3.connect(DB_FILE)
-    cur = con.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS telemetry (
-            msg_id TEXT PRIMARY KEY,
-            ts REAL,
-            altitude INTEGER,
-            speed INTEGER,
-            battery INTEGER,
-            lat REAL,
-            lon REAL,
-            raw TEXT NOT NULL,
-            inserted_at REAL DEFAULT (strftime('%s','now'))
-        )
-    """)
-    con.commit()
-    return con
-
-def store_row(con, msg_id, ts, telemetry, raw):
-    cur = con.cursor()
-    altitude = telemetry.get("altitude")
-    speed = telemetry.get("speed")
-    battery = telemetry.get("battery")
-    loc = telemetry.get("location", {})
-    lat = loc.get("lat")
-    lon = loc.get("lon")
-    cur.execute("""
-        INSERT OR IGNORE INTO telemetry (msg_id, ts, altitude, speed, battery, lat, lon, raw)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (msg_id, ts, altitude, speed, battery, lat, lon, raw))
-    con.commit()
-
-def within_time_window(ts):
-    try:
-        now = time.time()
-        return abs(now - float(ts)) <= MAX_SKEW_SECONDS
-    except Exception:
-        return False
-
-def pretty_print(t):
-    print("\n--- Telemetry Received ---")
-    print(f"ID: {t.get('msg_id')}")
-    print(f"TS: {t.get('ts')}")
-    print(f"Altitude: {t.get('altitude')}")
-    print(f"Speed: {t.get('speed')}")
-    print(f"Battery: {t.get('battery')}")
-    loc = t.get('location', {})
-    print(f"Location: {loc.get('lat')}, {loc.get('lon')}")
-
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.bind(UDP_BIND)
-print(f"Receiver ready. Waiting for encrypted data on udp://{UDP_BIND[0]}:{UDP_BIND[1]}")
-
-con = init_db()
-
-try:
-    while True:
-        try:
-            data, addr = sock.recvfrom(65536)
-
-            # decrypt
-            try:
-                decrypted = cipher.decrypt(data).decode()
-            except Exception as e:
-                print("Failed to decrypt packet from", addr, ":", e)
-                continue
-
-            # parse JSON
-            try:
-                t = json.loads(decrypted)
-            except json.JSONDecodeError:
-                # still log raw
-                ts_log = time.strftime('%Y-%m-%d %H:%M:%S')
-                with open(LOG_FILE, "a") as f:
-                    f.write(f"{ts_log} - {decrypted}\n")
-                print("Telemetry (raw/non-JSON):", decrypted)
-                continue
-
-            # anti-replay checks
-            msg_id = t.get("msg_id")
-            ts = t.get("ts")
 
-            if not msg_id or not ts:
-                print("Rejecting packet: missing msg_id/ts")
-                continue
-
-            if msg_id in seen_ids:
-                print(f"Rejecting replayed msg_id {msg_id}")
-                continue
+# Pipeline config
+RAW_QUEUE_SIZE = int(os.environ.get("AIRLOCK_RAW_QUEUE", "10000"))          # datagrams awaiting decrypt
+VERIFIED_QUEUE_SIZE = int(os.environ.get("AIRLOCK_VERIFIED_QUEUE", "10000"))  # packets awaiting persist
+PERSIST_CHUNK = 256          # max packets handed to the I/O executor at once
+YIELD_EVERY = 64             # decrypt stage yields to the loop after this many packets
+RECV_BUFFER_BYTES = int(os.environ.get("AIRLOCK_RCVBUF", str(4 * 1024 * 1024)))
 
-            if not within_time_window(ts):
-                print(f"Rejecting stale/future packet (ts={ts})")
-                continue
-
-            seen_ids.append(msg_id)
+_STOP = object()
 
-            # pretty print
-            pretty_print(t)
+RECEIVED = metrics.counter("airlock_receiver_datagrams", "Datagrams read from the UDP socket.")
+DROPPED = metrics.counter("airlock_receiver_dropped", "Datagrams dropped because the raw queue was full.")
+QUEUE_DEPTH = metrics.gauge("airlock_receiver_queue", "Items waiting between receiver stages.", ("queue",))
+_receive_seconds = STAGE_SECONDS.labels("receive")   # time a sampled datagram waits in the raw queue
+_timed = metrics.sampler()
 
-            # write latest to JSON
-            with open(TELEMETRY_FILE, "w") as f:
-                json.dump(t, f)
 
-            # append to logfile with timestamp
-            ts_log = time.strftime('%Y-%m-%d %H:%M:%S')
-            with open(LOG_FILE, "a") as f:
-                f.write(f"{ts_log} - {decrypted}\n")
+class ReceiverProtocol(asyncio.DatagramProtocol):
+    """Receive stage: enqueue datagrams and return immediately."""
 
-            # store in DB
-            store_row(con, msg_id, ts, t, decrypted)
+    def __init__(self, queue):
+        self.queue = queue
+        self.dropped = 0
 
-        except KeyboardInterrupt:
-            print("Receiver shutting down.")
-            break
-        except Exception as e:
-            print("Receiver error:", e)
-            time.sleep(0.5)
-finally:
+    def datagram_received(self, data, addr):
+        RECEIVED.inc()
+        try:
+            stamped = profiling.sampler is not None or _timed()
+            self.queue.put_nowait((data, addr, time.perf_counter() if stamped else None))
+        except asyncio.QueueFull:
+            DROPPED.inc()
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                print(f"Receiver backlog full; dropped {self.dropped} datagrams so far")
+
+    def error_received(self, exc):
+        print("Receiver error:", exc)
+
+
+class AirlockReceiver:
+    """Importable UDP receiver. Run with asyncio.run(AirlockReceiver().serve())."""
+
+    def __init__(self, bind=UDP_BIND, db_file=DB_FILE, verbose=True, metrics_addr=metrics.METRICS_ADDR):
+        self.bind = bind
+        self.db_file = db_file
+        self.verbose = verbose
+        self.metrics_addr = metrics_addr
+        self.pipeline = IngestPipeline(db_file, verbose)
+        self.protocol = None
+        self._stopping = None
+        self._raw = None
+        self._verified = None
+        # one thread keeps file writes ordered; SQLite has its own writer thread
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="airlock-io")
+
+    def stop(self):
+        if self._stopping is not None:
+            self._stopping.set()
+
+    def _make_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_BYTES)
+        except OSError as e:
+            print("Could not enlarge socket receive buffer:", e)
+        sock.bind(self.bind)
+        return sock
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._raw = asyncio.Queue(maxsize=RAW_QUEUE_SIZE)
+        self._verified = asyncio.Queue(maxsize=VERIFIED_QUEUE_SIZE)
+        QUEUE_DEPTH.labels("raw").set_function(self._raw.qsize)
+        QUEUE_DEPTH.labels("verified").set_function(self._verified.qsize)
+
+        await loop.run_in_executor(self._io, self.pipeline.open)
+        metrics_server = metrics.serve(self.metrics_addr, actions={"/profile": profiling.trigger.http_action})
+        if hasattr(signal, "SIGUSR1"):
+            loop.add_signal_handler(signal.SIGUSR1, profiling.trigger.request)
+
+        transport, self.protocol = await loop.create_datagram_endpoint(
+            lambda: ReceiverProtocol(self._raw), sock=self._make_socket())
+        print(f"Receiver ready. Waiting for encrypted data on udp://{self.bind[0]}:{self.bind[1]}")
+
+        stages = [
+            asyncio.ensure_future(self._validate_stage()),
+            asyncio.ensure_future(self._persist_stage()),
+        ]
+        snapshots = asyncio.ensure_future(self._snapshot_loop())
+        windows = asyncio.ensure_future(self._profile_loop())
+        try:
+            await self._stopping.wait()
+        finally:
+            # stop receiving, then let both stages drain what is already queued
+            transport.close()
+            await self._raw.put(_STOP)
+            await asyncio.gather(*stages)
+            snapshots.cancel()
+            windows.cancel()
+            await asyncio.gather(windows, return_exceptions=True)   # a window disables on the I/O thread
+            await loop.run_in_executor(self._io, self.pipeline.close)
+            profiling.flush()
+            self._io.shutdown()
+            if metrics_server is not None:
+                metrics_server.shutdown()
+                metrics_server.server_close()
+
+    async def _validate_stage(self):
+        handled = 0
+        while True:
+            item = await self._raw.get()
+            if item is _STOP:
+                await self._verified.put(_STOP)
+                return
+            data, addr, queued_at = item
+            if queued_at is not None:
+                _receive_seconds.observe(time.perf_counter() - queued_at)
+            for result in self.pipeline.validate(data, addr, queued_at):
+                await self._verified.put(result)
+            handled += 1
+            if handled % YIELD_EVERY == 0:
+                await asyncio.sleep(0)   # let the protocol drain the socket
+
+    async def _snapshot_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(REPLAY_SNAPSHOT_INTERVAL)
+            # copy on the loop thread (which owns the cache), write on the executor
+            snap = replay_cache.snapshot()
+            await loop.run_in_executor(self._io, self.pipeline.snapshot, snap)
+
+    async def _profile_loop(self):
+        loop = asyncio.get_running_loop()
+        trigger = profiling.trigger
+        while True:
+            await asyncio.sleep(0.25)
+            seconds = trigger.take()
+            if seconds is None:
+                continue
+            trigger.running = True
+            capture = profiling.Capture(seconds).start()
+            print(f"Profiling for {capture.seconds:g}s")
+            try:
+                # cProfile is per thread: this (loop) thread runs decrypt/validate,
+                # the single I/O worker runs persist
+                capture.enable()
+                await loop.run_in_executor(self._io, capture.enable)
+                await asyncio.sleep(capture.seconds)
+            finally:
+                # also on shutdown, so a window cut short still lands in the trace
+                capture.disable()
+                await loop.run_in_executor(self._io, capture.disable)
+                trigger.running = False
+                await loop.run_in_executor(self._io, profiling.write_window, capture.stop())
+
+    async def _persist_stage(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            chunk = [await self._verified.get()]
+            while len(chunk) < PERSIST_CHUNK and not self._verified.empty():
+                chunk.append(self._verified.get_nowait())
+            stop = chunk[-1] is _STOP
+            if stop:
+                chunk.pop()
+            if chunk:
+                try:
+                    await loop.run_in_executor(self._io, self._persist, chunk)
+                except Exception as e:
+                    print("Receiver error:", e)
+            if stop:
+                return
+
+    def _persist(self, chunk):
+        """Blocking half of the pipeline; runs on the I/O executor."""
+        self.pipeline.persist(chunk)
+
+
+def main():
+    receiver = AirlockReceiver()
     try:
-        con.close()
-    except Exception:
+        asyncio.run(receiver.serve())
+    except KeyboardInterrupt:
         pass
-    sock.close()
+    print("Receiver shutting down.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# receiver_workers.py — multi-process UDP receiver (decrypt/validate on every core)
+#
+# Sharding modes:
+#   reuseport  N worker processes each bind UDP_BIND with SO_REUSEPORT and the
+#              kernel spreads flows (by source address/port) across them.
+#   fanout     one reader process drains the socket and deals batches of
+#              datagrams to N worker processes through a shared queue.
+# Workers run ingest.decode_packet() in parallel. Their results go to this
+# (parent) process, the single persistence stage: its IngestPipeline applies
+# the global anti-replay check, then stores and fans out through one
+# BatchWriter.
+#
+# Metrics are served from the parent on AIRLOCK_METRICS_ADDR: the validate
+# and persist stages, the writer and the result queue. Decrypt/parse timings
+# and their rejections are counted inside the workers and are not exported.
+# With AIRLOCK_PROFILE_SAMPLE set, workers trace decrypt/parse/validate and
+# the parent traces persist chunks into the same trace file; SIGUSR1 or
+# POST /profile on the parent profiles the parent's persist loop (see
+# profiling.py).
+#
+# Usage: python receiver_workers.py [N]
+
+import multiprocessing as mp
+import os
+import queue
+import signal
+import socket
+import sys
+import time
+
+import ingest
+import metrics
+import profiling
+import receiver_client as rc
+
+WORKERS = int(os.environ.get("AIRLOCK_WORKERS", "0")) or os.cpu_count() or 1
+SHARDING = os.environ.get("AIRLOCK_SHARDING", "auto")   # auto / reuseport / fanout
+
+BATCH = 64                 # items per inter-process message (amortises pickling)
+BATCH_MAX_DELAY = 0.05     # seconds a partial batch may wait before it is sent
+QUEUE_BATCHES = 1024       # bound on batches buffered between processes
+
+_DONE = "done"
+
+
+def _bind(reuse_port=False):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rc.RECV_BUFFER_BYTES)
+    except OSError:
+        pass
+    sock.bind(rc.UDP_BIND)
+    sock.settimeout(BATCH_MAX_DELAY)
+    return sock
+
+
+class _Batcher:
+    """Collects items and puts them on a queue as lists by size or age."""
+
+    def __init__(self, out):
+        self.out = out
+        self.items = []
+        self.first_at = 0.0
+
+    def add(self, item):
+        if not self.items:
+            self.first_at = time.monotonic()
+        self.items.append(item)
+        if len(self.items) >= BATCH:
+            self.flush()
+
+    def tick(self):
+        if self.items and time.monotonic() - self.first_at >= BATCH_MAX_DELAY:
+            self.flush()
+
+    def flush(self):
+        if self.items:
+            self.out.put(self.items)
+            self.items = []
+
+
+def _decode(data, addr):
+    trace = profiling.begin("packet")
+    results = ingest.decode_packet(data, addr, trace)
+    profiling.finish(trace)
+    return results
+
+
+def _reuseport_worker(results, stop):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)   # the parent coordinates shutdown
+    sock = _bind(reuse_port=True)
+    out = _Batcher(results)
+    try:
+        while not stop.is_set():
+            try:
+                data, addr = sock.recvfrom(65536)
+            except socket.timeout:
+                out.tick()
+                continue
+            for result in _decode(data, addr):
+                out.add(result)
+            out.tick()
+    finally:
+        sock.close()
+        out.flush()
+        profiling.flush()
+        results.put(_DONE)
+
+
+def _fanout_reader(tasks, stop, n_workers):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    sock = _bind()
+    out = _Batcher(tasks)
+    try:
+        while not stop.is_set():
+            try:
+                out.add(sock.recvfrom(65536))
+            except socket.timeout:
+                pass
+            out.tick()
+    finally:
+        sock.close()
+        out.flush()
+        for _ in range(n_workers):
+            tasks.put(None)
+
+
+def _fanout_worker(tasks, results):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    out = _Batcher(results)
+    try:
+        while True:
+            try:
+                batch = tasks.get(timeout=BATCH_MAX_DELAY)
+            except queue.Empty:
+                out.tick()
+                continue
+            if batch is None:
+                break
+            for data, addr in batch:
+                for result in _decode(data, addr):
+                    out.add(result)
+            out.tick()
+    finally:
+        out.flush()
+        profiling.flush()
+        results.put(_DONE)
+
+
+def _poll_window(capture):
+    """Start or finish a requested profiling window on this (the persist) thread."""
+    trigger = profiling.trigger
+    if capture is None:
+        seconds = trigger.take()
+        if seconds is None:
+            return None
+        trigger.running = True
+        capture = profiling.Capture(seconds).start()
+        print(f"Profiling for {capture.seconds:g}s")
+        capture.enable()
+        return capture
+    if capture.expired():
+        capture.disable()
+        profiling.write_window(capture.stop())
+        trigger.running = False
+        return None
+    return capture
+
+
+def resolve_sharding(mode=SHARDING):
+    if mode == "auto":
+        return "reuseport" if hasattr(socket, "SO_REUSEPORT") else "fanout"
+    if mode not in ("reuseport", "fanout"):
+        raise ValueError(f"unknown sharding mode {mode!r}; expected auto, reuseport or fanout")
+    if mode == "reuseport" and not hasattr(socket, "SO_REUSEPORT"):
+        raise ValueError("SO_REUSEPORT is not available on this platform; use fanout")
+    return mode
+
+
+def run(workers=WORKERS, sharding=SHARDING, verbose=True):
+    mode = resolve_sharding(sharding)
+    results = mp.Queue(maxsize=QUEUE_BATCHES)
+    stop = mp.Event()
+    procs = []
+    if mode == "reuseport":
+        for _ in range(workers):
+            procs.append(mp.Process(target=_reuseport_worker, args=(results, stop), daemon=True))
+    else:
+        tasks = mp.Queue(maxsize=QUEUE_BATCHES)
+        procs.append(mp.Process(target=_fanout_reader, args=(tasks, stop, workers), daemon=True))
+        for _ in range(workers):
+            procs.append(mp.Process(target=_fanout_worker, args=(tasks, results), daemon=True))
+    # fork before this process starts any thread (BatchWriter, log writer,
+    # metrics server): a child forked while one of them holds a lock would
+    # inherit it locked
+    for p in procs:
+        p.start()
+    profiling.trigger.install_signal()   # after the fork, so only the parent answers SIGUSR1
+
+    pipeline = metrics_server = None
+    done = 0
+    capture = None
+    try:
+        pipeline = ingest.IngestPipeline(verbose=verbose).open()
+        metrics_server = metrics.serve(actions={"/profile": profiling.trigger.http_action})
+        rc.QUEUE_DEPTH.labels("results").set_function(results.qsize)
+        print(f"Receiver ready ({workers} workers, {mode}). "
+              f"Waiting for encrypted data on udp://{rc.UDP_BIND[0]}:{rc.UDP_BIND[1]}")
+
+        while done < workers:
+            pipeline.maybe_snapshot()
+            capture = _poll_window(capture)
+            try:
+                batch = results.get(timeout=0.5)
+            except KeyboardInterrupt:
+                stop.set()
+                continue
+            except queue.Empty:
+                if not any(p.is_alive() for p in procs):
+                    print("All receiver workers exited.")
+                    break
+                continue
+            if batch == _DONE:
+                done += 1
+                continue
+            try:
+                pipeline.persist(ingest.accept_records(batch))
+            except KeyboardInterrupt:
+                stop.set()
+            except Exception as e:
+                print("Receiver error:", e)
+    finally:
+        stop.set()
+        if capture is not None:
+            capture.deadline = 0   # cut the window short and keep what it has
+            _poll_window(capture)
+        if pipeline is not None:
+            pipeline.close()   # flushes buffered rows and the log, snapshots the replay cache
+        profiling.flush()
+        for p in procs:
+            p.join(timeout=2)
+        if metrics_server is not None:
+            metrics_server.shutdown()
+            metrics_server.server_close()
+        print("Receiver shutting down.")
+
+
+if __name__ == "__main__":
+    run(workers=int(sys.argv[1]) if len(sys.argv) > 1 else WORKERS)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# replay_cache.py — O(1) anti-replay cache with time-bucketed eviction
+#
+# msg_ids are kept in a dict (hash lookup) and grouped into buckets by the
+# packet's own timestamp. A bucket is dropped once every timestamp it can hold
+# is older than the skew window: such packets already fail the freshness check,
+# so forgetting their ids cannot reopen a replay. Memory is therefore bounded
+# by the traffic of roughly one window, plus a hard cap (max_entries).
+
+import json
+import os
+import threading
+import time
+
+SNAPSHOT_VERSION = 1
+
+
+class ReplayCache:
+    """Remembers msg_ids for `window` seconds past their packet timestamp.
+
+    bucket_seconds defaults to the window itself, so buckets line up with
+    MAX_SKEW_SECONDS and at most three are live (past, current, future).
+    When max_entries ids are held, new ids are rejected (fail closed) rather
+    than evicting live ids, which would let those messages be replayed.
+    """
+
+    def __init__(self, window, bucket_seconds=None, max_entries=1_000_000):
+        self.window = float(window)
+        self.bucket_seconds = float(bucket_seconds or window)
+        self.max_entries = int(max_entries)
+        self.overflows = 0
+        self._ids = {}         # msg_id -> bucket
+        self._buckets = {}     # bucket -> set of msg_ids
+        self._expired_below = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, msg_id):
+        return msg_id in self._ids
+
+    def check_and_add(self, msg_id, ts, now=None):
+        """Return True and remember msg_id if it is new; False if it must be rejected.
+
+        ts must already have passed the freshness check.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._expire(now)
+            if msg_id in self._ids:
+                return False
+            if len(self._ids) >= self.max_entries:
+                self.overflows += 1
+                return False
+            bucket = int(float(ts) // self.bucket_seconds)
+            self._ids[msg_id] = bucket
+            self._buckets.setdefault(bucket, set()).add(msg_id)
+            return True
+
+    def _expire(self, now):
+        # every ts in bucket b is < (b + 1) * bucket_seconds
+        oldest_live = int((now - self.window) // self.bucket_seconds)
+        if oldest_live == self._expired_below:
+            return
+        self._expired_below = oldest_live
+        for bucket in [b for b in self._buckets if b < oldest_live]:
+            for msg_id in self._buckets.pop(bucket):
+                del self._ids[msg_id]
+
+    # --- persistence ---
+    def snapshot(self):
+        """Return a JSON-serialisable copy of the live ids."""
+        with self._lock:
+            return {
+                "version": SNAPSHOT_VERSION,
+                "window": self.window,
+                "bucket_seconds": self.bucket_seconds,
+                "saved_at": time.time(),
+                "buckets": {str(b): list(ids) for b, ids in self._buckets.items()},
+            }
+
+    def save(self, path, snap=None):
+        """Atomically write a snapshot (tmp file + rename)."""
+        snap = self.snapshot() if snap is None else snap
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(snap, f)
+        os.replace(tmp, path)
+
+    def load(self, path, now=None):
+        """Merge ids from a snapshot file; returns how many live ids were restored."""
+        if not os.path.exists(path):
+            return 0
+        with open(path) as f:
+            snap = json.load(f)
+        if snap.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"unsupported replay snapshot version {snap.get('version')!r}")
+        width = float(snap["bucket_seconds"])
+        with self._lock:
+            before = len(self._ids)
+            for key, ids in snap["buckets"].items():
+                # re-bucket by the end of the saved bucket in case the width
+                # changed; erring late keeps ids at least as long as before
+                bucket = int(((int(key) + 1) * width) // self.bucket_seconds)
+                target = self._buckets.setdefault(bucket, set())
+                for msg_id in ids:
+                    if msg_id not in self._ids:
+                        self._ids[msg_id] = bucket
+                        target.add(msg_id)
+            self._expired_below = None
+            self._expire(time.time() if now is None else now)
+            return len(self._ids) - before
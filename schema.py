@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# schema.py — versioned telemetry schema + in-place migrations
+#
+# Every entry point (receivers, Flask server, query_last.py) opens the
+# database through init_db(), which brings it up to SCHEMA_VERSION.
+# The applied version is tracked in PRAGMA user_version; databases created
+# before versioning report 0 and are upgraded in place.
+#
+# Usage: python schema.py [db_file]     (upgrade and print the version)
+
+import sqlite3
+import sys
+
+DB_FILE = "airlock.db"
+
+LOW_BATTERY_PCT = 20     # battery below this counts towards low_bat in the rollups
+
+# --- rollups: per-second / per-minute aggregates kept current by triggers ---
+_NUM = "typeof({0}) IN ('integer','real')"
+_METRICS = (("alt", "altitude"), ("spd", "speed"), ("bat", "battery"))
+
+
+def _rollup_table(name, with_position):
+    cols = ["bucket INTEGER PRIMARY KEY", "n INTEGER NOT NULL", "ts_min REAL", "ts_max REAL"]
+    for short, _ in _METRICS:
+        cols += [f"{short}_n INTEGER NOT NULL DEFAULT 0", f"{short}_sum REAL",
+                 f"{short}_min NUMERIC", f"{short}_max NUMERIC"]
+    cols.append("low_bat INTEGER NOT NULL DEFAULT 0")
+    if with_position:
+        cols += ["lat REAL", "lon REAL"]   # position of the latest sample in the bucket
+    return f"CREATE TABLE IF NOT EXISTS {name} (\n    " + ",\n    ".join(cols) + "\n)"
+
+
+def _rollup_upsert(name, bucket_expr, with_position):
+    """INSERT .. ON CONFLICT statement folding row NEW into its bucket of `name`."""
+    cols = ["bucket", "n", "ts_min", "ts_max"]
+    vals = [bucket_expr, "1", "NEW.ts", "NEW.ts"]
+    sets = ["n = n + 1",
+            "ts_min = min(ts_min, excluded.ts_min)",
+            "ts_max = max(ts_max, excluded.ts_max)"]
+    for short, col in _METRICS:
+        num = _NUM.format(f"NEW.{col}")
+        value = f"CASE WHEN {num} THEN NEW.{col} END"
+        cols += [f"{short}_n", f"{short}_sum", f"{short}_min", f"{short}_max"]
+        vals += [f"({num})", value, value, value]
+        sets += [f"{short}_n = {short}_n + excluded.{short}_n",
+                 f"{short}_sum = coalesce({short}_sum + excluded.{short}_sum, {short}_sum, excluded.{short}_sum)",
+                 f"{short}_min = coalesce(min({short}_min, excluded.{short}_min), {short}_min, excluded.{short}_min)",
+                 f"{short}_max = coalesce(max({short}_max, excluded.{short}_max), {short}_max, excluded.{short}_max)"]
+    cols.append("low_bat")
+    vals.append(f"({_NUM.format('NEW.battery')} AND NEW.battery < {LOW_BATTERY_PCT})")
+    sets.append("low_bat = low_bat + excluded.low_bat")
+    if with_position:
+        cols += ["lat", "lon"]
+        vals += ["NEW.lat", "NEW.lon"]
+        sets += ["lat = CASE WHEN excluded.ts_max >= ts_max THEN excluded.lat ELSE lat END",
+                 "lon = CASE WHEN excluded.ts_max >= ts_max THEN excluded.lon ELSE lon END"]
+    return (f"INSERT INTO {name} ({', '.join(cols)})\n"
+            f"        VALUES ({', '.join(vals)})\n"
+            f"        ON CONFLICT(bucket) DO UPDATE SET {', '.join(sets)};")
+
+
+def _rollup_backfill(name, bucket_expr, with_position):
+    """Rebuild `name` from the raw rows already in the telemetry table."""
+    sel = ["bucket", "count(*)", "min(ts)", "max(ts)"]
+    inner = [f"{bucket_expr} AS bucket", "ts"]
+    for short, col in _METRICS:
+        inner.append(f"CASE WHEN {_NUM.format(col)} THEN {col} END AS {short}")
+        sel += [f"count({short})", f"sum({short})", f"min({short})", f"max({short})"]
+    sel.append(f"count(CASE WHEN bat < {LOW_BATTERY_PCT} THEN 1 END)")
+    cols = ["bucket", "n", "ts_min", "ts_max"]
+    for short, _ in _METRICS:
+        cols += [f"{short}_n", f"{short}_sum", f"{short}_min", f"{short}_max"]
+    cols.append("low_bat")
+    if with_position:
+        inner += ["lat", "lon", f"row_number() OVER (PARTITION BY {bucket_expr} ORDER BY ts DESC) AS rn"]
+        sel += ["max(CASE WHEN rn = 1 THEN lat END)", "max(CASE WHEN rn = 1 THEN lon END)"]
+        cols += ["lat", "lon"]
+    return (f"INSERT OR REPLACE INTO {name} ({', '.join(cols)})\n"
+            f"SELECT {', '.join(sel)}\n"
+            f"FROM (SELECT {', '.join(inner)} FROM telemetry WHERE {_NUM.format('ts')})\n"
+            f"GROUP BY bucket")
+
+
+ROLLUPS = (
+    # table, bucket expression over column ts, kept the latest position (until v6)
+    ("telemetry_rollup_1s", "CAST({ts} AS INTEGER)", True),
+    ("telemetry_rollup_1m", "(CAST({ts} AS INTEGER) / 60) * 60", False),
+)
+
+
+def _rollup_trigger(with_position=True, extra=()):
+    upserts = [_rollup_upsert(name, bucket.format(ts="NEW.ts"), pos and with_position)
+               for name, bucket, pos in ROLLUPS]
+    upserts += extra
+    return ("CREATE TRIGGER IF NOT EXISTS trg_telemetry_rollup AFTER INSERT ON telemetry\n"
+            f"    WHEN {_NUM.format('NEW.ts')}\n"
+            "    BEGIN\n        " + "\n        ".join(upserts) + "\n    END")
+
+
+def _rollup_migration():
+    statements = []
+    for name, bucket, pos in ROLLUPS:
+        statements.append(_rollup_table(name, pos))
+        statements.append(_rollup_backfill(name, bucket.format(ts="ts"), pos))
+    statements.append(_rollup_trigger())
+    return statements
+
+
+# --- flight paths: the latest position of each drone in each second ---
+# The fleet-wide latest position in telemetry_rollup_1s belonged to whichever
+# drone wrote last in that second, so paths are kept per drone instead.
+# drone_id is '' for rows from before fleets (NULL would never conflict).
+def _has_position(row=""):
+    return f"{_NUM.format(row + 'lat')} AND {_NUM.format(row + 'lon')}"
+
+
+def _path_upsert():
+    return ("INSERT INTO telemetry_path_1s (drone_id, bucket, ts, lat, lon)\n"
+            "        SELECT coalesce(NEW.drone_id, ''), CAST(NEW.ts AS INTEGER), NEW.ts, NEW.lat, NEW.lon\n"
+            f"        WHERE {_has_position('NEW.')}\n"
+            "        ON CONFLICT(drone_id, bucket) DO UPDATE SET ts = excluded.ts, lat = excluded.lat, lon = excluded.lon\n"
+            "        WHERE excluded.ts >= ts;")
+
+
+def _path_migration():
+    return [
+        """
+        CREATE TABLE IF NOT EXISTS telemetry_path_1s (
+            drone_id TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            ts REAL,
+            lat REAL,
+            lon REAL,
+            UNIQUE (drone_id, bucket)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_telemetry_path_1s_bucket ON telemetry_path_1s (bucket)",
+        f"""
+        INSERT OR REPLACE INTO telemetry_path_1s (drone_id, bucket, ts, lat, lon)
+        SELECT drone_id, bucket, ts, lat, lon FROM (
+            SELECT coalesce(drone_id, '') AS drone_id, CAST(ts AS INTEGER) AS bucket, ts, lat, lon,
+                   row_number() OVER (PARTITION BY coalesce(drone_id, ''), CAST(ts AS INTEGER)
+                                      ORDER BY ts DESC, rowid DESC) AS rn
+            FROM telemetry WHERE {_NUM.format('ts')} AND {_has_position()}
+        )
+        WHERE rn = 1
+        """,
+        # the 1s rollup stops tracking a position; its lat/lon columns stay as they were
+        "DROP TRIGGER IF EXISTS trg_telemetry_rollup",
+        _rollup_trigger(with_position=False, extra=[_path_upsert()]),
+    ]
+
+
+# MIGRATIONS[n] upgrades a database from version n to n + 1. Append only.
+MIGRATIONS = [
+    # 1: base table (identical to the pre-versioning CREATE TABLE)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS telemetry (
+            msg_id TEXT PRIMARY KEY,
+            ts REAL,
+            altitude INTEGER,
+            speed INTEGER,
+            battery INTEGER,
+            lat REAL,
+            lon REAL,
+            raw TEXT NOT NULL,
+            inserted_at REAL DEFAULT (strftime('%s','now'))
+        )
+        """,
+    ],
+    # 2: covering indexes for the read paths
+    #    - latest rows / history: ORDER BY inserted_at DESC [LIMIT n]
+    #    - time windows / stats / export: WHERE ts >= ?
+    [
+        """
+        CREATE INDEX IF NOT EXISTS idx_telemetry_inserted_at
+        ON telemetry (inserted_at, msg_id, ts, altitude, speed, battery, lat, lon)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_telemetry_ts
+        ON telemetry (ts, inserted_at, msg_id, altitude, speed, battery, lat, lon)
+        """,
+        "ANALYZE telemetry",
+    ],
+    # 3: per-second / per-minute rollups for /stats, backfilled from raw rows
+    _rollup_migration(),
+    # 4: fleet support — drone_id per row (NULL for rows from before fleets)
+    #    - one drone's window / latest row: WHERE drone_id = ? AND ts >= ?
+    #    - one drone's history: WHERE drone_id = ? ORDER BY inserted_at DESC
+    [
+        "ALTER TABLE telemetry ADD COLUMN drone_id TEXT",
+        """
+        CREATE INDEX IF NOT EXISTS idx_telemetry_drone_ts
+        ON telemetry (drone_id, ts, inserted_at, msg_id, altitude, speed, battery, lat, lon)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_telemetry_drone_inserted_at
+        ON telemetry (drone_id, inserted_at, msg_id)
+        """,
+        "ANALYZE telemetry",
+    ],
+    # 5: encoding of the raw column (see raw_codec.py); older rows hold JSON text
+    [
+        "ALTER TABLE telemetry ADD COLUMN raw_enc INTEGER NOT NULL DEFAULT 0",
+    ],
+    # 6: per-drone flight paths (telemetry_path_1s), backfilled from raw rows
+    _path_migration(),
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(con):
+    return con.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(con):
+    """Apply pending migrations in one transaction; returns the starting version."""
+    version = schema_version(con)
+    if version == SCHEMA_VERSION:
+        return version
+    # IMMEDIATE takes the write lock up front so concurrent starters serialise
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        version = schema_version(con)   # may have been upgraded while we waited
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(f"database schema v{version} is newer than this code (v{SCHEMA_VERSION})")
+        for statements in MIGRATIONS[version:]:
+            for sql in statements:
+                con.execute(sql)
+        con.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        con.commit()
+    except BaseException:
+        con.rollback()
+        raise
+    return version
+
+
+def init_db(db_file=DB_FILE):
+    """Open db_file, upgrade it to SCHEMA_VERSION and return the connection."""
+    con = sqlite3.connect(db_file, timeout=10)
+    # only takes effect before the first table exists; see compaction.py --convert
+    con.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    migrate(con)
+    return con
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else DB_FILE
+    con = sqlite3.connect(path, timeout=10)
+    before = migrate(con)
+    con.close()
+    if before == SCHEMA_VERSION:
+        print(f"{path}: schema already at v{SCHEMA_VERSION}")
+    else:
+        print(f"{path}: upgraded schema v{before} -> v{SCHEMA_VERSION}")
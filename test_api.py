@@ -10,3 +10,12 @@ recv = requests.post("http://127.0.0.1:5000/receive", json={"encrypted": encrypt
 recv.raise_for_status()
 decrypted = recv.json().get("decrypted")
 print("Decrypted:", decrypted)
+
+# Bulk endpoints: one round trip for many items, per-item results
+batch = requests.post("http://127.0.0.1:5000/send/batch", json=[{"seq": i} for i in range(5)])
+batch.raise_for_status()
+tokens = [r["encrypted"] for r in batch.json()["results"]] + ["not-a-token"]
+recv = requests.post("http://127.0.0.1:5000/receive/batch", json=tokens)
+recv.raise_for_status()
+body = recv.json()
+print(f"Batch: {body['ok']} decrypted, {body['errors']} errors")
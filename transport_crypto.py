@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# transport_crypto.py — datagram encryption: Fernet (compatible) or AEAD session keys
+#
+# Modes:
+#   fernet    the original Fernet token (AES-CBC + HMAC-SHA256, base64)
+#   aesgcm    AES-256-GCM on raw bytes
+#   chacha20  ChaCha20-Poly1305 on raw bytes
+#
+# AEAD datagrams:
+#   mode u8 | key_id u8 | id_len u8 | drone_id | nonce (12) | ciphertext + tag (16)
+# Everything before the ciphertext is authenticated as associated data. The
+# AEAD key is a per-drone session key, HKDF-SHA256(master[key_id], drone_id),
+# so drones never share a key and the receiver derives each one once.
+#
+# Master keys come from AIRLOCK_MASTER_KEYS="id:key,id:key" (urlsafe base64,
+# 32 bytes each); the first entry is the one senders use, the rest are still
+# accepted, which lets keys be rotated like MultiFernet. Without it, key id 1
+# is derived from FERNET_KEY. Fernet tokens start with 'g', which is never
+# an AEAD mode byte, so a receiver accepts both kinds of datagram.
+
+import base64
+import os
+import threading
+from collections import OrderedDict
+
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+DEFAULT_FERNET_KEY = b'HyMs5PCyDY5oWoEKZs98gwwU7ZKxSBrqifkQHVCHn-s='
+
+MODE_AESGCM = 0xA1
+MODE_CHACHA20 = 0xA2
+MODES = {"fernet": None, "aesgcm": MODE_AESGCM, "chacha20": MODE_CHACHA20}
+_AEAD_CLASSES = {MODE_AESGCM: AESGCM, MODE_CHACHA20: ChaCha20Poly1305}
+
+NONCE_BYTES = 12
+TAG_BYTES = 16
+MAX_SESSIONS = 4096          # cached (key_id, drone_id) session keys; least recently used go first
+HKDF_INFO = b"airlock-session-v1|"
+
+
+def fernet_token_size(n):
+    """Bytes of the Fernet token for an n-byte plaintext."""
+    raw = 1 + 8 + 16 + 16 * (n // 16 + 1) + 32   # version, time, IV, padded AES-CBC, HMAC
+    return 4 * ((raw + 2) // 3)                   # urlsafe base64 with padding
+
+
+def parse_master_keys(spec):
+    """{key_id: 32-byte key} from 'id:key,id:key'; first entry is primary."""
+    keys = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        kid, _, b64 = part.partition(":")
+        key = base64.urlsafe_b64decode(b64 + "=" * (-len(b64) % 4))
+        if not 0 <= int(kid) <= 255 or len(key) != 32:
+            raise ValueError(f"bad master key entry {kid!r}: need id 0-255 and a 32-byte key")
+        keys[int(kid)] = key
+    if not keys:
+        raise ValueError("no master keys given")
+    return keys
+
+
+def default_master_keys(fernet_key):
+    # Fernet keys are signing key || encryption key; derive rather than reuse either half
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"airlock-master-v1")
+    return {1: hkdf.derive(base64.urlsafe_b64decode(fernet_key))}
+
+
+class Transport:
+    """Seals plaintexts for one sender and opens datagrams from any sender."""
+
+    def __init__(self, mode="fernet", drone_id="drone-1", fernet_key=None, master_keys=None):
+        if mode not in MODES:
+            raise ValueError(f"unknown crypto mode {mode!r}; expected one of {', '.join(MODES)}")
+        fernet_key = fernet_key or os.environ.get("FERNET_KEY") or DEFAULT_FERNET_KEY
+        if master_keys is None:
+            spec = os.environ.get("AIRLOCK_MASTER_KEYS")
+            master_keys = parse_master_keys(spec) if spec else default_master_keys(fernet_key)
+        self.mode = mode
+        self.drone_id = drone_id.encode()
+        if len(self.drone_id) > 255:
+            raise ValueError("drone_id is longer than 255 bytes")
+        self.fernet = Fernet(fernet_key)
+        self.master_keys = dict(master_keys)
+        self.primary_key_id = next(iter(self.master_keys))
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _session(self, mode, key_id, drone_id):
+        key = (mode, key_id, drone_id)
+        with self._lock:
+            aead = self._sessions.get(key)
+            if aead is not None:
+                self._sessions.move_to_end(key)
+        if aead is None:
+            master = self.master_keys.get(key_id)
+            if master is None:
+                raise ValueError(f"unknown key id {key_id}")
+            hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=HKDF_INFO + drone_id)
+            aead = _AEAD_CLASSES[mode](hkdf.derive(master))
+            with self._lock:
+                self._sessions[key] = aead
+                while len(self._sessions) > MAX_SESSIONS:
+                    self._sessions.popitem(last=False)
+        return aead
+
+    def seal(self, plaintext):
+        """Encrypt plaintext bytes in this transport's mode."""
+        mode = MODES[self.mode]
+        if mode is None:
+            return self.fernet.encrypt(plaintext)
+        header = bytes((mode, self.primary_key_id, len(self.drone_id))) + self.drone_id
+        nonce = os.urandom(NONCE_BYTES)
+        aad = header + nonce
+        return aad + self._session(mode, self.primary_key_id, self.drone_id).encrypt(nonce, plaintext, aad)
+
+    def open(self, data):
+        """Plaintext of a Fernet token or AEAD datagram; raises on anything else."""
+        mode = data[0] if data else None
+        if mode not in _AEAD_CLASSES:
+            return self.fernet.decrypt(data)
+        if len(data) < 3:
+            raise ValueError("truncated AEAD datagram")
+        key_id, id_len = data[1], data[2]
+        body = 3 + id_len + NONCE_BYTES
+        if len(data) < body + TAG_BYTES:
+            raise ValueError("truncated AEAD datagram")
+        drone_id = data[3:3 + id_len]
+        aad = data[:body]
+        return self._session(mode, key_id, drone_id).decrypt(data[body - NONCE_BYTES:body], data[body:], aad)
+
+    @staticmethod
+    def sender_id(data):
+        """drone_id authenticated by an AEAD datagram's header; None for Fernet tokens."""
+        if not data or data[0] not in _AEAD_CLASSES or len(data) < 3:
+            return None
+        return data[3:3 + data[2]].decode(errors="replace")
+
+    def sealed_size(self, n):
+        """Datagram size for an n-byte plaintext in this transport's mode."""
+        if MODES[self.mode] is None:
+            return fernet_token_size(n)
+        return 3 + len(self.drone_id) + NONCE_BYTES + n + TAG_BYTES
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# wire_format.py — telemetry plaintext formats carried inside the encrypted datagram
+#
+# The first plaintext byte selects the format:
+#   '{'   JSON object (the original format, still accepted and used as fallback)
+#   0x01  v1 binary record, struct-packed core fields (53 bytes vs ~150 of JSON):
+#           version u8 | msg_id 16 raw bytes | ts f64 | altitude f32 | speed f32
+#           | battery f32 | lat f64 | lon f64          (little-endian)
+#         NaN marks a null numeric field. pack() only emits a record that
+#         unpack() turns back into the same dict; anything else (a missing
+#         key, a value f32 cannot hold exactly, ...) is sent as JSON.
+#   0x02  frame of several records (each a v1/v3 record or JSON object):
+#           version u8 | count u16 | count x (length u16 | record bytes)
+#   0x03  v1 record followed by the sender's drone_id:
+#           <v1 fields> | id_len u8 | drone_id (UTF-8)
+# Version bytes are control characters (below 0x20), which never start JSON
+# text, except tab, LF and CR: JSON may open with whitespace, so those three
+# are never versions and such plaintexts are parsed as JSON. The other
+# control characters are reserved for future versions.
+
+import json
+import math
+import struct
+
+WIRE_V1 = 0x01
+WIRE_FRAME = 0x02
+WIRE_V3 = 0x03
+SUPPORTED_VERSIONS = (WIRE_V1, WIRE_FRAME, WIRE_V3)
+_VERSION_BYTES = frozenset(range(0x20)) - {0x09, 0x0A, 0x0D}   # supported + reserved
+RECORD_V1 = struct.Struct("<B16sdfffdd")
+FRAME_HEADER = struct.Struct("<BH")
+FRAME_ENTRY = struct.Struct("<H")
+MAX_FRAME_RECORDS = 0xFFFF
+
+FORMATS = ("binary", "json")
+_CORE_KEYS = {"msg_id", "drone_id", "ts", "altitude", "speed", "battery", "location"}
+_NAN = float("nan")
+
+
+def wire_version(plain):
+    """Binary version byte of a plaintext, or None for JSON/text."""
+    if plain and plain[0] in _VERSION_BYTES:
+        return plain[0]
+    return None
+
+
+def _opt(value):
+    if value is None:
+        return _NAN
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"non-numeric field {value!r}")
+    return float(value)
+
+
+def _small(value):
+    # f32 fields: restore ints and drop float32 noise (120.0 -> 120, 87.3 stays 87.3)
+    if math.isnan(value):
+        return None
+    if value.is_integer():
+        return int(value)
+    return float(f"{value:.7g}")
+
+
+def _big(value):
+    return None if math.isnan(value) else value
+
+
+def pack(t):
+    """v1 (or v3, with drone_id) record for telemetry dict t; ValueError if t does not fit.
+
+    t fits when unpack() of the record returns t unchanged, so f32 rounding,
+    out-of-range numbers and absent keys all raise instead of being altered.
+    """
+    if set(t) - _CORE_KEYS:
+        raise ValueError(f"fields not in the binary format: {sorted(set(t) - _CORE_KEYS)}")
+    msg_id = t.get("msg_id")
+    if not isinstance(msg_id, str) or len(msg_id) != 32:
+        raise ValueError("msg_id must be 32 lowercase hex characters")
+    loc = t.get("location") or {}
+    if not isinstance(loc, dict) or set(loc) - {"lat", "lon"}:
+        raise ValueError("location has fields not in the binary format")
+    try:
+        raw_id = bytes.fromhex(msg_id)
+    except ValueError:
+        raw_id = None
+    if raw_id is None or raw_id.hex() != msg_id:
+        raise ValueError("msg_id must be 32 lowercase hex characters")
+    if t.get("ts") is None:
+        raise ValueError("ts is required")
+    drone_id = t.get("drone_id")
+    if drone_id is not None:
+        if not isinstance(drone_id, str):
+            raise ValueError("drone_id must be a string")
+        drone_id = drone_id.encode()
+        if len(drone_id) > 255:
+            raise ValueError("drone_id is longer than 255 bytes")
+    try:
+        record = RECORD_V1.pack(WIRE_V1 if drone_id is None else WIRE_V3, raw_id, _opt(t["ts"]),
+                                _opt(t.get("altitude")), _opt(t.get("speed")), _opt(t.get("battery")),
+                                _opt(loc.get("lat")), _opt(loc.get("lon")))
+    except (struct.error, OverflowError) as e:
+        raise ValueError(f"value out of range for the binary format: {e}")
+    if drone_id is not None:
+        record += bytes((len(drone_id),)) + drone_id
+    if unpack(record) != t:
+        raise ValueError("record does not round-trip through the binary format")
+    return record
+
+
+def unpack(plain):
+    """Telemetry dict (same shape as the JSON format) from a binary plaintext."""
+    version = wire_version(plain)
+    if version == WIRE_V1:
+        if len(plain) != RECORD_V1.size:
+            raise ValueError(f"bad v1 record length {len(plain)}")
+        drone_id = None
+    elif version == WIRE_V3:
+        size = RECORD_V1.size
+        if len(plain) < size + 1 or len(plain) != size + 1 + plain[size]:
+            raise ValueError(f"bad v3 record length {len(plain)}")
+        try:
+            drone_id = plain[size + 1:].decode()
+        except UnicodeDecodeError:
+            raise ValueError("drone_id is not UTF-8")
+    else:
+        raise ValueError(f"unsupported wire version {version!r}")
+    _, raw_id, ts, alt, spd, bat, lat, lon = RECORD_V1.unpack_from(plain)
+    t = {
+        "msg_id": raw_id.hex(),
+        "ts": _big(ts),
+        "altitude": _small(alt),
+        "speed": _small(spd),
+        "battery": _small(bat),
+        "location": {"lat": _big(lat), "lon": _big(lon)},
+    }
+    if drone_id is not None:
+        t["drone_id"] = drone_id
+    return t
+
+
+def encode(t, fmt="binary"):
+    """Plaintext bytes for t: the binary record when fmt='binary' and t fits, else JSON."""
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown wire format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    if fmt == "binary":
+        try:
+            return pack(t)
+        except ValueError:
+            pass
+    return json.dumps(t).encode()
+
+
+def frame_size(record_sizes):
+    """Plaintext size of a frame holding records of the given sizes."""
+    return FRAME_HEADER.size + sum(FRAME_ENTRY.size + n for n in record_sizes)
+
+
+def pack_frame(records):
+    """Frame plaintext carrying several encode()d records."""
+    if not 0 < len(records) <= MAX_FRAME_RECORDS:
+        raise ValueError(f"a frame holds 1..{MAX_FRAME_RECORDS} records, got {len(records)}")
+    parts = [FRAME_HEADER.pack(WIRE_FRAME, len(records))]
+    for rec in records:
+        if wire_version(rec) == WIRE_FRAME:
+            raise ValueError("frames cannot be nested")
+        parts.append(FRAME_ENTRY.pack(len(rec)))
+        parts.append(rec)
+    return b"".join(parts)
+
+
+def unpack_frame(plain):
+    """Record plaintexts from a frame; ValueError if it is truncated or malformed."""
+    if wire_version(plain) != WIRE_FRAME or len(plain) < FRAME_HEADER.size:
+        raise ValueError("not a frame")
+    _, count = FRAME_HEADER.unpack_from(plain, 0)
+    off = FRAME_HEADER.size
+    records = []
+    for _ in range(count):
+        if off + FRAME_ENTRY.size > len(plain):
+            raise ValueError("truncated frame")
+        (n,) = FRAME_ENTRY.unpack_from(plain, off)
+        off += FRAME_ENTRY.size
+        if off + n > len(plain):
+            raise ValueError("truncated frame")
+        records.append(plain[off:off + n])
+        off += n
+    if off != len(plain):
+        raise ValueError("trailing bytes after frame")
+    return records